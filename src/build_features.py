@@ -0,0 +1,121 @@
+"""
+build_features.py - thickener_features.parquet without running the feature notebook.
+
+Computes the feature set of notebooks/02_feature_engineering.ipynb with tws.features
+(one compiled plan written into a preallocated float32 matrix) from the simulator
+timeseries:
+
+    data/processed/thickener_timeseries.parquet  ->  data/processed/thickener_features.parquet
+
+Same rows (warmup dropped), columns (timestamp, FEATURES_ALL, TARGET_COLS) and
+cleanup as the notebook; features are stored as float32 (--float64 keeps the
+notebook's dtype; values equal up to pandas' rolling-variance rounding: the rstd
+columns differ from rolling().std() by up to 3.5e-5 relative, the kernel being the
+closer one to an exact np.std). The columns are checked against FEATURES_ALL in
+data/processed/feature_catalogs.json; the catalogs themselves (mutual-information
+rankings) still come from the notebook.
+
+--catalog NAME materializes only the columns of one catalog list (e.g.
+FEATURES_TOP30_PROD for scoring): names are parsed into their tags and operators
+(tws.features.plan_for), only those tags are read and only those windows computed.
+Values equal the same columns of the full file.
+
+--workers N splits the rows into N time blocks, each with a left halo of the longest
+window / lag (aligned to the rolling-sum block), computed in a process pool and
+stitched back; the result equals the single-process one value for value (with
+--benchmark the serial run is repeated and compared). Workers are capped at the CPU
+count, and one CPU or fewer than two blocks of PARALLEL_MIN_ROWS run serially.
+
+Run:
+  python src/build_features.py --benchmark
+  python src/build_features.py --catalog FEATURES_TOP30_PROD --benchmark
+  python src/build_features.py --workers 8 --benchmark
+  python src/build_features.py --input data/processed/highres/thickener_timeseries_5min.parquet --out /tmp/feat.parquet
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from simulate_highres import peak_rss_mib
+from tws.features import TARGET_COLS, TIME_COLUMN, WARMUP, build_feature_frame, materialize, plan_for
+from tws.schema import read_timeseries
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Feature matrix of the feature notebook from the simulator timeseries")
+    ap.add_argument("--input", type=Path, default=Path("data/processed/thickener_timeseries.parquet"))
+    ap.add_argument("--out", type=Path, default=None,
+                    help="default: data/processed/thickener_features[_<catalog>].parquet")
+    ap.add_argument("--catalogs", type=Path, default=Path("data/processed/feature_catalogs.json"))
+    ap.add_argument("--catalog", default=None, metavar="NAME",
+                    help="only the features of this catalog list (e.g. FEATURES_TOP30_PROD)")
+    ap.add_argument("--warmup", type=int, default=WARMUP, help="leading rows dropped (rows, as the notebook's WARMUP)")
+    ap.add_argument("--float64", action="store_true", help="store features as float64 (notebook dtype)")
+    ap.add_argument("--workers", type=int, default=1, help="processes computing time blocks (1: serial; serial anyway on one CPU or a short series)")
+    ap.add_argument("--benchmark", action="store_true",
+                    help="report feature time and peak memory (and, with --workers, check against serial)")
+    args = ap.parse_args()
+    dtype = np.float64 if args.float64 else np.float32
+    catalogs = json.loads(args.catalogs.read_text(encoding="utf-8")) if args.catalogs.exists() else None
+
+    if args.catalog:
+        if catalogs is None or args.catalog not in catalogs:
+            raise SystemExit(f"No catalog {args.catalog!r} in {args.catalogs}")
+        names = catalogs[args.catalog]
+        columns = [TIME_COLUMN, *plan_for(names).inputs(), *TARGET_COLS]
+        ts = read_timeseries(args.input, columns=list(dict.fromkeys(columns)))
+
+        def build(workers: int) -> pd.DataFrame:
+            feat = materialize(ts, names, args.warmup, dtype, workers=workers)
+            feat.insert(0, TIME_COLUMN, ts[TIME_COLUMN].to_numpy()[args.warmup:])
+            for col in TARGET_COLS:
+                feat[col] = ts[col].to_numpy()[args.warmup:]
+            return feat
+    else:
+        ts = read_timeseries(args.input)
+
+        def build(workers: int) -> pd.DataFrame:
+            return build_feature_frame(ts, warmup=args.warmup, dtype=dtype, workers=workers)
+
+    t0 = time.perf_counter()
+    feat = build(args.workers)
+    elapsed = time.perf_counter() - t0
+    n_features = feat.shape[1] - 1 - len(TARGET_COLS)
+    mode = f" on {args.workers} workers" if args.workers > 1 else ""
+    print(f"Features: {len(feat):,} rows x {n_features} features from {ts.shape[1]} columns in {elapsed:.2f}s{mode}")
+    if args.benchmark:
+        peak = peak_rss_mib()
+        print(f"Peak RSS: {'n/a' if peak is None else f'{peak:.0f} MiB'} (timeseries included)")
+        if args.workers > 1:
+            t0 = time.perf_counter()
+            serial = build(1)
+            t_serial = time.perf_counter() - t0
+            same = serial.equals(feat)
+            print(f"Serial: {t_serial:.2f}s (speedup {t_serial / elapsed:.1f}x), "
+                  f"{'identical' if same else 'DIFFERENT'} to the {args.workers}-worker result")
+            if not same:
+                raise SystemExit(1)
+
+    if catalogs is not None and not args.catalog:
+        catalog = catalogs["FEATURES_ALL"]
+        names = list(feat.columns[1:1 + n_features])
+        if names != catalog:
+            extra, missing = sorted(set(names) - set(catalog)), sorted(set(catalog) - set(names))
+            print(f"WARNING: columns differ from FEATURES_ALL in {args.catalogs} (extra: {extra}, missing: {missing})")
+
+    suffix = "_" + args.catalog.lower().removeprefix("features_") if args.catalog else ""
+    out = args.out or Path(f"data/processed/thickener_features{suffix}.parquet")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    feat.to_parquet(out, index=False)
+    print("Wrote:", out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+calibrate_sim.py - search SimConfig fields until the quick_checks KPI targets are met.
+
+Replaces the hand-tuning sessions of the bitacora (deadband 0.33 -> 0.30 -> 0.315 ...,
+each followed by a quick_checks run). Candidates are sampled over a box of SimConfig
+fields (Latin hypercube, plus the base config itself) and scored against
+quick_checks.KPI_TARGETS by successive halving:
+
+    rung 0: every candidate on a short horizon (default 30 days)
+    rung 1: the best 1/3 on a longer one ...
+    last:   the survivors on the full cfg.days horizon
+
+Every rung runs in a process pool. A candidate's loss is the summed distance of its
+KPIs outside their target bands (in band widths), so 0 means all targets are met;
+ties are broken by the distance to the band centres. With a stage cache (--cache),
+candidates reuse the feed / latent / ph_floc / uf_bed stages of the same seed and
+horizon (and, when they only move turbidity fields, the operator stage too).
+
+Parameters are SimConfig field names; stress weights are addressed per component as
+stress_weights.<fines|load|var|uf|floc> and rescaled to sum 1 (stress stays in [0, 1]).
+
+    data/processed/calibration/trials.csv   (one row per candidate x rung: params, KPIs, loss)
+    data/processed/calibration/best.json    (SimConfig overrides of the selected candidate)
+
+Run:
+  python src/calibrate_sim.py --candidates 64 --workers 8
+  python src/calibrate_sim.py --param deadband=0.25:0.35 --param qu_setpoint_step=8:16 --seeds 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from quick_checks import KPI_TARGETS, dataset_kpis, kpis_ok
+from simulate_fixed import STRESS_COMPONENTS, SimConfig, simulate_clean
+
+# Default search box: the turbidity-shape knobs tuned by hand in the bitacora, plus the
+# operator's mode-switching rates (the only knobs that move manual_rate).
+DEFAULT_SPACE: Dict[str, Tuple[float, float]] = {
+    "manual_enter_gain": (0.06, 0.12),
+    "manual_exit_base": (0.03, 0.06),
+    "deadband": (0.20, 0.36),
+    "turb_power": (1.2, 2.0),
+    "stress_weights.fines": (0.12, 0.32),
+    "stress_weights.load": (0.14, 0.34),
+    "stress_weights.var": (0.05, 0.20),
+    "stress_weights.uf": (0.20, 0.40),
+    "stress_weights.floc": (0.05, 0.15),
+}
+
+
+def candidate_config(base: SimConfig, point: Dict[str, float]) -> SimConfig:
+    """base with the overrides in `point` (stress_weights.<component> rescaled to sum 1)."""
+    overrides: dict = {}
+    weights = list(base.stress_weights)
+    for name, value in point.items():
+        if name.startswith("stress_weights."):
+            weights[STRESS_COMPONENTS.index(name.split(".", 1)[1])] = float(value)
+        else:
+            overrides[name] = type(getattr(base, name))(value)
+    if any(name.startswith("stress_weights.") for name in point):
+        total = sum(weights)
+        overrides["stress_weights"] = tuple(round(w / total, 6) for w in weights)
+    return replace(base, **overrides)
+
+
+def latin_hypercube(space: Dict[str, Tuple[float, float]], n: int, seed: int = 0) -> List[Dict[str, float]]:
+    """n points stratified along every dimension of the box (one point per 1/n slice)."""
+    rng = np.random.default_rng(seed)
+    d = len(space)
+    strata = np.stack([rng.permutation(n) for _ in range(d)], axis=1)
+    u = (strata + rng.random((n, d))) / n
+    lo = np.array([b[0] for b in space.values()])
+    hi = np.array([b[1] for b in space.values()])
+    return [dict(zip(space, map(float, row))) for row in lo + u * (hi - lo)]
+
+
+def base_point(base: SimConfig, space: Dict[str, Tuple[float, float]]) -> Dict[str, float]:
+    """The base config's own values for the searched fields."""
+    point = {}
+    for name in space:
+        if name.startswith("stress_weights."):
+            point[name] = float(base.stress_weights[STRESS_COMPONENTS.index(name.split(".", 1)[1])])
+        else:
+            point[name] = float(getattr(base, name))
+    return point
+
+
+def kpi_loss(kpis: dict, targets: dict = KPI_TARGETS) -> Tuple[float, float]:
+    """(summed distance outside the target bands, summed distance to the band centres), in band widths."""
+    outside = centre = 0.0
+    for name, (lo, hi) in targets.items():
+        v, width = kpis[name], hi - lo
+        outside += max(lo - v, 0.0, v - hi) / width
+        centre += abs(v - (lo + hi) / 2) / width
+    return outside, centre
+
+
+def evaluate(cfg: SimConfig, cache_dir: Optional[str] = None) -> dict:
+    """quick_checks KPIs of one simulated run (clean frame; failures do not touch them)."""
+    df, _ = simulate_clean(cfg, cache_dir=Path(cache_dir) if cache_dir else None)
+    return dataset_kpis(df)
+
+
+def rung_days(days: int, rungs: int, min_days: int) -> List[int]:
+    """Horizons of the successive-halving rungs: geometric from min_days up to days."""
+    if rungs <= 1 or min_days >= days:
+        return [days]
+    ratio = (days / min_days) ** (1.0 / (rungs - 1))
+    return sorted({int(round(min_days * ratio ** r)) for r in range(rungs - 1)} | {days})
+
+
+def calibrate(
+    base: SimConfig,
+    space: Dict[str, Tuple[float, float]] = DEFAULT_SPACE,
+    n_candidates: int = 64,
+    seeds: Sequence[int] = (),
+    rungs: int = 2,
+    min_days: int = 30,
+    keep: float = 1 / 3,
+    targets: dict = KPI_TARGETS,
+    max_workers: Optional[int] = None,
+    cache_dir: Optional[Path] = None,
+    sample_seed: int = 0,
+) -> Tuple[SimConfig, pd.DataFrame]:
+    """
+    Successive-halving search over `space`; returns (best config, trials table).
+
+    KPIs are averaged over `seeds` (default: base.seed). After every rung but the last
+    the best ceil(keep * n) candidates move on to the next, longer horizon; the best
+    candidate of the last rung (full base.days horizon) is returned.
+    """
+    seeds = list(seeds) or [base.seed]
+    points = [base_point(base, space)] + latin_hypercube(space, n_candidates - 1, sample_seed)
+    alive = list(range(len(points)))
+    cache = str(cache_dir) if cache_dir else None
+
+    trials = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for rung, days in enumerate(rung_days(base.days, rungs, min_days)):
+            t0 = time.perf_counter()
+            jobs = {
+                (c, seed): pool.submit(evaluate, replace(candidate_config(base, points[c]), days=days, seed=seed), cache)
+                for c in alive for seed in seeds
+            }
+            scored = []
+            for c in alive:
+                runs = [jobs[c, seed].result() for seed in seeds]
+                kpis = {name: float(np.mean([k[name] for k in runs])) for name in runs[0]}
+                loss, centre = kpi_loss(kpis, targets)
+                ok = kpis_ok(kpis, targets)
+                trials.append({"rung": rung, "days": days, "candidate": c, **points[c], **kpis,
+                               "loss": loss, "centre": centre, "ok": all(ok.values())})
+                scored.append((loss, centre, c))
+            scored.sort()
+            n_ok = sum(loss == 0.0 for loss, _, _ in scored)
+            print(f"  rung {rung}: {len(alive)} candidates x {len(seeds)} seeds @ {days} d "
+                  f"in {time.perf_counter() - t0:.1f}s | meeting targets: {n_ok} | best loss {scored[0][0]:.3f}")
+            alive = [c for _, _, c in scored[:max(1, math.ceil(keep * len(scored)))]]
+
+    best = scored[0][2]
+    return candidate_config(base, points[best]), pd.DataFrame(trials)
+
+
+def _parse_param(text: str) -> Tuple[str, Tuple[float, float]]:
+    # "deadband=0.25:0.35" -> ("deadband", (0.25, 0.35))
+    name, bounds = text.split("=", 1)
+    name = name.strip()
+    field = name.split(".", 1)[0]
+    if field not in SimConfig.__dataclass_fields__:
+        raise ValueError(f"Unknown SimConfig field: {field}")
+    if field == "stress_weights" and name.split(".", 1)[-1] not in STRESS_COMPONENTS:
+        raise ValueError(f"stress weights are addressed as stress_weights.<{'|'.join(STRESS_COMPONENTS)}>")
+    lo, hi = (float(v) for v in bounds.split(":"))
+    return name, (lo, hi)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Calibrate SimConfig against the quick_checks KPI targets")
+    ap.add_argument("--param", action="append", default=None,
+                    help="searched field and bounds, e.g. deadband=0.25:0.35 or stress_weights.uf=0.2:0.4 "
+                         "(repeatable; default: deadband, turb_power and the stress weights)")
+    ap.add_argument("--candidates", type=int, default=64)
+    ap.add_argument("--seeds", type=int, default=1, help="average KPIs over seeds seed, seed+1, ...")
+    ap.add_argument("--seed", type=int, default=SimConfig.seed)
+    ap.add_argument("--rungs", type=int, default=2)
+    ap.add_argument("--min-days", type=int, default=30, help="horizon of the first (pruning) rung")
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--out", type=Path, default=Path("data/processed/calibration"))
+    ap.add_argument("--cache", type=Path, default=None, metavar="DIR", help="shared stage cache (see tws.cache)")
+    args = ap.parse_args()
+
+    space = dict(_parse_param(p) for p in args.param) if args.param else DEFAULT_SPACE
+    base = replace(SimConfig(), seed=args.seed)
+    seeds = range(args.seed, args.seed + args.seeds)
+
+    print(f"Calibrating {', '.join(space)}: {args.candidates} candidates on {args.workers} workers")
+    t0 = time.perf_counter()
+    best, trials = calibrate(base, space, args.candidates, seeds, args.rungs, args.min_days,
+                             max_workers=args.workers, cache_dir=args.cache)
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    trials.to_csv(args.out / "trials.csv", index=False)
+    overrides = {name: getattr(best, name) for name in {p.split(".", 1)[0] for p in space}}
+    final = trials[trials["rung"] == trials["rung"].max()].sort_values(["loss", "centre"]).iloc[0]
+    (args.out / "best.json").write_text(json.dumps(
+        {"overrides": overrides, "kpis": {k: float(final[k]) for k in KPI_TARGETS}, "ok": bool(final["ok"])},
+        indent=2,
+    ))
+
+    print(f"\nBest ({'all targets met' if final['ok'] else 'targets NOT met'}) in {time.perf_counter() - t0:.1f}s:")
+    print("  SimConfig overrides:", overrides)
+    for name, (lo, hi) in KPI_TARGETS.items():
+        print(f"  {name:<14} {final[name]:.2%}  (target {lo:.0%}–{hi:.0%})")
+    print("Wrote:", args.out / "trials.csv", "and", args.out / "best.json")
+
+
+if __name__ == "__main__":
+    main()
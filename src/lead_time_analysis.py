@@ -23,6 +23,9 @@ sys.stdout.reconfigure(encoding="utf-8")
 import numpy as np
 import pandas as pd
 
+from tws.labels import find_episodes
+from tws.schema import read_timeseries
+
 # ── Rutas ─────────────────────────────────────────────────────────────────────
 ROOT = pathlib.Path(__file__).resolve().parent.parent
 DATA = ROOT / "data" / "processed"
@@ -30,7 +33,7 @@ DATA = ROOT / "data" / "processed"
 ts_path = DATA / "thickener_timeseries.parquet"
 feat_path = DATA / "thickener_features.parquet"
 
-ts = pd.read_parquet(ts_path)
+ts = read_timeseries(ts_path)
 feat = pd.read_parquet(feat_path)
 
 FREQ_MIN = 5          # minutos por punto
@@ -48,20 +51,8 @@ print()
 
 def find_crisis_episodes(series, min_points=4):
     """Retorna lista de (idx_start, idx_end) de cada episodio."""
-    episodes = []
-    in_ep = False
-    start = None
-    for i, v in enumerate(series):
-        if v == 1 and not in_ep:
-            in_ep = True
-            start = i
-        elif v == 0 and in_ep:
-            if i - start >= min_points:
-                episodes.append((start, i - 1))
-            in_ep = False
-    if in_ep and len(series) - start >= min_points:
-        episodes.append((start, len(series) - 1))
-    return episodes
+    starts, ends, _ = find_episodes(np.asarray(series), min_points=min_points)
+    return list(zip(starts.tolist(), ends.tolist()))
 
 episodes = find_crisis_episodes(ts["event_now"].values)
 print(f"  Episodios de crisis encontrados: {len(episodes)}")
@@ -0,0 +1,97 @@
+"""
+online_parity.py - replay the timeseries through tws.online and check it against the batch features.
+
+Feeds data/processed/thickener_timeseries.parquet one row at a time to
+OnlineFeatures (FEATURES_PROD by default, as live scoring would) and compares every
+output row with data/processed/thickener_features.parquet:
+
+- rows: from WARMUP on (the batch file's rows), starting where every online feature
+  has had a valid value (before that the batch file back-fills from the future);
+- tolerance: |online - batch| <= --rtol * max(1, |batch|); the batch file stores
+  float32, so 1e-6 leaves ~16x float32 rounding;
+- pH_off_spec: online gets the series median as its pH gap fill, as the batch does.
+
+Prints per-tick latency (median / p99 of update()) and the worst features; exits 1
+when any feature is out of tolerance.
+
+Run:
+  python src/online_parity.py
+  python src/online_parity.py --catalog FEATURES_TOP30_PROD --rtol 1e-7
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from tws.features import TIME_COLUMN, WARMUP
+from tws.online import OnlineFeatures
+from tws.schema import read_timeseries
+
+
+def check_parity(
+    ts: pd.DataFrame, feat: pd.DataFrame, names: Sequence[str], medians: Optional[Mapping[str, float]] = None,
+    warmup: int = WARMUP,
+) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Replay ts through OnlineFeatures(names); returns (per-feature table of the max
+    relative error vs feat and its row, update() latencies in seconds).
+    """
+    state = OnlineFeatures(names, medians)
+    records = ts[[TIME_COLUMN, *state.plan.inputs()]].to_dict("records")
+    online = np.empty((len(records), len(names)))
+    latency = np.empty(len(records))
+    for i, rec in enumerate(records):
+        t0 = time.perf_counter()
+        online[i] = state.update(rec)
+        latency[i] = time.perf_counter() - t0
+
+    a = online[warmup:]
+    b = feat[list(names)].to_numpy(dtype=float)
+    first = int(np.argmax(np.isfinite(a).all(axis=1)))
+    a, b = a[first:], b[first:]
+    both = np.isfinite(a) & np.isfinite(b)
+    err = np.where(both, np.abs(a - b) / np.maximum(1.0, np.abs(np.where(both, b, 0.0))), 0.0)
+    err[np.isfinite(a) != np.isfinite(b)] = np.inf
+    table = pd.DataFrame({
+        "feature": list(names),
+        "max_rel_err": err.max(axis=0),
+        "row": warmup + first + err.argmax(axis=0),
+    })
+    return table.sort_values("max_rel_err", ascending=False, ignore_index=True), latency
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Online (tick-by-tick) features vs the batch feature file")
+    ap.add_argument("--timeseries", type=Path, default=Path("data/processed/thickener_timeseries.parquet"))
+    ap.add_argument("--features", type=Path, default=Path("data/processed/thickener_features.parquet"))
+    ap.add_argument("--catalogs", type=Path, default=Path("data/processed/feature_catalogs.json"))
+    ap.add_argument("--catalog", default="FEATURES_PROD", help="catalog list to compute online")
+    ap.add_argument("--rtol", type=float, default=1e-6)
+    args = ap.parse_args()
+
+    names = json.loads(args.catalogs.read_text(encoding="utf-8"))[args.catalog]
+    ts = read_timeseries(args.timeseries)
+    feat = pd.read_parquet(args.features, columns=list(names))
+    medians = {"pH_feed": float(ts["pH_feed"].median())}
+
+    table, latency = check_parity(ts, feat, names, medians)
+    p50, p99 = np.percentile(latency, [50, 99]) * 1e6
+    print(f"{args.catalog}: {len(names)} features, {len(ts):,} ticks, update() {p50:.0f} us median / {p99:.0f} us p99")
+    print(table.head(10).to_string(index=False, float_format="%.2e"))
+    bad = table[table["max_rel_err"] > args.rtol]
+    if len(bad):
+        print(f"FAIL: {len(bad)} features above rtol {args.rtol:g}: {bad['feature'].tolist()}")
+        sys.exit(1)
+    print(f"OK: all features within rtol {args.rtol:g}")
+
+
+if __name__ == "__main__":
+    main()
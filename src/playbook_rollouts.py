@@ -0,0 +1,228 @@
+"""
+playbook_rollouts.py - rank operator playbook policies by short forward rollouts.
+
+The playbook (simulate_fixed.PLAYBOOK_RULES) maps the plant state to one hardcoded
+RecommendedAction. Here candidate parameterizations of those actions are compared
+instead: at a decision point t the simulator is branched (simulate_branches) into
+policy x scenario futures. Every policy is applied at t and rolled forward
+`horizon_min` minutes under the same S noise scenarios (common random numbers, so
+policy differences are not drowned by scenario noise). Batches of branches run as
+one (K, m) engine per worker process; only per-rollout metrics travel back.
+
+Policies are ranked by expected crisis minutes (event_now) and, among equals, by
+mean WaterRecovery_proxy; `pareto` marks the policies no other policy beats on both.
+
+    data/processed/rollouts/checkpoints/          (baseline run, see simulate_fixed --checkpoints)
+    data/processed/rollouts/policy_ranking.csv    (one row per decision point x policy)
+
+Run:
+  python src/playbook_rollouts.py --n-points 3 --scenarios 200 --workers 8
+  python src/playbook_rollouts.py --at 13302 --horizon-min 360
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from simulate_fixed import (
+    SimConfig, SimPlan, horizon_rows, make_plan, min_chunk_rows, minutes_to_rows, simulate_branches,
+    simulate_clean, step_seconds,
+)
+from tws.labels import find_episodes
+
+METRICS = ("crisis_min", "water_recovery", "peak_turb_NTU")
+
+
+@dataclass(frozen=True)
+class Policy:
+    """One candidate action taken at the decision point (both levers optional)."""
+
+    name: str
+    action: str                             # PLAYBOOK_RULES action it parameterizes
+    uf_offset: float = 0.0                  # extra Qu setpoint (m3/h)
+    uf_minutes: int = 0
+    dilution_factor: Optional[float] = None
+    dilution_minutes: int = 0
+
+    def apply(self, plan: SimPlan, row: int, cfg: SimConfig) -> SimPlan:
+        """plan with this policy's actions starting at `row`."""
+        def end(minutes: int) -> int:
+            return min(plan.n, row + minutes_to_rows(cfg, minutes))
+
+        uf_actions, dilution = plan.uf_actions, plan.dilution
+        if self.uf_offset:
+            uf_actions = uf_actions + ((row, end(self.uf_minutes), float(self.uf_offset)),)
+        if self.dilution_factor is not None:
+            # appended last, so it overrides a recorded event over the same rows
+            dilution = dilution + ((row, end(self.dilution_minutes), float(self.dilution_factor)),)
+        return replace(plan, uf_actions=uf_actions, dilution=dilution)
+
+
+def playbook_policies(cfg: SimConfig) -> List[Policy]:
+    """
+    Candidate grid around the playbook actions: do nothing; raise Qu by 1-3 setpoint
+    steps for 1 or 2 h (INCREASE_UF_WATCH_CARRYOVER); feed dilution at the low / mid /
+    high end of the configured factor range for the shortest and a mid duration
+    (START_DILUTION_AND_OPTIMIZE_FLOC; flocculant dose is not a simulator input);
+    a half step (MONITOR_AND_TUNE); UF and dilution together.
+    """
+    step = cfg.qu_setpoint_step
+    f_lo, f_hi = cfg.feed_dilution_factor_range
+    f_mid = round((f_lo + f_hi) / 2, 3)
+    d_lo, d_hi = cfg.feed_dilution_duration_min
+    d_mid = (d_lo + d_hi) // 2
+
+    policies = [Policy("none", "NONE")]
+    policies += [
+        Policy(f"uf+{k}x{step:g}_{minutes}m", "INCREASE_UF_WATCH_CARRYOVER", k * step, minutes)
+        for k in (1, 2, 3) for minutes in (60, 120)
+    ]
+    policies += [
+        Policy(f"dilution_{factor:g}_{minutes}m", "START_DILUTION_AND_OPTIMIZE_FLOC",
+               dilution_factor=factor, dilution_minutes=minutes)
+        for factor in (f_lo, f_mid, f_hi) for minutes in (d_lo, d_mid)
+    ]
+    policies.append(Policy(f"tune+{step / 2:g}_60m", "MONITOR_AND_TUNE", step / 2, 60))
+    policies.append(Policy(f"uf+{step:g}_dilution_{f_mid:g}_{d_mid}m", "INCREASE_UF+DILUTION",
+                           step, d_mid, f_mid, d_mid))
+    return policies
+
+
+def decision_points(df: pd.DataFrame, cfg: SimConfig, n: int) -> List[int]:
+    """Rows horizon_points before the onset of the first n crisis episodes (event_now)."""
+    lead = horizon_rows(cfg)
+    starts, _, _ = find_episodes(df["event_now"].to_numpy())
+    return [int(s - lead) for s in starts if s - lead >= min_chunk_rows(cfg)][:n]
+
+
+def rollout_batch(
+    cfg: SimConfig,
+    checkpoint_dir: str,
+    at: int,
+    stop: int,
+    plans: Sequence[SimPlan],
+    scenarios: Sequence[int],
+) -> np.ndarray:
+    """Metrics (len(plans), len(scenarios), len(METRICS)) of every plan x scenario branch."""
+    P, S = len(plans), len(scenarios)
+    cols = simulate_branches(
+        cfg, Path(checkpoint_dir), at, stop,
+        [plan for plan in plans for _ in scenarios], noise_keys=list(scenarios) * P,
+    )
+    out = np.stack([
+        cols["event_now"].sum(axis=1) * (step_seconds(cfg) / 60),
+        cols["WaterRecovery_proxy"].mean(axis=1),
+        cols["Overflow_Turb_NTU_clean"].max(axis=1),
+    ], axis=-1)
+    return out.reshape(P, S, len(METRICS))
+
+
+def pareto_front(crisis: np.ndarray, recovery: np.ndarray) -> np.ndarray:
+    """True where no other point has <= crisis and >= recovery with one strict."""
+    crisis, recovery = np.asarray(crisis)[:, None], np.asarray(recovery)[:, None]
+    dominated = (crisis.T <= crisis) & (recovery.T >= recovery) & ((crisis.T < crisis) | (recovery.T > recovery))
+    return ~dominated.any(axis=1)
+
+
+def evaluate_policies(
+    cfg: SimConfig,
+    checkpoint_dir: Path,
+    at: int,
+    policies: Sequence[Policy],
+    scenarios: int = 200,
+    horizon_min: int = 240,
+    max_workers: Optional[int] = None,
+    batch_scenarios: int = 16,
+) -> pd.DataFrame:
+    """
+    Roll every policy forward from row `at` under `scenarios` shared noise scenarios;
+    returns one ranked row per policy (metric means, crisis p90 / probability, pareto).
+
+    Work is split into scenario blocks of batch_scenarios (each block = all policies,
+    i.e. one engine of len(policies) * batch_scenarios units) over a process pool.
+    """
+    stop = at + minutes_to_rows(cfg, horizon_min)
+    base = make_plan(cfg)
+    plans = [p.apply(base, at, cfg) for p in policies]
+
+    metrics = np.empty((len(plans), scenarios, len(METRICS)))
+    blocks = [range(a, min(a + batch_scenarios, scenarios)) for a in range(0, scenarios, batch_scenarios)]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(rollout_batch, cfg, str(checkpoint_dir), at, stop, plans, list(block)): block
+            for block in blocks
+        }
+        for fut in as_completed(futures):
+            block = futures[fut]
+            metrics[:, block.start:block.stop] = fut.result()
+
+    crisis, recovery, peak = (metrics[..., j] for j in range(len(METRICS)))
+    table = pd.DataFrame({
+        "at": at,
+        "policy": [p.name for p in policies],
+        "action": [p.action for p in policies],
+        "uf_offset": [p.uf_offset for p in policies],
+        "uf_minutes": [p.uf_minutes for p in policies],
+        "dilution_factor": [p.dilution_factor for p in policies],
+        "dilution_minutes": [p.dilution_minutes for p in policies],
+        "crisis_min": crisis.mean(axis=1),
+        "crisis_min_p90": np.percentile(crisis, 90, axis=1),
+        "p_crisis": (crisis > 0).mean(axis=1),
+        "water_recovery": recovery.mean(axis=1),
+        "peak_turb_NTU": peak.mean(axis=1),
+    })
+    table["pareto"] = pareto_front(table["crisis_min"], table["water_recovery"])
+    table = table.sort_values(["crisis_min", "water_recovery"], ascending=[True, False], kind="stable")
+    table.insert(1, "rank", np.arange(1, len(table) + 1))
+    return table.reset_index(drop=True)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Rank playbook policies by parallel forward rollouts")
+    ap.add_argument("--seed", type=int, default=SimConfig.seed)
+    ap.add_argument("--days", type=int, default=SimConfig.days)
+    ap.add_argument("--at", type=int, action="append", default=None,
+                    help="decision row (repeatable); default: before the first --n-points crises")
+    ap.add_argument("--n-points", type=int, default=3)
+    ap.add_argument("--scenarios", type=int, default=200)
+    ap.add_argument("--horizon-min", type=int, default=240)
+    ap.add_argument("--batch-scenarios", type=int, default=16)
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--out", type=Path, default=Path("data/processed/rollouts"))
+    args = ap.parse_args()
+
+    cfg = SimConfig(seed=args.seed, days=args.days)
+    ckpt_dir = args.out / "checkpoints"
+    df, _ = simulate_clean(cfg, checkpoint_dir=ckpt_dir)
+    points = args.at or decision_points(df, cfg, args.n_points)
+    policies = playbook_policies(cfg)
+
+    tables = []
+    for at in points:
+        t0 = time.perf_counter()
+        table = evaluate_policies(cfg, ckpt_dir, at, policies, args.scenarios, args.horizon_min,
+                                  args.workers, args.batch_scenarios)
+        dt = time.perf_counter() - t0
+        table["playbook"] = table["action"] == df["RecommendedAction"].iloc[at]
+        tables.append(table)
+        print(f"row {at} ({df['timestamp'].iloc[at]}), playbook says {df['RecommendedAction'].iloc[at]}: "
+              f"{len(policies) * args.scenarios:,} rollouts in {dt:.1f}s")
+        print(table[["rank", "policy", "crisis_min", "p_crisis", "water_recovery", "pareto", "playbook"]]
+              .to_string(index=False, float_format="%.3f"))
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    pd.concat(tables, ignore_index=True).to_csv(args.out / "policy_ranking.csv", index=False)
+    print(f"Wrote: {args.out / 'policy_ranking.csv'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+sensitivity_sim.py - global (Sobol) sensitivity of simulator outputs to SimConfig fields.
+
+Which knobs actually move the dataset? Parameters are sampled over a box with a
+scrambled Sobol' sequence in the Saltelli layout: two N x d base matrices A and B plus
+d matrices AB_i (A with column i taken from B), N * (d + 2) runs in total. From those
+runs, for every output:
+
+    S1_i = mean(f(B) * (f(AB_i) - f(A))) / Var(f)        first order (Saltelli 2010)
+    ST_i = mean((f(A) - f(AB_i)) ** 2) / (2 Var(f))       total effect (Jansen)
+
+with f centred on its mean over A and B, and bootstrap confidence intervals. Outputs: event_rate, turb_p95 (clean NTU),
+manual_rate, torque_p95 (RakeTorque_pct).
+
+Every run uses the turbidity scale calibrated once on the base config
+(SimConfig.turb_scale). Re-bisected per run (--recalibrate), the scale would pin
+event_rate to target_event_rate +- target_tolerance by construction: its indices would
+only apportion the bisection's quantization noise, and the other outputs would mix the
+parameters' effect with the recalibration's.
+
+Thousands of runs stay affordable because
+- runs go through a process pool (pool.map in chunks),
+- --days shortens every run (e.g. 30 days: first CLAY + UF campaigns only),
+- with --cache the runs share a stage cache: AB_i differs from A only in parameter i,
+  so when i is a turbidity field (deadband, turb_power, ...) the feed / latent /
+  operator stages of A are reused.
+
+    data/processed/sensitivity/runs.csv      (one row per run: parameters + outputs)
+    data/processed/sensitivity/indices.csv   (output x parameter: S1, ST and their CIs)
+
+Run:
+  python src/sensitivity_sim.py --n 256 --days 30 --workers 8 --cache data/processed/cache
+  python src/sensitivity_sim.py --param deadband=0.2:0.36 --param qu_setpoint_step=6:18 --n 128
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+from calibrate_sim import _parse_param, candidate_config
+from simulate_fixed import SimConfig, simulate_clean
+
+OUTPUTS: Tuple[str, ...] = ("event_rate", "turb_p95", "manual_rate", "torque_p95")
+
+# Default box: turbidity shape, operator gains, torque scaling and feed / clay drivers.
+DEFAULT_SPACE: Dict[str, Tuple[float, float]] = {
+    "deadband": (0.20, 0.36),
+    "turb_power": (1.2, 2.0),
+    "stress_weights.uf": (0.20, 0.40),
+    "carryover_gain_NTU": (0.05, 0.25),
+    "qu_setpoint_step": (6.0, 18.0),
+    "torque_rated_kNm": (16.0, 26.0),
+    "ys_limit_Pa": (15.0, 25.0),
+    "clay_pct_max": (8.0, 16.0),
+    "feed_dilution_events_per_30d": (1.0, 6.0),
+}
+
+
+def saltelli_design(space: Dict[str, Tuple[float, float]], n: int, seed: int = 0) -> np.ndarray:
+    """
+    (n * (d + 2), d) parameter matrix: rows [A; B; AB_1; ...; AB_d], n rows each.
+
+    A and B are the two halves of one scrambled 2d-dimensional Sobol' sample, so the
+    pairs are not correlated. n should be a power of 2.
+    """
+    d = len(space)
+    u = qmc.Sobol(2 * d, scramble=True, seed=seed).random(n)
+    lo = np.array([b[0] for b in space.values()])
+    hi = np.array([b[1] for b in space.values()])
+    A, B = lo + u[:, :d] * (hi - lo), lo + u[:, d:] * (hi - lo)
+    AB = np.repeat(A[None], d, axis=0)
+    for i in range(d):
+        AB[i, :, i] = B[:, i]
+    return np.concatenate([A, B, AB.reshape(d * n, d)])
+
+
+def sobol_indices(
+    y: np.ndarray, n: int, d: int, n_boot: int = 200, seed: int = 0
+) -> Dict[str, np.ndarray]:
+    """
+    First-order and total indices (d,) of one output from saltelli_design() runs, with
+    95% bootstrap half-widths (resampling the n base rows).
+    """
+    y = y - y[:2 * n].mean()             # centring: S1 estimator variance grows with mean(f)**2
+    fA, fB, fAB = y[:n], y[n:2 * n], y[2 * n:].reshape(d, n)
+
+    def estimate(idx: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        a, b, ab = fA[idx], fB[idx], fAB[:, idx]
+        var = np.var(np.concatenate([a, b]))
+        if var == 0:
+            return np.zeros(d), np.zeros(d)
+        return np.mean(b * (ab - a), axis=1) / var, 0.5 * np.mean((a - ab) ** 2, axis=1) / var
+
+    S1, ST = estimate(np.arange(n))
+    rng = np.random.default_rng(seed)
+    boot = [estimate(rng.integers(0, n, n)) for _ in range(n_boot)]
+    z = 1.96
+    return {
+        "S1": S1, "S1_conf": z * np.std([b[0] for b in boot], axis=0),
+        "ST": ST, "ST_conf": z * np.std([b[1] for b in boot], axis=0),
+    }
+
+
+def run_outputs(cfg: SimConfig, cache_dir: Optional[str] = None) -> Tuple[float, ...]:
+    """OUTPUTS of one simulate_clean run."""
+    df, debug = simulate_clean(cfg, cache_dir=Path(cache_dir) if cache_dir else None)
+    return (
+        debug["event_rate"],
+        float(np.nanquantile(df["Overflow_Turb_NTU_clean"], 0.95)),
+        debug["manual_rate"],
+        debug["torque_pct_p95"],
+    )
+
+
+def _run(args: tuple) -> Tuple[float, ...]:
+    return run_outputs(*args)
+
+
+def analyze(
+    base: SimConfig,
+    space: Dict[str, Tuple[float, float]] = DEFAULT_SPACE,
+    n: int = 256,
+    days: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    cache_dir: Optional[Path] = None,
+    seed: int = 0,
+    recalibrate: bool = False,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Run the Saltelli design; returns (runs table, indices table). Unless recalibrate
+    (or base.turb_scale is set), every run gets the base config's calibrated scale.
+    """
+    d = len(space)
+    X = saltelli_design(space, n, seed)
+    base = replace(base, days=days or base.days)
+    if not recalibrate and base.turb_scale is None:
+        base = replace(base, turb_scale=simulate_clean(base)[1]["scale"])
+    cfgs = [candidate_config(base, dict(zip(space, row))) for row in X]
+    cache = str(cache_dir) if cache_dir else None
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        chunk = max(1, len(cfgs) // (4 * (max_workers or os.cpu_count() or 1)))
+        Y = np.array(list(pool.map(_run, [(cfg, cache) for cfg in cfgs], chunksize=chunk)))
+
+    runs = pd.DataFrame(X, columns=list(space))
+    runs.insert(0, "block", np.repeat(["A", "B"] + [f"AB:{p}" for p in space], n))
+    runs[list(OUTPUTS)] = Y
+
+    rows = []
+    for j, output in enumerate(OUTPUTS):
+        ind = sobol_indices(Y[:, j], n, d, seed=seed)
+        for i, param in enumerate(space):
+            rows.append({"output": output, "param": param, **{key: float(v[i]) for key, v in ind.items()}})
+    return runs, pd.DataFrame(rows)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Sobol sensitivity of simulator outputs to SimConfig fields")
+    ap.add_argument("--param", action="append", default=None,
+                    help="sampled field and bounds, e.g. deadband=0.2:0.36 (repeatable; default: DEFAULT_SPACE)")
+    ap.add_argument("--n", type=int, default=256, help="base sample size (power of 2); runs = n * (d + 2)")
+    ap.add_argument("--days", type=int, default=None, help="shortened horizon for every run")
+    ap.add_argument("--seed", type=int, default=SimConfig.seed, help="simulator seed (fixed across runs)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--out", type=Path, default=Path("data/processed/sensitivity"))
+    ap.add_argument("--cache", type=Path, default=None, metavar="DIR", help="shared stage cache (see tws.cache)")
+    ap.add_argument("--recalibrate", action="store_true",
+                    help="re-bisect the turbidity scale in every run (event_rate then stays at its target)")
+    args = ap.parse_args()
+
+    space = dict(_parse_param(p) for p in args.param) if args.param else DEFAULT_SPACE
+    base = replace(SimConfig(), seed=args.seed)
+    print(f"Sensitivity: {len(space)} parameters, {args.n * (len(space) + 2):,} runs on {args.workers} workers")
+
+    t0 = time.perf_counter()
+    runs, indices = analyze(base, space, args.n, args.days, args.workers, args.cache, recalibrate=args.recalibrate)
+    print(f"Done in {time.perf_counter() - t0:.1f}s")
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    runs.to_csv(args.out / "runs.csv", index=False)
+    indices.to_csv(args.out / "indices.csv", index=False)
+    for output, table in indices.groupby("output", sort=False):
+        print(f"\n{output}:")
+        print(table.sort_values("ST", ascending=False)[["param", "S1", "S1_conf", "ST", "ST_conf"]]
+              .to_string(index=False, float_format="%.3f"))
+    print("Wrote:", args.out / "runs.csv", "and", args.out / "indices.csv")
+
+
+if __name__ == "__main__":
+    main()
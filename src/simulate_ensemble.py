@@ -0,0 +1,181 @@
+"""
+simulate_ensemble.py - Monte Carlo ensemble of synthetic thickeners.
+
+Runs N seeds (optionally crossed with SimConfig variants) across a process pool and
+writes everything as ONE Hive-partitioned parquet dataset:
+
+    data/processed/ensemble/timeseries/seed=<seed>/Regime=<CLAY|NORMAL|UF>/member<id>-0.parquet
+    data/processed/ensemble/summary.csv      (one row per member: overrides + debug dict)
+
+Each worker simulates and writes its own member, so only the small debug dicts travel
+back to the parent process. Rows keep a `member` column, so variants that share a
+seed stay distinguishable inside the same partition.
+
+Run:
+  python src/simulate_ensemble.py --n-seeds 200 --workers 8
+  python src/simulate_ensemble.py --n-seeds 20 --variant deadband=0.25 --variant deadband=0.30
+
+Read back:
+  pd.read_parquet("data/processed/ensemble/timeseries", filters=[("seed", "in", [42, 43])])
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import replace
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from simulate_fixed import SimConfig, inject_failures, simulate_clean
+
+PARTITION_COLS = ["seed", "Regime"]
+
+
+def ensemble_members(
+    base: SimConfig,
+    seeds: Iterable[int],
+    variants: Optional[List[dict]] = None,
+) -> List[Tuple[int, dict, SimConfig]]:
+    """Cross product seeds x variants -> list of (member_id, overrides, cfg)."""
+    members = []
+    for overrides in (variants or [{}]):
+        for seed in seeds:
+            cfg = replace(base, seed=int(seed), **overrides)
+            members.append((len(members), dict(overrides), cfg))
+    return members
+
+
+def run_member(member_id: int, cfg: SimConfig, dataset_dir: str, cache_dir: Optional[str] = None) -> dict:
+    """Simulate one member and append its partitions to the shared dataset."""
+    df_clean, debug = simulate_clean(cfg, cache_dir=Path(cache_dir) if cache_dir else None)
+    df = inject_failures(cfg, df_clean)
+    df.insert(0, "member", member_id)
+    df["seed"] = cfg.seed
+
+    ds.write_dataset(
+        pa.Table.from_pandas(df, preserve_index=False),
+        dataset_dir,
+        format="parquet",
+        partitioning=PARTITION_COLS,
+        partitioning_flavor="hive",
+        basename_template=f"member{member_id:05d}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return debug
+
+
+def run_ensemble(
+    members: List[Tuple[int, dict, SimConfig]],
+    out_dir: Path,
+    max_workers: Optional[int] = None,
+    cache_dir: Optional[Path] = None,
+) -> pd.DataFrame:
+    """
+    Run all members in a process pool; returns (and writes) the summary table. The
+    dataset directory (out_dir/timeseries) is replaced, not appended to.
+
+    With cache_dir, members share a stage cache: variants that only change downstream
+    parameters (deadband, turb_power, ...) reuse the feed/latent/operator stages of the
+    same seed.
+    """
+    out_dir = Path(out_dir)
+    dataset_dir = out_dir / "timeseries"
+    # members of an earlier run (more seeds, other variants) would stay in the partitions;
+    # workers cannot clear them themselves, variants of one seed share partitions
+    if dataset_dir.exists():
+        shutil.rmtree(dataset_dir)
+    dataset_dir.mkdir(parents=True)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(run_member, member_id, cfg, str(dataset_dir), str(cache_dir) if cache_dir else None): (member_id, overrides, cfg)
+            for member_id, overrides, cfg in members
+        }
+        for fut in as_completed(futures):
+            member_id, overrides, cfg = futures[fut]
+            debug = fut.result()
+            rows.append({"member": member_id, "seed": cfg.seed, **overrides, **debug})
+            print(f"  member {member_id:>5} seed={cfg.seed} event_rate={debug['event_rate']:.3f}")
+
+    summary = pd.DataFrame(rows).sort_values("member").reset_index(drop=True)
+    summary.to_csv(out_dir / "summary.csv", index=False)
+    return summary
+
+
+def _tuples(value):
+    # lists (and lists of lists) from a literal -> tuples, as SimConfig stores them
+    return tuple(_tuples(v) for v in value) if isinstance(value, (list, tuple)) else value
+
+
+def _parse_value(key: str, text: str):
+    """One SimConfig field from text, checked against the field's default / annotation."""
+    default = getattr(SimConfig(), key)
+    text = text.strip()
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        value = text                    # bare words, e.g. norm_mode=running
+    numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+    if isinstance(default, str):
+        return text
+    if isinstance(default, float) and numeric:
+        return float(value)
+    if isinstance(default, int) and numeric and float(value).is_integer():
+        return int(value)
+    if isinstance(default, tuple) and isinstance(value, (list, tuple)):
+        return _tuples(value)
+    if default is None and "Dict" in str(SimConfig.__dataclass_fields__[key].type) and isinstance(value, (dict, type(None))):
+        return value
+    if default is None and "float" in str(SimConfig.__dataclass_fields__[key].type) and (numeric or value is None):
+        return None if value is None else float(value)
+    raise ValueError(f"Cannot set SimConfig.{key} ({type(default).__name__}) from {text!r}")
+
+
+def _parse_variant(text: str) -> dict:
+    # "deadband=0.25,turb_power=1.6,qu_setpoint_clip=(-50,50)"
+    #   -> {"deadband": 0.25, "turb_power": 1.6, "qu_setpoint_clip": (-50, 50)}
+    fields = SimConfig.__dataclass_fields__
+    out = {}
+    for item in re.split(r",(?=\s*[A-Za-z_]\w*\s*=)", text):
+        key, value = item.split("=", 1)
+        key = key.strip()
+        if key not in fields:
+            raise ValueError(f"Unknown SimConfig field: {key}")
+        out[key] = _parse_value(key, value)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Monte Carlo ensemble of simulate_fixed runs")
+    ap.add_argument("--n-seeds", type=int, default=8)
+    ap.add_argument("--seed0", type=int, default=SimConfig.seed)
+    ap.add_argument("--variant", action="append", default=None,
+                    help="SimConfig overrides, e.g. deadband=0.25,turb_power=1.6 (repeatable)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--out", type=Path, default=Path("data/processed/ensemble"))
+    ap.add_argument("--cache", type=Path, default=None, metavar="DIR", help="shared stage cache (see tws.cache)")
+    args = ap.parse_args()
+
+    variants = [_parse_variant(v) for v in args.variant] if args.variant else None
+    members = ensemble_members(SimConfig(), range(args.seed0, args.seed0 + args.n_seeds), variants)
+
+    print(f"Ensemble: {len(members)} members on {args.workers} workers -> {args.out}")
+    summary = run_ensemble(members, args.out, max_workers=args.workers, cache_dir=args.cache)
+
+    print("\nSUMMARY:")
+    print(summary.describe().T[["mean", "std", "min", "max"]])
+    print("Wrote:", args.out / "timeseries", "and", args.out / "summary.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,25 +21,54 @@ Key modeling choices (to keep coherence + stability):
     - ActionScore_turb / ActionScore_torque (simple signed scores)
 
 Outputs:
-- data/processed/thickener_timeseries.parquet (latest)
-- data/processed/thickener_timeseries_deadband{...}_sp{...}.parquet (versioned)
+- data/processed/thickener_timeseries.parquet (latest: link to the versioned file)
+- data/processed/thickener_timeseries_deadband{...}_sp{...}.parquet (versioned, row groups aligned to days)
+- data/processed/thickener_failures.parquet (ground-truth failure log: tag, failure, start, end, magnitude)
+  --compact writes the compact schema (tws.schema); read it back with tws.schema.read_timeseries().
+
+Long horizons: simulate_stream(cfg, chunk_points) yields the same frame in fixed-size
+chunks; recursions, rolling windows and the operator state are carried across chunks.
+High rate: SimConfig.step_s runs the model at a finer internal step (e.g. 10 s); windows
+and lags are durations, drivers keep their per-freq_min statistics (simulate_highres.py).
+Fleets: simulate_fleet(cfgs) runs K thickeners as (K, n) arrays (see simulate_fleet.py).
+Randomness: one SeedSequence spawn tree per seed (SEED_TREE); every noise stream, the
+operator, the plan and the failure schedule own a child, so results do not depend on
+the order (or concurrency) in which they are drawn.
+What-ifs: simulate_clean(cfg, checkpoint_dir=...) saves engine snapshots; resume(cfg, dir,
+start, stop, edited_plan) re-simulates only [checkpoint, stop) with e.g. a moved dilution event.
 """
 
 from __future__ import annotations
 
-from dataclasses import dataclass
+import argparse
+import json
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, Iterator, Sequence, Tuple
 
 import numpy as np
 import pandas as pd
 
+from tws.cache import StageCache, content_key
+from tws.kernels import AR1State, ar1_step, clipped_cumsum_units
+from tws.labels import sustained_above
+from tws.quantiles import LogQuantileSketch, TailCollector, tail_size
+from tws.rolling import rolling_aligned, rolling_local, sum_block
+from tws.schema import link_latest, write_timeseries
+
 
 @dataclass(frozen=True)
 class SimConfig:
     seed: int = 42
     days: int = 90
     freq_min: int = 5
+    # internal step in seconds (0: freq_min minutes; finer steps must divide freq_min * 60).
+    # One output row per step; dynamics are rescaled so every freq_min point keeps the same
+    # statistics. *_points fields count freq_min points, i.e. durations, whatever the step.
+    step_s: int = 0
 
     spec_limit_NTU: float = 200.0
     event_limit_NTU: float = 100.0
@@ -62,6 +91,19 @@ class SimConfig:
     deadband: float = 0.27
     turb_power: float = 1.55
     scale_search_hi: float = 6000.0
+    turb_scale: float | None = None  # fixed turbidity scale: skips the calibration to target_event_rate
+    # stress weights, one per STRESS_COMPONENTS entry (sum 1.0 keeps stress in [0, 1])
+    stress_weights: Tuple[float, ...] = (0.22, 0.24, 0.13, 0.31, 0.10)
+
+    # references of the 1st/99th percentile normalization (Clay_idx, stress components)
+    # and of the turbidity scale:
+    #   "exact"   whole-series percentiles / scale (needs the whole horizon first)
+    #   "warmup"  frozen from the first norm_warmup_days (exact over the warmup)
+    #   "running" warmup, then percentiles re-estimated every norm_refresh_points points
+    #             from a bounded-memory sketch of all earlier rows (scale stays the warmup's)
+    norm_mode: str = "exact"
+    norm_warmup_days: int = 30              # covers the first clay campaign (clay_episodes)
+    norm_refresh_points: int = 288
 
     # explicit dilution action schedule (operator-initiated sometimes)
     feed_dilution_events_per_30d: float = 3.0
@@ -92,6 +134,11 @@ class SimConfig:
     # event typing thresholds
     event_type_override_th_uf: float = 0.55
 
+    # operator mode switching, per decision point: AUTO -> MANUAL with manual_enter_gain x the
+    # situational manual probability, MANUAL -> AUTO with manual_exit_base (+0.08 when calm)
+    manual_enter_gain: float = 0.12
+    manual_exit_base: float = 0.03
+
     # operator closed-loop gains (small and bounded)
     qu_setpoint_step: float = 12.0          # m3/h step per action
     qu_setpoint_clip: Tuple[float, float] = (-60.0, 60.0)
@@ -100,543 +147,1674 @@ class SimConfig:
     carryover_gain_NTU: float = 0.12        # NTU per (m3/h) of positive Qu setpoint delta
 
 
+# Turbidity stress components, in SimConfig.stress_weights order.
+STRESS_COMPONENTS: Tuple[str, ...] = ("fines", "load", "var", "uf", "floc")
+
+
 def _default_drift_magnitude() -> Dict[str, float]:
     return {"Qf_m3h": 0.08, "Solids_u_pct": -0.04, "Overflow_Turb_NTU": -10.0, "pH_feed": 0.3}
 
 
-def rolling_std(x: np.ndarray, window: int) -> np.ndarray:
-    return (
-        pd.Series(x)
-        .rolling(window=window, min_periods=max(3, window // 5))
-        .std()
-        .bfill()
-        .fillna(0.0)
-        .to_numpy()
-    )
+# Rolling windows up to this many rows use window-local sums (rolling_window); longer ones
+# (fine internal steps) block-aligned prefix sums, O(n) instead of O(n * window).
+LOCAL_WINDOW_MAX = 32
 
 
-def rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
-    return (
-        pd.Series(x)
-        .rolling(window=window, min_periods=max(3, window // 5))
-        .mean()
-        .bfill()
-        .fillna(float(x[0]))
-        .to_numpy()
-    )
+def rolling_window(xh: np.ndarray, window: int, std: bool = False) -> np.ndarray:
+    """
+    Rolling mean / std (ddof=1) with pandas min_periods=max(3, window // 5) semantics.
+
+    `xh` carries window - 1 rows of left context (NaN before the series start); see
+    tws.rolling.rolling_local (window-local sums, so chunked runs reproduce single-shot ones).
+    """
+    return rolling_local(xh, window, std=std, min_periods=max(3, window // 5))
+
 
+def _bfill(x: np.ndarray, fill) -> np.ndarray:
+    # backward fill NaNs along the last axis; trailing NaNs take `fill` (scalar or one per row)
+    n = x.shape[-1]
+    pos = np.where(np.isnan(x), n, np.arange(n))
+    pos = np.minimum.accumulate(pos[..., ::-1], axis=-1)[..., ::-1]
+    tail = np.empty(x.shape[:-1] + (1,))
+    tail[:] = np.asarray(fill, dtype=float).reshape(-1, 1) if np.ndim(fill) else fill
+    return np.take_along_axis(np.concatenate([x, tail], axis=-1), pos, axis=-1)
 
-def normalize_01(x: np.ndarray) -> np.ndarray:
-    lo = np.nanpercentile(x, 1)
-    hi = np.nanpercentile(x, 99)
+
+def scale_01(x: np.ndarray, lo: float, hi: float) -> np.ndarray:
     if hi - lo < 1e-9:
         return np.zeros_like(x)
     return np.clip((x - lo) / (hi - lo), 0.0, 1.0)
 
 
-def sustained_above(x: np.ndarray, threshold: float, sustain_points: int) -> np.ndarray:
-    above = x > threshold
-    s = pd.Series(above.astype(int)).rolling(window=sustain_points, min_periods=sustain_points).sum()
-    return (s == sustain_points).fillna(False).to_numpy()
+# Playbook rule table: (RecommendedAction, ExpectedTradeoff, ActionScore_turb, ActionScore_torque).
+# Row index is the categorical code written to the output columns.
+PLAYBOOK_RULES: Tuple[Tuple[str, str, float, float], ...] = (
+    ("NONE", "", 0.0, 0.0),
+    ("INCREASE_UF_WATCH_CARRYOVER", "↓bed/↓torque, possible ↑turbidity via carryover", -0.2, +0.7),
+    ("START_DILUTION_AND_OPTIMIZE_FLOC", "↓YS/↓torque, likely ↓turbidity, but ↑water use", +0.6, +0.5),
+    ("MONITOR_AND_TUNE", "small adjustments", +0.1, +0.1),
+)
+
+
+def playbook_codes(
+    turb: np.ndarray,
+    torque_pct: np.ndarray,
+    bed: np.ndarray,
+    regime: np.ndarray,
+    uf_c: np.ndarray,
+    clay_idx: np.ndarray,
+) -> np.ndarray:
+    """PLAYBOOK_RULES row index per sample (int8, same shape as the inputs)."""
+    # Rules are evaluated as boolean masks; the first matching rule wins (np.select).
+    quiet = (turb < 60) & (torque_pct < 80) & (bed < 2.4)
+    # if UF constrained -> recommend increase UF (trade-off carryover)
+    uf_constrained = (regime == "UF") | (uf_c > 0.60) | (bed > 2.7)
+    # if clay/fines high -> recommend dilution and floc optimization
+    clay_high = (regime == "CLAY") | (clay_idx > 0.65)
+
+    return np.select([quiet, uf_constrained, clay_high], [0, 1, 2], default=3).astype(np.int8)
+
+
+def crossing_scales(offset: np.ndarray, gain: np.ndarray, cfg: SimConfig) -> np.ndarray:
+    """
+    Per-row scale above which clip(offset + scale * gain, 5, turb_max) > event_limit_NTU.
+
+    -inf: row is above the limit for any scale; +inf: row never crosses it.
+    """
+    T = cfg.event_limit_NTU
+    if T >= cfg.turb_max:
+        return np.full(len(offset), np.inf)
+    if T < 5.0:
+        return np.full(len(offset), -np.inf)
+    need = T - offset
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.where(gain > 0, need / gain, np.where(need < 0, -np.inf, np.inf))
+    return r
+
+
+def window_thresholds(rh: np.ndarray, sustain_points: int) -> np.ndarray:
+    """
+    Scale above which a whole sustain window is over the limit (max of its crossing scales).
+
+    `rh` carries sustain_points - 1 rows of left context (+inf before the series start,
+    i.e. incomplete windows never count); one value per row of rh[sustain_points - 1:].
+    """
+    k = max(int(sustain_points), 1)
+    return np.lib.stride_tricks.sliding_window_view(rh, k, axis=-1).max(axis=-1)
+
+
+def scale_tail_size(cfg: SimConfig, n: int) -> int:
+    """Smallest window thresholds the bisection needs: a count >= this is always 'too many'."""
+    return int(np.floor((cfg.target_event_rate + cfg.target_tolerance) * n)) + 2
+
+
+def bisect_turb_scale(lowest: np.ndarray, n: int, cfg: SimConfig) -> tuple[float, int]:
+    """
+    Bisection over [0, scale_search_hi] on event_rate(scale) = #(threshold < scale) / n.
+
+    `lowest` holds the scale_tail_size() smallest window thresholds, sorted. Counts that
+    saturate it give a rate above target + tolerance, so every step takes the same branch
+    as with the full sorted array.
+    """
+    lo, hi = 0.0, float(cfg.scale_search_hi)
+    best_scale = 0.0
+    iters = 0
+    for iters in range(1, 27):
+        mid = (lo + hi) / 2.0
+        rate = float(np.searchsorted(lowest, mid, side="left")) / n
+        best_scale = mid
+        if abs(rate - cfg.target_event_rate) <= cfg.target_tolerance:
+            break
+        if rate < cfg.target_event_rate:
+            lo = mid
+        else:
+            hi = mid
+    return best_scale, iters
 
 
-def day_to_idx(day: int, cfg: SimConfig) -> int:
-    return int(day * 24 * 60 / cfg.freq_min)
+# Model windows in minutes: the operator watches 1-h means of bed / torque, feed
+# variability is a 1-h rolling std, and turbidity follows stress 30 / 60 min back.
+OPERATOR_WINDOW_MIN = 60
+VARIABILITY_WINDOW_MIN = 60
+STRESS_LAGS_MIN: Tuple[int, int] = (30, 60)
 
 
-def build_regime_schedule(cfg: SimConfig, n: int) -> np.ndarray:
-    regime = np.array(["NORMAL"] * n, dtype=object)
-    for start, dur in cfg.clay_episodes:
-        i0, i1 = day_to_idx(start, cfg), day_to_idx(start + dur, cfg)
-        regime[i0:i1] = "CLAY"
-    for start, dur in cfg.uf_episodes:
-        i0, i1 = day_to_idx(start, cfg), day_to_idx(start + dur, cfg)
-        regime[i0:i1] = "UF"
-    return regime
+def step_seconds(cfg: SimConfig) -> int:
+    """Internal step (one output row) in seconds."""
+    return cfg.step_s or 60 * cfg.freq_min
 
 
-def simulate_clean(cfg: SimConfig) -> tuple[pd.DataFrame, dict]:
-    if cfg.drift_magnitude is None:
-        object.__setattr__(cfg, "drift_magnitude", _default_drift_magnitude())
+def grid_rows(cfg: SimConfig) -> int:
+    """Rows per freq_min grid point (1 unless SimConfig.step_s is finer)."""
+    step, point = step_seconds(cfg), 60 * cfg.freq_min
+    if step <= 0 or point % step:
+        raise ValueError(f"step_s must divide freq_min * 60 = {point} s, got {cfg.step_s}")
+    return point // step
 
-    rng = np.random.default_rng(cfg.seed)
-    index = pd.date_range(
-        "2026-01-01",
-        periods=int(cfg.days * 24 * 60 / cfg.freq_min),
-        freq=f"{cfg.freq_min}min",
-    )
-    n = len(index)
 
-    regime = build_regime_schedule(cfg, n)
+def minutes_to_rows(cfg: SimConfig, minutes: float) -> int:
+    """Rows spanning `minutes` (at least 1)."""
+    return max(1, int(round(minutes * 60 / step_seconds(cfg))))
 
-    # ------------------ Feed (pulp) + dilution schedule ------------------
-    qf_base = rng.uniform(450, 650)
-    diurnal = 80 * np.sin(np.linspace(0, 2 * np.pi * cfg.days, n))
-    qf_rw = np.cumsum(rng.normal(0, 0.8, n))
-    Qf_pulp = np.clip(qf_base + diurnal + qf_rw + rng.normal(0, 25, n), 250, 900)
 
-    Sol_f_base = 32.0 + 3.0 * np.sin(np.linspace(0, 4 * np.pi * cfg.days, n))
-    Sol_f_base += 0.003 * (Qf_pulp - 550)
-    Sol_f_base += rng.normal(0, 1.8, n)
-    Sol_f_base = np.clip(Sol_f_base, 20, 45)
+def sustain_rows(cfg: SimConfig) -> int:
+    return max(cfg.sustain_points, 1) * grid_rows(cfg)
 
-    FeedDilution_On = np.zeros(n, dtype=int)
-    FeedDilution_factor = np.ones(n, dtype=float)
 
-    dilution_segments = int(cfg.feed_dilution_events_per_30d * (cfg.days / 30.0))
-    for _ in range(dilution_segments):
-        idx_candidates = np.where(regime == "CLAY")[0] if (rng.random() < 0.75) else np.arange(n)
-        if len(idx_candidates) == 0:
-            continue
-        start = int(rng.choice(idx_candidates))
-        dur_min = rng.integers(cfg.feed_dilution_duration_min[0], cfg.feed_dilution_duration_min[1] + 1)
-        dur = max(1, int(dur_min / cfg.freq_min))
-        end = min(n, start + dur)
-        factor = rng.uniform(cfg.feed_dilution_factor_range[0], cfg.feed_dilution_factor_range[1])
+def horizon_rows(cfg: SimConfig) -> int:
+    return cfg.horizon_points * grid_rows(cfg)
 
-        FeedDilution_On[start:end] = 1
-        FeedDilution_factor[start:end] = factor
-
-    Qf_dilution = np.zeros(n, dtype=float)
-    mask_dil = FeedDilution_On.astype(bool)
-    Qf_dilution[mask_dil] = Qf_pulp[mask_dil] * (1.0 / FeedDilution_factor[mask_dil] - 1.0)
-
-    Qf_total = Qf_pulp + Qf_dilution
-    Ms = Qf_pulp * (Sol_f_base / 100.0)
-    Sol_f = np.clip(100.0 * Ms / np.maximum(Qf_total, 1e-6), 18, 45)
-
-    # feedwell solids
-    Feedwell_Solids_pct = Sol_f.copy()
-    fw_target = rng.uniform(cfg.feedwell_solids_target_range_pct[0], cfg.feedwell_solids_target_range_pct[1], size=n)
-    Feedwell_Solids_pct[mask_dil] = fw_target[mask_dil] + rng.normal(0, 0.9, int(mask_dil.sum()))
-    Feedwell_Solids_pct[~mask_dil] = Sol_f[~mask_dil] + rng.normal(0, 0.6, int((~mask_dil).sum()))
-    Feedwell_Solids_pct = np.clip(Feedwell_Solids_pct, 8.0, 45.0)
-
-    # ------------------ Latent drivers ------------------
-    PSD = np.zeros(n)
-    Clay_pct = np.zeros(n)
-
-    clay_target_normal = rng.uniform(1.0, 4.0)
-    clay_target_clay = rng.uniform(6.0, 10.0)
-    clay_target_other = rng.uniform(2.0, 6.0)
-
-    for i in range(n):
-        r = regime[i]
-        if r == "CLAY":
-            clay_target = clay_target_clay + rng.normal(0, 0.6)
-            psd_target = rng.uniform(0.55, 0.80)
-        elif r == "NORMAL":
-            clay_target = clay_target_normal + rng.normal(0, 0.4)
-            psd_target = rng.uniform(0.10, 0.30)
-        else:
-            clay_target = clay_target_other + rng.normal(0, 0.5)
-            psd_target = rng.uniform(0.15, 0.40)
-
-        Clay_pct[i] = 0.985 * (Clay_pct[i - 1] if i > 0 else clay_target) + 0.015 * clay_target + rng.normal(0, 0.08)
-        PSD[i] = 0.982 * (PSD[i - 1] if i > 0 else psd_target) + 0.018 * psd_target + rng.normal(0, 0.01)
-
-    Clay_pct = np.clip(Clay_pct, cfg.clay_pct_min, cfg.clay_pct_max)
-    Clay_idx = normalize_01(Clay_pct)
-    PSD = np.clip(PSD, 0.05, 0.85)
-
-    solids_load = Qf_total * (Sol_f / 100.0)
-    load_norm = normalize_01(solids_load)
-
-    # ------------------ pH (causal: drive floc effectiveness → stress → turbidity) -----------
-    # Base: circuito alcalino post-flotación Cu/Mo (cal); óptimo PAM aniónico: 8–9
-    # CLAY: arcilla consume alcalinidad → pH sube a 9.5–10.5 (fuera del rango óptimo)
-    # Respuesta operador: aumentar dosis de floculante y/o ajustar dosificación de cal
-    pH_base_normal  = float(rng.uniform(8.8, 9.3))
-    ph_uf_noise     = rng.normal(0, 0.05, n)
-    ph_normal_noise = rng.normal(0, 0.04, n)
-    pH_target = np.where(
-        regime == "CLAY",
-        pH_base_normal + 0.6 * Clay_idx + 0.4 * PSD,   # sube por encima del óptimo
-        np.where(regime == "UF", pH_base_normal + ph_uf_noise, pH_base_normal + ph_normal_noise),
-    )
-    _rng_ph = np.random.default_rng(cfg.seed + 13)
-    pH_clean = np.zeros(n)
-    pH_clean[0] = pH_base_normal
-    for i in range(1, n):
-        pH_clean[i] = 0.985 * pH_clean[i - 1] + 0.015 * pH_target[i] + _rng_ph.normal(0, 0.03)
-    pH_clean = np.clip(pH_clean, 7.5, 12.0)
-
-    # Floc_effectiveness (latente): Gaussiana centrada en pH óptimo 8.5
-    # pH 8.5 → 1.00 | pH 9.5 → 0.88 | pH 10.5 → 0.61 | pH 11.0 → 0.46
-    pH_dev = np.abs(pH_clean - 8.5)
-    floc_effectiveness = np.clip(np.exp(-0.5 * (pH_dev / 1.0) ** 2), 0.3, 1.0)
-
-    # ------------------ Floc dose (process variable) ------------------------------------------
-    # pH > 9.0 → operador aumenta dosis o cambia polímero (hasta +6 g/t en episodio severo)
-    pH_off_optimal = np.clip(pH_clean - 9.0, 0.0, 3.0)
-    pH_floc_correction = 6.0 * (pH_off_optimal / 3.0)
-    floc_need = 12 + 18 * PSD + 14 * load_norm + 10 * Clay_idx + pH_floc_correction + rng.normal(0, 1.2, n)
-    Floc_gpt = np.clip(floc_need + rng.normal(0, 1.5, n), 5, 35)
-
-    # ------------------ UF capacity + base Qu ------------------
-    UF_capacity = np.ones(n)
-    uf_mask = (regime == "UF")
-    if uf_mask.any():
-        points_per_hour = int(60 / cfg.freq_min)
-        uf_idx = np.where(uf_mask)[0]
-        total_uf_days = sum(dur for _, dur in cfg.uf_episodes)
-        n_dropouts = int(total_uf_days * 3.0)
-        for _ in range(n_dropouts):
-            start = int(rng.choice(uf_idx))          # solo índices UF reales
-            duration = rng.integers(2 * points_per_hour, 4 * points_per_hour + 1)
-            cap = rng.uniform(0.70, 0.92)
-            UF_capacity[start:start + duration] = np.minimum(
-                UF_capacity[start:start + duration], cap)
-
-    Qu_base = np.clip((0.35 * Qf_total + rng.normal(0, 18, n)) * UF_capacity, 80, 450)
-
-    # ------------------ Closed-loop operator: setpoint deltas ------------------
-    Qu_sp_delta = np.zeros(n, dtype=float)
-    OperatorAction = np.array(["NONE"] * n, dtype=object)
-    ControlMode = np.array(["AUTO"] * n, dtype=object)
-
-    # We use "observable" proxies to decide actions (no future info)
-    # Here we use truth for simplicity; later you can use measured tags if desired.
-    # We'll compute bed/YS first pass with base Qu, then do a second pass applying setpoints.
-    # For stability, we do a single pass with lagged signals.
-
-    # Placeholder arrays; computed later after bed/YS exists
-    # We'll fill OperatorAction/ControlMode after first bed/YS estimate.
-
-    # ------------------ Bed dynamics (using Qu_base for first pass) ------------------
-    bed = np.zeros(n)
-    bed[0] = rng.uniform(1.0, 2.0)
-    for i in range(1, n):
-        load_effect = 0.014 * (load_norm[i] - 0.5) + 0.018 * (PSD[i] - 0.3)
-        uf_effect = 0.028 * ((1.0 - UF_capacity[i]) * 3.0)
-        drawdown = 0.0010 * ((Qu_base[i] - 220) / 220.0)
-        bed[i] = np.clip(bed[i - 1] + load_effect + uf_effect - drawdown + rng.normal(0, 0.01), 0.5, 3.5)
-
-    # ------------------ Underflow density (first pass) ------------------
-    Sol_u = 64.0 + 4.0 * (bed - 1.8) - 6.5 * (PSD - 0.25) - 0.006 * (Qu_base - 260)
-    Sol_u += rng.normal(0, 1.6, n)
-    Sol_u += np.where(regime == "UF", -2.0 * (1.0 - UF_capacity) * 3.0, 0.0)
-    Sol_u += np.where(regime == "CLAY", -1.5 * PSD, 0.0)
-    Sol_u = np.clip(Sol_u, 50, 75)
-
-    # ------------------ Yield stress (truth) base ------------------
-    dens_term = np.exp(0.10 * (Sol_u - 60.0))
-    clay_amp = 1.0 + 2.5 * Clay_idx
-    fines_amp = 1.0 + 0.8 * np.clip(PSD - 0.25, 0.0, 0.6)
-
-    UF_YieldStress_Pa_base = 4.5 * dens_term * clay_amp * fines_amp + rng.normal(0, 0.8, n)
-    UF_YieldStress_Pa_base = np.clip(UF_YieldStress_Pa_base, 0.5, 60.0)
-
-    # ------------------ Torque proxy base (truth) ------------------
-    # Torque increases with YS and bed; add mild clay bogging interaction.
-    ys = UF_YieldStress_Pa_base
-    ys_gate = np.clip((ys - cfg.ys_limit_Pa) / 20.0, 0.0, 1.0)
-    Bogging_factor = 1.0 + 0.25 * Clay_idx * ys_gate
-
-    RakeTorque_kNm_base = (
-        0.35 * ys + 2.0 * bed
-    ) * Bogging_factor + rng.normal(0, cfg.torque_noise_kNm, n)
-    RakeTorque_kNm_base = np.clip(RakeTorque_kNm_base, 0.0, cfg.torque_clip_kNm)
-    RakeTorque_pct_base = 100.0 * RakeTorque_kNm_base / cfg.torque_rated_kNm
-
-    # ------------------ Decide operator mode/actions (based on lagged observables) ------------------
-    bed_rm = rolling_mean(bed, window=12)
-    torque_rm = rolling_mean(RakeTorque_pct_base, window=12)
-
-    rng2 = np.random.default_rng(cfg.seed + 101)
-
-    for i in range(1, n):
-        # probability of manual when stressed
-        manual_prob = np.clip(
-            0.08
-            + 0.18 * float(torque_rm[i] > 85)
-            + 0.15 * float(bed_rm[i] > 2.6)
-            + 0.10 * float(regime[i] == "UF"),
-            0.02, 0.75
-        )
 
-        if ControlMode[i - 1] == "AUTO":
-            ControlMode[i] = "MANUAL" if (rng2.random() < manual_prob * 0.12) else "AUTO"
-        else:
-            calm = (torque_rm[i] < 70) and (bed_rm[i] < 2.2)
-            p_exit = 0.03 + (0.08 if calm else 0.0)
-            ControlMode[i] = "AUTO" if (rng2.random() < p_exit) else "MANUAL"
+def min_chunk_rows(cfg: SimConfig) -> int:
+    """Shortest chunk of chunked runs: the longest rolling window, or the label horizon."""
+    return max(minutes_to_rows(cfg, max(OPERATOR_WINDOW_MIN, VARIABILITY_WINDOW_MIN)), horizon_rows(cfg))
 
-        if ControlMode[i] != "MANUAL":
-            continue
 
-        # Action logic (bounded setpoints)
-        bed_high = bed_rm[i] > 2.6
-        torque_high = torque_rm[i] > 90
+def day_to_idx(day: int, cfg: SimConfig) -> int:
+    return int(day * 24 * 3600 / step_seconds(cfg))
 
-        if bed_high or torque_high:
-            OperatorAction[i] = "INCREASE_UF"
-            Qu_sp_delta[i] = np.clip(Qu_sp_delta[i - 1] + cfg.qu_setpoint_step, *cfg.qu_setpoint_clip)
-        else:
-            # sometimes do nothing or minor tweaks
-            if rng2.random() < 0.85:
-                Qu_sp_delta[i] = Qu_sp_delta[i - 1]
-            else:
-                OperatorAction[i] = "INCREASE_UF"
-                Qu_sp_delta[i] = np.clip(Qu_sp_delta[i - 1] + 0.5 * cfg.qu_setpoint_step, *cfg.qu_setpoint_clip)
 
-        # small relaxation of setpoints in AUTO to avoid drifting forever
-        if ControlMode[i] == "AUTO":
-            Qu_sp_delta[i] = 0.98 * Qu_sp_delta[i]
+def n_points(cfg: SimConfig) -> int:
+    return int(cfg.days * 24 * 3600 / step_seconds(cfg))
 
-    # forward-fill setpoints (piecewise constant)
-    Qu_sp_delta = pd.Series(Qu_sp_delta).replace(0.0, np.nan).ffill().fillna(0.0).to_numpy()
 
-    # ------------------ Apply operator setpoints to manipulated variables ------------------
-    Qu = np.clip(Qu_base + Qu_sp_delta, 60, 500)
+# AR(1) drivers x[i] = a * x[i-1] + w * target[i] + eps[i], coefficients per freq_min point.
+AR1_DRIVERS: Dict[str, Tuple[float, float]] = {"clay": (0.985, 0.015), "psd": (0.982, 0.018), "ph": (0.985, 0.015)}
 
-    # Flujo de overflow: balance volumétrico + ruido de medición (~1% del rango típico)
-    Qo = np.clip(Qf_total - Qu + rng.normal(0, 5.0, n), 50.0, 800.0)
 
-    UF_YieldStress_Pa = 4.5 * dens_term * clay_amp * fines_amp + rng.normal(0, 0.6, n)
-    UF_YieldStress_Pa = np.clip(UF_YieldStress_Pa, 0.5, 60.0)
+def ar1_driver(cfg: SimConfig, name: str) -> Tuple[float, float, float, float]:
+    """
+    (a, w, target gain, noise gain) of an AR1_DRIVERS entry at the internal step.
 
-    # Recompute torque proxy with final YS (this is what operator sees)
-    ys = UF_YieldStress_Pa
-    ys_gate = np.clip((ys - cfg.ys_limit_Pa) / 20.0, 0.0, 1.0)
-    Bogging_factor = 1.0 + 0.25 * Clay_idx * ys_gate
-    RakeTorque_kNm = (0.35 * ys + 2.0 * bed) * Bogging_factor + rng.normal(0, cfg.torque_noise_kNm, n)
-    RakeTorque_kNm = np.clip(RakeTorque_kNm, 0.0, cfg.torque_clip_kNm)
-    RakeTorque_pct = 100.0 * RakeTorque_kNm / cfg.torque_rated_kNm
+    With R rows per grid point, a -> a ** (1 / R) keeps the time constant; the target
+    and innovation noise are scaled so the stationary spread is the one of the grid.
+    """
+    a, w = AR1_DRIVERS[name]
+    R = grid_rows(cfg)
+    if R == 1:
+        return a, w, 1.0, 1.0
+    a_r = a ** (1.0 / R)
+    w_r = w * (1.0 - a_r) / (1.0 - a)
+    noise = float(np.sqrt((1.0 - a_r * a_r) / (1.0 - a * a)))
+    return a_r, w_r, noise * w / w_r, noise
 
-    # ------------------ Stress components for turbidity ------------------
-    fines_c = normalize_01(PSD)
-    load_c = normalize_01(solids_load)
-    var_c = normalize_01(rolling_std(Qf_total, window=12) + rolling_std(Sol_f, window=12))
 
-    uf_c = normalize_01((1.0 - UF_capacity) + np.clip((220 - Qu) / 220.0, 0, 1))
+def _regime_rows(cfg: SimConfig, i0: int, i1: int) -> np.ndarray:
+    # Regime labels for rows [i0, i1): UF episodes override CLAY episodes.
+    regime = np.array(["NORMAL"] * (i1 - i0), dtype=object)
+    for name, episodes in (("CLAY", cfg.clay_episodes), ("UF", cfg.uf_episodes)):
+        for start, dur in episodes:
+            a, b = max(day_to_idx(start, cfg), i0), min(day_to_idx(start + dur, cfg), i1)
+            if a < b:
+                regime[a - i0:b - i0] = name
+    return regime
 
-    # Carryover trade-off: pushing UF increases turbidity slightly
-    carryover_penalty = cfg.carryover_gain_NTU * np.clip(Qu_sp_delta, 0.0, 200.0)
 
-    # floc_c: estrés por degradación del floculante (pH fuera del rango óptimo)
-    floc_c = normalize_01(1.0 - floc_effectiveness)  # 0 = floc OK; 1 = floc muy degradado
+def build_regime_schedule(cfg: SimConfig, n: int) -> np.ndarray:
+    return _regime_rows(cfg, 0, n)
+
+
+def _regime_intervals(cfg: SimConfig, n: int, name: str) -> list[tuple[int, int]]:
+    # Disjoint [i0, i1) row intervals labeled `name`, without an O(n) label array.
+    cuts = {0, n}
+    for start, dur in (*cfg.clay_episodes, *cfg.uf_episodes):
+        cuts.update(min(max(day_to_idx(d, cfg), 0), n) for d in (start, start + dur))
+    cuts = sorted(cuts)
+    return [(a, b) for a, b in zip(cuts[:-1], cuts[1:]) if a < b and _regime_rows(cfg, a, a + 1)[0] == name]
+
+
+def _nth_row(intervals: list[tuple[int, int]], k: int) -> int:
+    for a, b in intervals:
+        if k < b - a:
+            return a + k
+        k -= b - a
+    raise IndexError(k)
+
+
+def _linspace_rows(stop: float, n: int, i0: int, i1: int) -> np.ndarray:
+    # rows [i0, i1) of np.linspace(0, stop, n), same floats
+    if n <= 1:
+        return np.zeros(i1 - i0)
+    y = np.arange(i0, i1, dtype=float) * (stop / (n - 1))
+    if i1 == n and i1 > i0:
+        y[-1] = stop
+    return y
+
+
+# Independent noise stream per simulated array. Each stream is consumed strictly in row
+# order, so drawing it chunk by chunk gives the same numbers as one full-length draw.
+NOISE_STREAMS: Tuple[str, ...] = (
+    "qf_rw", "qf_noise", "solf_noise", "fw_target", "fw_noise_dil", "fw_noise_feed",
+    "clay_z", "psd_u", "clay_eps", "psd_eps", "ph_uf", "ph_normal", "floc_need", "floc_dose",
+    "qu_base", "bed", "sol_u", "ys_base", "torque_base", "qo", "ys", "torque",
+    "base_turb", "turb_noise", "ph_ar",
+)
+
+# Spawn tree of one seed: SEED_TREE[j] draws from child j of SeedSequence(seed). Every
+# consumer (noise stream, operator decisions, plan, failure schedule) owns its stream,
+# so its numbers depend only on the seed, never on which stage ran first.
+SEED_TREE: Tuple[str, ...] = NOISE_STREAMS + ("operator", "plan", "failures")
+
+
+def seed_tree(seed: int, spawn_key: Tuple[int, ...] = ()) -> Dict[str, np.random.SeedSequence]:
+    children = np.random.SeedSequence(seed, spawn_key=spawn_key).spawn(len(SEED_TREE))
+    return dict(zip(SEED_TREE, children))
+
+
+def noise_streams(seed: int, spawn_key: Tuple[int, ...] = ()) -> Dict[str, np.random.Generator]:
+    tree = seed_tree(seed, spawn_key)
+    return {name: np.random.default_rng(tree[name]) for name in NOISE_STREAMS}
+
+
+# Per-chunk draws of each stage: (stream, method, args(cfg, m, k0, n_dil)), m rows of
+# which k0 hold initial values, n_dil of them diluted. Streams are separate generators,
+# so rows() issues all draws of a chunk concurrently before the stages run.
+STAGE_NOISE: Dict[str, Tuple[tuple, ...]] = {
+    "feed": (
+        ("qf_rw", "normal", lambda c, m, k0, n_dil: (0, 0.8, m)),
+        ("qf_noise", "normal", lambda c, m, k0, n_dil: (0, 25, m)),
+        ("solf_noise", "normal", lambda c, m, k0, n_dil: (0, 1.8, m)),
+        ("fw_target", "uniform", lambda c, m, k0, n_dil: (*c.feedwell_solids_target_range_pct, m)),
+        ("fw_noise_dil", "normal", lambda c, m, k0, n_dil: (0, 0.9, n_dil)),
+        ("fw_noise_feed", "normal", lambda c, m, k0, n_dil: (0, 0.6, m - n_dil)),
+    ),
+    "latent": (
+        ("clay_z", "standard_normal", lambda c, m, k0, n_dil: (m,)),
+        ("psd_u", "random", lambda c, m, k0, n_dil: (m,)),
+        ("clay_eps", "normal", lambda c, m, k0, n_dil: (0, 0.08, m)),
+        ("psd_eps", "normal", lambda c, m, k0, n_dil: (0, 0.01, m)),
+    ),
+    "ph_floc": (
+        ("ph_uf", "normal", lambda c, m, k0, n_dil: (0, 0.05, m)),
+        ("ph_normal", "normal", lambda c, m, k0, n_dil: (0, 0.04, m)),
+        ("ph_ar", "normal", lambda c, m, k0, n_dil: (0, 0.03, m - k0)),
+        ("floc_need", "normal", lambda c, m, k0, n_dil: (0, 1.2, m)),
+        ("floc_dose", "normal", lambda c, m, k0, n_dil: (0, 1.5, m)),
+    ),
+    "uf_bed": (
+        ("qu_base", "normal", lambda c, m, k0, n_dil: (0, 18, m)),
+        ("bed", "normal", lambda c, m, k0, n_dil: (0, 0.01, m - k0)),
+    ),
+    "operator": (
+        ("sol_u", "normal", lambda c, m, k0, n_dil: (0, 1.6, m)),
+        ("ys_base", "normal", lambda c, m, k0, n_dil: (0, 0.8, m)),
+        ("torque_base", "normal", lambda c, m, k0, n_dil: (0, c.torque_noise_kNm, m)),
+        ("qo", "normal", lambda c, m, k0, n_dil: (0, 5.0, m)),
+        ("ys", "normal", lambda c, m, k0, n_dil: (0, 0.6, m)),
+        ("torque", "normal", lambda c, m, k0, n_dil: (0, c.torque_noise_kNm, m)),
+    ),
+    "turbidity": (
+        ("base_turb", "uniform", lambda c, m, k0, n_dil: (c.base_turb_min, c.base_turb_max, m)),
+        ("turb_noise", "normal", lambda c, m, k0, n_dil: (0, 3.0, m)),
+    ),
+}
+# upstream pulp feed streams: with shared_feed only unit 0's are drawn
+SHARED_FEED_STREAMS: Tuple[str, ...] = ("qf_rw", "qf_noise", "solf_noise")
+NOISE_THREADS = 8
+NOISE_THREAD_MIN_ROWS = 8192       # K * chunk rows below which a chunk's draws run inline
 
-    # Pesos: fines=0.22, load=0.24, var=0.13, uf=0.31, floc=0.10  (suma=1.0)
-    w = np.array([0.22, 0.24, 0.13, 0.31, 0.10])
-    stress = w[0] * fines_c + w[1] * load_c + w[2] * var_c + w[3] * uf_c + w[4] * floc_c
-    stress += np.where(regime == "CLAY", 0.01 * fines_c, 0.0)  # reducido: pH ya captura CLAY
-    stress += np.where(regime == "UF", 0.03 * uf_c, 0.0)
-    stress = np.clip(stress, 0.0, 1.0)
 
-    lag6 = np.roll(stress, 6); lag6[:6] = lag6[6]
-    lag12 = np.roll(stress, 12); lag12[:12] = lag12[12]
-    stress_term = np.clip(0.65 * lag6 + 0.35 * lag12, 0.0, 1.0)
-    effective = np.clip((stress_term - cfg.deadband) / (1.0 - cfg.deadband), 0.0, 1.0)
+@dataclass(frozen=True)
+class SimPlan:
+    """
+    Scalar draws of one realization (campaign segments, initial values).
+
+    Schedules are (start, end) row ranges, end exclusive. What-ifs edit a plan with
+    dataclasses.replace (e.g. move a dilution event) and re-simulate it with resume();
+    uf_actions are extra Qu setpoint offsets (m3/h) on top of the operator's own.
+    """
+
+    n: int
+    qf_base: float
+    dilution: Tuple[Tuple[int, int, float], ...]       # (start, end, factor)
+    clay_targets: Tuple[float, float, float]            # (NORMAL, CLAY, other)
+    pH_base_normal: float
+    uf_dropouts: Tuple[Tuple[int, int, float], ...]     # (start, end, capacity)
+    bed0: float
+    uf_actions: Tuple[Tuple[int, int, float], ...] = ()     # (start, end, Qu setpoint offset)
+
+
+def make_plan(cfg: SimConfig) -> SimPlan:
+    rng = np.random.default_rng(seed_tree(cfg.seed)["plan"])
+    n = n_points(cfg)
+
+    qf_base = float(rng.uniform(450, 650))
+
+    clay_rows = _regime_intervals(cfg, n, "CLAY")
+    n_clay = sum(b - a for a, b in clay_rows)
+    dilution = []
+    for _ in range(int(cfg.feed_dilution_events_per_30d * (cfg.days / 30.0))):
+        on_clay = rng.random() < 0.75
+        n_candidates = n_clay if on_clay else n
+        if n_candidates == 0:
+            continue
+        k = int(rng.integers(0, n_candidates))
+        start = _nth_row(clay_rows, k) if on_clay else k
+        dur_min = rng.integers(cfg.feed_dilution_duration_min[0], cfg.feed_dilution_duration_min[1] + 1)
+        dur = max(1, int(dur_min * 60 / step_seconds(cfg)))
+        factor = rng.uniform(cfg.feed_dilution_factor_range[0], cfg.feed_dilution_factor_range[1])
+        dilution.append((start, min(n, start + dur), float(factor)))
 
-    base_turb = rng.uniform(cfg.base_turb_min, cfg.base_turb_max, size=n)
-    noise = rng.normal(0, 3.0, n)
+    clay_targets = (float(rng.uniform(1.0, 4.0)), float(rng.uniform(6.0, 10.0)), float(rng.uniform(2.0, 6.0)))
+    pH_base_normal = float(rng.uniform(8.8, 9.3))
 
-    def turb_with_scale(scale: float) -> np.ndarray:
-        t = base_turb + scale * (effective ** cfg.turb_power) + carryover_penalty + noise
-        return np.clip(t, 5.0, cfg.turb_max)
+    uf_rows = _regime_intervals(cfg, n, "UF")
+    n_uf = sum(b - a for a, b in uf_rows)
+    dropouts = []
+    if n_uf:
+        points_per_hour = 3600 // step_seconds(cfg)
+        total_uf_days = sum(dur for _, dur in cfg.uf_episodes)
+        for _ in range(int(total_uf_days * 3.0)):
+            start = _nth_row(uf_rows, int(rng.integers(0, n_uf)))   # solo índices UF reales
+            duration = int(rng.integers(2 * points_per_hour, 4 * points_per_hour + 1))
+            cap = rng.uniform(0.70, 0.92)
+            dropouts.append((start, min(n, start + duration), float(cap)))
+
+    bed0 = float(rng.uniform(1.0, 2.0))
+    return SimPlan(n, qf_base, tuple(dilution), clay_targets, pH_base_normal, tuple(dropouts), bed0)
+
+
+# Simulator stages in execution order, with the SimConfig fields each one reads (the seed
+# is always part of the key). A stage's cache key chains the key of the stage before
+# it, so a change invalidates that stage and everything downstream only.
+# Bump SIM_STAGE_VERSION when stage code changes.
+SIM_STAGE_VERSION = 4
+SIM_STAGES: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("feed", ("days", "freq_min", "step_s", "clay_episodes", "uf_episodes", "feed_dilution_events_per_30d",
+              "feed_dilution_duration_min", "feed_dilution_factor_range", "feedwell_solids_target_range_pct")),
+    ("latent", ("clay_pct_min", "clay_pct_max", "norm_mode", "norm_warmup_days", "norm_refresh_points")),
+    ("ph_floc", ()),
+    ("uf_bed", ()),
+    ("operator", ("ys_limit_Pa", "torque_rated_kNm", "torque_clip_kNm", "torque_noise_kNm",
+                  "qu_setpoint_step", "qu_setpoint_clip", "manual_enter_gain", "manual_exit_base")),
+    ("turbidity", ("deadband", "turb_power", "stress_weights", "base_turb_min", "base_turb_max", "turb_max",
+                   "carryover_gain_NTU", "event_limit_NTU", "sustain_points", "target_event_rate", "target_tolerance", "scale_search_hi",
+                   "turb_scale")),
+    ("labels", ("event_type_override_th_uf",)),
+)
+
+
+class _NeedRefs(Exception):
+    """A reference pass fed this chunk to the collectors it still needs and stopped."""
+
+
+# Fields that fix the row grid and window lengths; every unit of a fleet shares them.
+FLEET_SHARED_FIELDS: Tuple[str, ...] = (
+    "days", "freq_min", "step_s", "sustain_points", "horizon_points", "norm_mode", "norm_warmup_days", "norm_refresh_points",
+)
+NORM_MODES: Tuple[str, ...] = ("exact", "warmup", "running")
+
+
+class _Engine:
+    """
+    simulate_clean as a row-range state machine over K units.
+
+    rows(i1) computes rows [i, i1) and carries every recursion (random walk, AR(1)
+    drivers, bed integrator, operator mode / setpoint), the rolling-window halos and the
+    noise streams to the next call. The only whole-series quantities are the references:
+    1st/99th percentiles of the normalized series and the calibrated turbidity scale,
+    taken over the first n_ref rows (all n, or the warmup; SimConfig.norm_mode).
+    Missing references are fed to TailCollectors; with inline=True (a single rows(n)
+    call) they are resolved on the spot, otherwise rows() raises _NeedRefs and the
+    caller resolves them with finalize() after a pass over the first n_ref rows. In
+    "running" mode the percentiles then follow per-unit LogQuantileSketches, carried
+    like every other state.
+
+    Every series is a (K, m) array, one row per unit (K = 1 for simulate_clean). Each
+    unit has its own SimConfig, plan, noise streams and references, so unit k of a
+    fleet is exactly simulate_clean(cfgs[k]); with shared_feed=True all units receive
+    unit 0's pulp feed (flow and solids) instead of their own.
+
+    rows() draws the chunk's noise of every stage up front (STAGE_NOISE, one thread per
+    stream), then runs the SIM_STAGES methods in order; with a StageCache (inline only)
+    each stage's outputs are loaded from / saved to the cache instead of recomputed.
+    """
+
+    def __init__(
+        self,
+        cfgs: Sequence[SimConfig],
+        plans: Sequence[SimPlan],
+        refs: dict,
+        inline: bool = False,
+        cache: StageCache | None = None,
+        shared_feed: bool = False,
+    ):
+        if cache is not None and not inline:
+            raise ValueError("stage caching needs the whole horizon in one rows() call (inline=True)")
+        for field in FLEET_SHARED_FIELDS:
+            if len({getattr(c, field) for c in cfgs}) > 1:
+                raise ValueError(f"all units must share SimConfig.{field}")
+        if cfgs[0].norm_mode not in NORM_MODES:
+            raise ValueError(f"norm_mode must be one of {NORM_MODES}, got {cfgs[0].norm_mode!r}")
+        self.cfgs, self.plans, self.refs, self.inline, self.cache = list(cfgs), list(plans), refs, inline, cache
+        self.shared_feed = shared_feed
+        self.cfg = self.cfgs[0]             # row grid / window fields (FLEET_SHARED_FIELDS)
+        self.K = len(self.cfgs)
+        self.R = grid_rows(self.cfg)        # rows per freq_min point
+        self.dt = 1.0 / self.R              # internal step, in freq_min points
+        self.ar = {name: ar1_driver(self.cfg, name) for name in AR1_DRIVERS}
+        self.n = self.plans[0].n
+        self.n_ref = self.n if self.cfg.norm_mode == "exact" else min(day_to_idx(self.cfg.norm_warmup_days, self.cfg), self.n)
+        if self.cfg.norm_mode != "exact" and self.cfg.clay_episodes:
+            clay_end = min(start + dur for start, dur in self.cfg.clay_episodes)
+            if self.cfg.norm_warmup_days < min(clay_end, self.cfg.days):
+                warnings.warn(f"norm_warmup_days={self.cfg.norm_warmup_days} ends before the first clay campaign "
+                              f"(day {clay_end}): Clay_idx references miss it and saturate", stacklevel=2)
+        self.i = self.i0 = 0
+        self.noise = [noise_streams(c.seed) for c in self.cfgs]
+        self.rng_op = [np.random.default_rng(seed_tree(c.seed)["operator"]) for c in self.cfgs]
+        self.collectors: Dict[str, list] = {}
+        self.calib: dict = {}
+        self.t_eval = 0.0
+
+        self.qf_rw = np.zeros(1 if shared_feed else self.K)
+        self.clay_ar = self.psd_ar = None
+        self.ph_ar = [AR1State(self.ar["ph"][0], p.pH_base_normal) for p in self.plans]
+        self.bed = np.array([p.bed0 for p in self.plans])
+        self.manual = np.zeros(self.K, dtype=bool)
+        self.sp_delta, self.sp_fill = np.zeros(self.K), np.zeros(self.K)
+        self.op_draws = [np.empty(0) for _ in range(self.K)]
+        self.halo: Dict[str, np.ndarray] = {}
+        self.sketches: Dict[str, list] = {}
+        self.bounds: Dict[str, np.ndarray] = {}
+        self.x: dict = {}
+
+    def _p(self, field: str) -> np.ndarray:
+        # per-unit SimConfig field as a (K, 1) column
+        return np.array([getattr(c, field) for c in self.cfgs], dtype=float)[:, None]
+
+    def _draw_noise(self, stages: Sequence[str], x: dict) -> Dict[str, list]:
+        """
+        This chunk's draws of every stream the given stages read: stream -> one array
+        per unit (unit 0 only for shared feed streams). One thread per stream.
+        """
+        m, k0 = x["m"], x["k0"]
+        n_dil = x["FeedDilution_On"].sum(axis=1)
+
+        def draw(stream: str, method: str, args) -> list:
+            units = range(1) if self.shared_feed and stream in SHARED_FEED_STREAMS else range(self.K)
+            return [getattr(self.noise[u][stream], method)(*args(self.cfgs[u], m, k0, int(n_dil[u]))) for u in units]
+
+        specs = [spec for stage in stages for spec in STAGE_NOISE.get(stage, ())]
+        if not specs or self.K * m < NOISE_THREAD_MIN_ROWS:
+            # nothing to draw (cached stages), or thread start-up would cost more than the draws; the order does not matter
+            return {spec[0]: draw(*spec) for spec in specs}
+        with ThreadPoolExecutor(max_workers=min(len(specs), NOISE_THREADS)) as pool:
+            futures = {spec[0]: pool.submit(draw, *spec) for spec in specs}
+            return {stream: fut.result() for stream, fut in futures.items()}
+
+    # ------------------ checkpoints ------------------
+    def snapshot(self) -> tuple[dict, Dict[str, np.ndarray]]:
+        """
+        Carried state at row self.i as (JSON-able scalars, arrays): noise generator
+        states, AR(1) / bed / random-walk carries, operator mode / setpoint / pending
+        draws and the rolling-window halos. References are not included.
+        """
+        def ar(states):
+            return None if states is None else [[st.a, st.s, st.S, st.k] for st in states]
+
+        meta = {
+            "row": self.i,
+            "noise": [{name: g.bit_generator.state for name, g in nz.items()} for nz in self.noise],
+            "rng_op": [g.bit_generator.state for g in self.rng_op],
+            "qf_rw": self.qf_rw.tolist(),
+            "ar": {"clay": ar(self.clay_ar), "psd": ar(self.psd_ar), "ph": ar(self.ph_ar)},
+            "bed": self.bed.tolist(),
+            "manual": self.manual.tolist(),
+            "sp_delta": self.sp_delta.tolist(),
+            "sp_fill": self.sp_fill.tolist(),
+        }
+        arrays = {f"halo:{key}": h for key, h in self.halo.items()}
+        arrays.update({f"op_draws:{u}": d for u, d in enumerate(self.op_draws)})
+        arrays.update({f"bounds:{key}": b for key, b in self.bounds.items()})
+        for key, sketches in self.sketches.items():
+            states = [sk.state() for sk in sketches]
+            arrays.update({f"sketch:{key}:{part}": np.stack([st[part] for st in states]) for part in states[0]})
+        return meta, arrays
+
+    def restore(self, meta: dict, arrays: Dict[str, np.ndarray]) -> None:
+        """Continue from a snapshot(): the next rows() call starts at meta["row"]."""
+        def ar(states):
+            return None if states is None else [AR1State(a, s, S, int(k)) for a, s, S, k in states]
+
+        self.i = int(meta["row"])
+        for nz, states in zip(self.noise, meta["noise"]):
+            for name, state in states.items():
+                nz[name].bit_generator.state = state
+        for g, state in zip(self.rng_op, meta["rng_op"]):
+            g.bit_generator.state = state
+        self.qf_rw = np.array(meta["qf_rw"], dtype=float)
+        self.clay_ar, self.psd_ar, self.ph_ar = (ar(meta["ar"][k]) for k in ("clay", "psd", "ph"))
+        self.bed = np.array(meta["bed"], dtype=float)
+        self.manual = np.array(meta["manual"], dtype=bool)
+        self.sp_delta = np.array(meta["sp_delta"], dtype=float)
+        self.sp_fill = np.array(meta["sp_fill"], dtype=float)
+        self.halo = {k.split(":", 1)[1]: v for k, v in arrays.items() if k.startswith("halo:")}
+        self.op_draws = [arrays[f"op_draws:{u}"] for u in range(self.K)]
+        self.bounds = {k.split(":", 1)[1]: v.copy() for k, v in arrays.items() if k.startswith("bounds:")}
+        self.sketches = {
+            key: [
+                LogQuantileSketch.from_state({part: arrays[f"sketch:{key}:{part}"][u] for part in ("counts", "offset", "zeros")})
+                for u in range(self.K)
+            ]
+            for key in {k.split(":")[1] for k in arrays if k.startswith("sketch:")}
+        }
 
-    lo, hi = 0.0, float(cfg.scale_search_hi)
-    best_scale = 0.0
-    for _ in range(26):
-        mid = (lo + hi) / 2.0
-        t = turb_with_scale(mid)
-        ev = sustained_above(t, cfg.event_limit_NTU, cfg.sustain_points).astype(int)
-        rate = float(ev.mean())
-        best_scale = mid
-        if abs(rate - cfg.target_event_rate) <= cfg.target_tolerance:
-            break
-        if rate < cfg.target_event_rate:
-            lo = mid
+    def reseed(self, keys: Sequence[int]) -> None:
+        """
+        Fresh noise from row self.i on: unit u draws from SeedSequence(seed, spawn_key=
+        (self.i, keys[u])), so units sharing a key share their future noise.
+        """
+        for u, (cfg, key) in enumerate(zip(self.cfgs, keys)):
+            self.noise[u] = noise_streams(cfg.seed, spawn_key=(self.i, int(key)))
+            self.rng_op[u] = np.random.default_rng(seed_tree(cfg.seed, spawn_key=(self.i, int(key)))["operator"])
+            self.op_draws[u] = np.empty(0)
+
+    # ------------------ references ------------------
+    def _resolve(self) -> None:
+        if not self.inline:
+            raise _NeedRefs
+        self.finalize()
+
+    def finalize(self) -> None:
+        """Turn the collected tails into references."""
+        for key, cols in self.collectors.items():
+            if key == "scale":
+                t0 = time.perf_counter()
+                found = [bisect_turb_scale(col.low, self.n_ref, cfg) if cfg.turb_scale is None else (cfg.turb_scale, 0)
+                         for col, cfg in zip(cols, self.cfgs)]
+                self.refs[key] = np.array([scale for scale, _ in found])
+                self.calib = {
+                    "scale_search_iters": np.array([iters for _, iters in found]),
+                    "scale_search_s": time.perf_counter() - t0,
+                }
+            else:
+                self.refs[key] = (
+                    np.array([col.percentile(1) for col in cols]),
+                    np.array([col.percentile(99) for col in cols]),
+                )
+        self.collectors.clear()
+
+    def _ref_rows(self, x: np.ndarray) -> np.ndarray:
+        # the part of this chunk's (K, m) series that lies inside the reference rows
+        return x[:, :max(0, min(self.n_ref - self.i0, x.shape[1]))]
+
+    def _normalize(self, **series: np.ndarray) -> list:
+        # scale_01 against each unit's 1st/99th percentiles of the reference rows
+        missing = [key for key in series if key not in self.refs]
+        if missing:
+            size = tail_size(1, self.n_ref)
+            for key in missing:
+                cols = self.collectors.setdefault(key, [TailCollector(size, size) for _ in range(self.K)])
+                for col, row in zip(cols, self._ref_rows(series[key])):
+                    col.update(row)
+            self._resolve()
+        out = []
+        for key, x in series.items():
+            if self.cfg.norm_mode == "running":
+                out.append(self._normalize_running(key, x))
+                continue
+            lo, hi = self.refs[key]
+            out.append(np.stack([scale_01(row, a, b) for row, a, b in zip(x, lo, hi)]))
+        return out
+
+    def _normalize_running(self, key: str, x: np.ndarray) -> np.ndarray:
+        # Rows before the first refresh row >= n_ref use the warmup references; every
+        # norm_refresh_points grid points (r % every == 0, r >= n_ref) the bounds become the
+        # sketch percentiles of rows [0, r). The grid is fixed, so any chunking gives the same rows.
+        every = self.cfg.norm_refresh_points * self.R
+        sketches = self.sketches.setdefault(key, [LogQuantileSketch() for _ in range(self.K)])
+        bounds = self.bounds.setdefault(key, np.stack(self.refs[key], axis=1))
+        i0, m = self.i0, x.shape[1]
+        first = max(-(-i0 // every), -(-self.n_ref // every)) * every
+        cuts = [0, *(r - i0 for r in range(first, i0 + m, every)), m]
+        out = np.empty_like(x)
+        for a, b in zip(cuts[:-1], cuts[1:]):
+            if a < b and i0 + a >= first:
+                bounds[:] = [[sk.percentile(1), sk.percentile(99)] for sk in sketches]
+            out[:, a:b] = np.stack([scale_01(row, lo, hi) for row, (lo, hi) in zip(x[:, a:b], bounds)])
+            for sk, row in zip(sketches, x[:, a:b]):
+                sk.update(row)
+        return out
+
+    def _turb_scale(self, w: np.ndarray) -> np.ndarray:
+        if "scale" not in self.refs and all(cfg.turb_scale is not None for cfg in self.cfgs):
+            self.refs["scale"] = np.array([float(cfg.turb_scale) for cfg in self.cfgs])
+        if "scale" not in self.refs:
+            cols = self.collectors.setdefault(
+                "scale", [TailCollector(k_low=scale_tail_size(cfg, self.n_ref)) for cfg in self.cfgs]
+            )
+            for col, row in zip(cols, self._ref_rows(w)):
+                col.update(row)
+            self._resolve()
+        return self.refs["scale"]
+
+    # ------------------ window state ------------------
+    def _with_halo(self, key: str, x: np.ndarray, size: int, pad) -> np.ndarray:
+        # x preceded by the previous `size` values of the same series (pad before row 0;
+        # a scalar or one value per unit)
+        prev = self.halo.get(key)
+        if prev is None:
+            prev = np.empty((self.K, size))
+            prev[:] = np.asarray(pad, dtype=float).reshape(-1, 1)
+        xh = np.concatenate([prev, x], axis=1)
+        self.halo[key] = xh[:, xh.shape[1] - size:]
+        return xh
+
+    def _rolling(self, key: str, x: np.ndarray, window: int, std: bool = False) -> np.ndarray:
+        if window <= LOCAL_WINDOW_MAX:
+            out = rolling_window(self._with_halo(key, x, window - 1, np.nan), window, std=std)
         else:
-            hi = mid
+            # the halo reaches back to the start of the block before row i0's block
+            B = sum_block(window)
+            back = self.i0 % B + B
+            xh = self._with_halo(key, x, 2 * B - 1, np.nan)[:, 2 * B - 1 - back:]
+            out = rolling_aligned(xh, window, std=std, min_periods=max(3, window // 5))[:, back - B:]
+        return _bfill(out, 0.0 if std else x[:, 0])
+
+    # ------------------ rows ------------------
+    def rows(self, i1: int) -> dict:
+        """Columns for rows [i, i1): (K, m) arrays, plus the shared timestamp index."""
+        cfg = self.cfg
+        i0, self.i = self.i, i1
+        self.i0 = i0
+        m = i1 - i0
+        x = {
+            "i0": i0, "i1": i1, "m": m,
+            "k0": 1 if i0 == 0 else 0,      # row 0 holds initial values of the recursions
+            "regime": np.stack([_regime_rows(c, i0, i1) for c in self.cfgs]),
+        }
 
-    turb_clean = turb_with_scale(float(best_scale))
-    event_now = sustained_above(turb_clean, cfg.event_limit_NTU, cfg.sustain_points).astype(int)
+        x.update(self._dilution(i0, i1))
+
+        keys: Dict[str, str] = {}
+        loaded: Dict[str, dict | None] = {}
+        if self.cache is not None:
+            key = None
+            for stage, keyed in SIM_STAGES:
+                params = {"seed": [c.seed for c in self.cfgs], **{f: [getattr(c, f) for c in self.cfgs] for f in keyed}}
+                if stage == "feed":
+                    params["shared_feed"] = self.shared_feed
+                key = keys[stage] = self.cache.key(stage, SIM_STAGE_VERSION, params, parent=key)
+                loaded[stage] = self.cache.load(stage, key)
+
+        # noise of every stage that runs, drawn concurrently; then the stages in order
+        x["noise"] = self._draw_noise([stage for stage, _ in SIM_STAGES if loaded.get(stage) is None], x)
+        for stage, _ in SIM_STAGES:
+            out = loaded.get(stage)
+            if out is None:
+                out = getattr(self, f"_{stage}")(x)
+                if self.cache is not None:
+                    self.cache.save(stage, keys[stage], out)
+            x.update(out)
+        del x["noise"]
+        self.x = x
+
+        step = step_seconds(cfg)
+        index = pd.date_range(
+            pd.Timestamp("2026-01-01") + pd.Timedelta(seconds=step * i0),
+            periods=m,
+            freq=f"{step}s",
+        )
+        return {
+            "timestamp": index,
+            "Qf_pulp_m3h": x["Qf_pulp"],
+            "Qf_dilution_m3h": x["Qf_dilution"],
+            "Qf_total_m3h": x["Qf_total"],
+            "Qf_m3h": x["Qf_total"],
+            "Solids_f_pct": x["Sol_f"],
+            "Feedwell_Solids_pct": x["Feedwell_Solids_pct"],
+            "FeedDilution_On": x["FeedDilution_On"],
+            "FeedDilution_factor": x["FeedDilution_factor"],
+            "PSD_fines_idx": x["PSD"],
+            "Clay_pct": x["Clay_pct"],
+            "Clay_idx": x["Clay_idx"],
+            "Floc_gpt": x["Floc_gpt"],
+            "pH_clean": x["pH_clean"],          # ground truth (como Overflow_Turb_NTU_clean)
+            "pH_feed": x["pH_clean"],           # medido; inject_failures agrega fallas de electrodo
+            "Floc_effectiveness": x["floc_effectiveness"],  # latente — no usar como feature
+            "UF_capacity_factor": x["UF_capacity"],
+            "Qu_base_m3h": x["Qu_base"],
+            "Qu_sp_delta_m3h": x["Qu_sp_delta"],
+            "Qu_m3h": x["Qu"],
+            "Qo_m3h": x["Qo"],              # flujo de overflow (balance volumétrico)
+            "Solids_u_pct": x["Sol_u"],
+            "BedLevel_m": x["bed"],
+            "UF_YieldStress_Pa": x["UF_YieldStress_Pa"],
+            "Bogging_factor": x["Bogging_factor"],
+            "RakeTorque_kNm": x["RakeTorque_kNm"],
+            "RakeTorque_pct": x["RakeTorque_pct"],
+            "Overflow_Turb_NTU_clean": x["turb_clean"],
+            "Overflow_Turb_NTU": x["turb_clean"],
+            "ControlMode": x["ControlMode"],
+            "OperatorAction": x["OperatorAction"],
+            "RecommendedAction": x["action_code"],      # codes into PLAYBOOK_RULES (see _unit_columns)
+            "ExpectedTradeoff": x["action_code"],
+            "ActionScore_turb": x["ActionScore_turb"],
+            "ActionScore_torque": x["ActionScore_torque"],
+            "WaterRecovery_proxy": x["WaterRecovery_proxy"],
+            "spec_limit_NTU": np.broadcast_to(self._p("spec_limit_NTU"), (self.K, m)),
+            "event_limit_NTU": np.broadcast_to(self._p("event_limit_NTU"), (self.K, m)),
+            "event_now": x["event_now"],
+            "event_type_raw": x["event_type_raw"],
+            "event_type": x["event_type"],
+            "Regime": x["regime"],
+        }
 
-    # ------------------ Diagnosis / event typing (CLAY vs UF) ------------------
-    dominant_raw = np.array(["CLAY", "UF"], dtype=object)[
-        np.argmax(np.vstack([fines_c, uf_c]).T, axis=1)
-    ]
-    event_type_raw = np.array(["NONE"] * n, dtype=object)
-    event_type_raw[event_now == 1] = dominant_raw[event_now == 1]
+    def _dilution(self, i0: int, i1: int) -> dict:
+        # planned dilution schedule of rows [i0, i1) (no draws; feed noise sizes depend on it)
+        FeedDilution_On = np.zeros((self.K, i1 - i0), dtype=int)
+        FeedDilution_factor = np.ones((self.K, i1 - i0), dtype=float)
+        for u, plan in enumerate(self.plans):
+            for start, end, factor in plan.dilution:
+                a, b = max(start, i0) - i0, min(end, i1) - i0
+                if a < b:
+                    FeedDilution_On[u, a:b] = 1
+                    FeedDilution_factor[u, a:b] = factor
+        return {"FeedDilution_On": FeedDilution_On, "FeedDilution_factor": FeedDilution_factor}
+
+    def _feed(self, x: dict) -> dict:
+        cfg, K, noise = self.cfg, self.K, x["noise"]
+        n, i0, i1, m = self.n, x["i0"], x["i1"], x["m"]
+        FeedDilution_On, FeedDilution_factor = x["FeedDilution_On"], x["FeedDilution_factor"]
+
+        # ------------------ Feed (pulp) + dilution schedule ------------------
+        # shared_feed: one upstream pulp feed (unit 0's draws) reaches every unit
+        qf_base = np.array([p.qf_base for p in self.plans[:len(noise["qf_rw"])]])[:, None]
+
+        diurnal = 80 * np.sin(_linspace_rows(2 * np.pi * cfg.days, n, i0, i1))
+        steps = np.stack(noise["qf_rw"]) * np.sqrt(self.dt)      # random walk: variance per point
+        qf_rw = np.cumsum(np.concatenate([self.qf_rw[:, None], steps], axis=1), axis=1)[:, 1:]
+        self.qf_rw = qf_rw[:, -1].copy()
+        Qf_pulp = np.clip(qf_base + diurnal + qf_rw + np.stack(noise["qf_noise"]), 250, 900)
+
+        Sol_f_base = 32.0 + 3.0 * np.sin(_linspace_rows(4 * np.pi * cfg.days, n, i0, i1))
+        Sol_f_base = Sol_f_base + 0.003 * (Qf_pulp - 550)
+        Sol_f_base += np.stack(noise["solf_noise"])
+        Sol_f_base = np.clip(Sol_f_base, 20, 45)
+        Qf_pulp, Sol_f_base = (np.broadcast_to(a, (K, m)).copy() for a in (Qf_pulp, Sol_f_base))
+
+        Qf_dilution = np.zeros((K, m), dtype=float)
+        mask_dil = FeedDilution_On.astype(bool)
+        Qf_dilution[mask_dil] = Qf_pulp[mask_dil] * (1.0 / FeedDilution_factor[mask_dil] - 1.0)
+
+        Qf_total = Qf_pulp + Qf_dilution
+        Ms = Qf_pulp * (Sol_f_base / 100.0)
+        Sol_f = np.clip(100.0 * Ms / np.maximum(Qf_total, 1e-6), 18, 45)
+
+        # feedwell solids (draw counts depend on each unit's dilution mask)
+        Feedwell_Solids_pct = Sol_f.copy()
+        for u in range(K):
+            dil, fw = mask_dil[u], Feedwell_Solids_pct[u]
+            fw[dil] = noise["fw_target"][u][dil] + noise["fw_noise_dil"][u]
+            fw[~dil] = Sol_f[u, ~dil] + noise["fw_noise_feed"][u]
+        Feedwell_Solids_pct = np.clip(Feedwell_Solids_pct, 8.0, 45.0)
+
+        return {
+            "Qf_pulp": Qf_pulp, "Qf_dilution": Qf_dilution, "Qf_total": Qf_total, "Sol_f": Sol_f,
+            "Feedwell_Solids_pct": Feedwell_Solids_pct,
+        }
 
-    event_type = event_type_raw.copy()
-    ev_mask = (event_now == 1)
+    def _latent(self, x: dict) -> dict:
+        regime, noise = x["regime"], x["noise"]
 
-    uf_override = ev_mask & (regime == "UF") & (uf_c > cfg.event_type_override_th_uf)
-    event_type[uf_override] = "UF"
+        # ------------------ Latent drivers ------------------
+        clay_target_normal, clay_target_clay, clay_target_other = (
+            np.array(t)[:, None] for t in zip(*(p.clay_targets for p in self.plans))
+        )
 
-    # ------------------ Playbook recommendation (heuristic) ------------------
-    # Provide a recommended action and a simple trade-off annotation.
-    RecommendedAction = np.array(["NONE"] * n, dtype=object)
-    ExpectedTradeoff = np.array([""] * n, dtype=object)
-    ActionScore_turb = np.zeros(n, dtype=float)
-    ActionScore_torque = np.zeros(n, dtype=float)
+        # Per-regime target tables (CLAY / NORMAL / other=UF).
+        is_clay, is_normal = (regime == "CLAY"), (regime == "NORMAL")
+        clay_mu = np.where(is_clay, clay_target_clay, np.where(is_normal, clay_target_normal, clay_target_other))
+        clay_sd = np.where(is_clay, 0.6, np.where(is_normal, 0.4, 0.5))
+        psd_lo = np.where(is_clay, 0.55, np.where(is_normal, 0.10, 0.15))
+        psd_hi = np.where(is_clay, 0.80, np.where(is_normal, 0.30, 0.40))
+
+        # x[i] = a * x[i-1] + w * target[i] + eps[i], started at the first target (AR1_DRIVERS)
+        a_clay, w_clay, g_clay, f_clay = self.ar["clay"]
+        a_psd, w_psd, g_psd, f_psd = self.ar["psd"]
+        clay_target = clay_mu + (clay_sd * g_clay) * np.stack(noise["clay_z"])
+        psd_target = psd_lo + (psd_hi - psd_lo) * np.stack(noise["psd_u"])
+        if g_psd != 1.0:
+            psd_mid = 0.5 * (psd_lo + psd_hi)
+            psd_target = psd_mid + g_psd * (psd_target - psd_mid)
+        clay_eps = np.stack(noise["clay_eps"]) * f_clay
+        psd_eps = np.stack(noise["psd_eps"]) * f_psd
+
+        if self.clay_ar is None:
+            self.clay_ar = [AR1State(a_clay, float(t)) for t in clay_target[:, 0]]
+            self.psd_ar = [AR1State(a_psd, float(t)) for t in psd_target[:, 0]]
+        u_clay, u_psd = w_clay * clay_target + clay_eps, w_psd * psd_target + psd_eps
+        Clay_pct = np.stack([ar1_step(u, st) for u, st in zip(u_clay, self.clay_ar)])
+        PSD = np.stack([ar1_step(u, st) for u, st in zip(u_psd, self.psd_ar)])
+
+        Clay_pct = np.clip(Clay_pct, self._p("clay_pct_min"), self._p("clay_pct_max"))
+        PSD = np.clip(PSD, 0.05, 0.85)
+        solids_load = x["Qf_total"] * (x["Sol_f"] / 100.0)
+        Clay_idx, load_norm = self._normalize(clay=Clay_pct, load=solids_load)
+
+        return {"Clay_pct": Clay_pct, "Clay_idx": Clay_idx, "PSD": PSD, "load_norm": load_norm}
+
+    def _ph_floc(self, x: dict) -> dict:
+        m, k0, regime, noise = x["m"], x["k0"], x["regime"], x["noise"]
+        Clay_idx, PSD, load_norm = x["Clay_idx"], x["PSD"], x["load_norm"]
+
+        # ------------------ pH (causal: drive floc effectiveness → stress → turbidity) -----------
+        # Base: circuito alcalino post-flotación Cu/Mo (cal); óptimo PAM aniónico: 8–9
+        # CLAY: arcilla consume alcalinidad → pH sube a 9.5–10.5 (fuera del rango óptimo)
+        # Respuesta operador: aumentar dosis de floculante y/o ajustar dosificación de cal
+        _, w_ph, g_ph, f_ph = self.ar["ph"]
+        pH_base_normal  = np.array([p.pH_base_normal for p in self.plans])[:, None]
+        ph_uf_noise     = np.stack(noise["ph_uf"]) * g_ph
+        ph_normal_noise = np.stack(noise["ph_normal"]) * g_ph
+        pH_target = np.where(
+            regime == "CLAY",
+            pH_base_normal + 0.6 * Clay_idx + 0.4 * PSD,   # sube por encima del óptimo
+            np.where(regime == "UF", pH_base_normal + ph_uf_noise, pH_base_normal + ph_normal_noise),
+        )
+        pH_clean = np.empty((self.K, m))
+        pH_clean[:, :k0] = pH_base_normal
+        for u, st in enumerate(self.ph_ar):
+            pH_clean[u, k0:] = ar1_step(w_ph * pH_target[u, k0:] + noise["ph_ar"][u] * f_ph, st)
+        pH_clean = np.clip(pH_clean, 7.5, 12.0)
+
+        # Floc_effectiveness (latente): Gaussiana centrada en pH óptimo 8.5
+        # pH 8.5 → 1.00 | pH 9.5 → 0.88 | pH 10.5 → 0.61 | pH 11.0 → 0.46
+        pH_dev = np.abs(pH_clean - 8.5)
+        floc_effectiveness = np.clip(np.exp(-0.5 * (pH_dev / 1.0) ** 2), 0.3, 1.0)
+
+        # ------------------ Floc dose (process variable) ------------------------------------------
+        # pH > 9.0 → operador aumenta dosis o cambia polímero (hasta +6 g/t en episodio severo)
+        pH_off_optimal = np.clip(pH_clean - 9.0, 0.0, 3.0)
+        pH_floc_correction = 6.0 * (pH_off_optimal / 3.0)
+        floc_need = (
+            12 + 18 * PSD + 14 * load_norm + 10 * Clay_idx + pH_floc_correction
+            + np.stack(noise["floc_need"])
+        )
+        Floc_gpt = np.clip(floc_need + np.stack(noise["floc_dose"]), 5, 35)
+
+        return {"pH_clean": pH_clean, "floc_effectiveness": floc_effectiveness, "Floc_gpt": Floc_gpt}
+
+    def _uf_bed(self, x: dict) -> dict:
+        i0, i1, m, k0, noise = x["i0"], x["i1"], x["m"], x["k0"], x["noise"]
+        load_norm, PSD = x["load_norm"], x["PSD"]
+
+        # ------------------ UF capacity + base Qu ------------------
+        UF_capacity = np.ones((self.K, m))
+        for u, plan in enumerate(self.plans):
+            for start, end, cap in plan.uf_dropouts:
+                a, b = max(start, i0) - i0, min(end, i1) - i0
+                if a < b:
+                    UF_capacity[u, a:b] = np.minimum(UF_capacity[u, a:b], cap)
+
+        Qu_base = np.clip((0.35 * x["Qf_total"] + np.stack(noise["qu_base"])) * UF_capacity, 80, 450)
+
+        # ------------------ Bed dynamics (using Qu_base for first pass) ------------------
+        bed = np.empty((self.K, m))
+        bed[:, :k0] = np.array([p.bed0 for p in self.plans])[:, None]
+        # increments per freq_min point, scaled to the step (noise: variance per point)
+        dt = self.dt
+        load_effect = dt * (0.014 * (load_norm[:, k0:] - 0.5) + 0.018 * (PSD[:, k0:] - 0.3))
+        uf_effect = dt * (0.028 * ((1.0 - UF_capacity[:, k0:]) * 3.0))
+        drawdown = dt * (0.0010 * ((Qu_base[:, k0:] - 220) / 220.0))
+        bed_noise = np.stack(noise["bed"]) * np.sqrt(dt)
+        # bed[i] = clip(bed[i-1] + load_effect + uf_effect - drawdown + noise, 0.5, 3.5)
+        bed[:, k0:] = clipped_cumsum_units(self.bed, [load_effect, uf_effect, -drawdown, bed_noise], 0.5, 3.5)
+        self.bed = bed[:, -1].copy()
+
+        return {"UF_capacity": UF_capacity, "Qu_base": Qu_base, "bed": bed}
+
+    def _operator_draws(self, need: int) -> list:
+        # each unit's operator uniforms: carried-over draws first, topped up to `need`;
+        # Generator.random(size) yields the same doubles as successive random() calls
+        return [
+            np.concatenate([prev, rng.random(max(need - len(prev), 0))])
+            for prev, rng in zip(self.op_draws, self.rng_op)
+        ]
+
+    def _operator(self, x: dict) -> dict:
+        m, k0, regime, noise = x["m"], x["k0"], x["regime"], x["noise"]
+        PSD, Clay_idx, bed = x["PSD"], x["Clay_idx"], x["bed"]
+        UF_capacity, Qu_base = x["UF_capacity"], x["Qu_base"]
+
+        # ------------------ Underflow density (first pass) ------------------
+        Sol_u = 64.0 + 4.0 * (bed - 1.8) - 6.5 * (PSD - 0.25) - 0.006 * (Qu_base - 260)
+        Sol_u += np.stack(noise["sol_u"])
+        Sol_u += np.where(regime == "UF", -2.0 * (1.0 - UF_capacity) * 3.0, 0.0)
+        Sol_u += np.where(regime == "CLAY", -1.5 * PSD, 0.0)
+        Sol_u = np.clip(Sol_u, 50, 75)
+
+        # ------------------ Yield stress (truth) base ------------------
+        dens_term = np.exp(0.10 * (Sol_u - 60.0))
+        clay_amp = 1.0 + 2.5 * Clay_idx
+        fines_amp = 1.0 + 0.8 * np.clip(PSD - 0.25, 0.0, 0.6)
+
+        UF_YieldStress_Pa_base = 4.5 * dens_term * clay_amp * fines_amp + np.stack(noise["ys_base"])
+        UF_YieldStress_Pa_base = np.clip(UF_YieldStress_Pa_base, 0.5, 60.0)
+
+        # ------------------ Torque proxy base (truth) ------------------
+        # Torque increases with YS and bed; add mild clay bogging interaction.
+        ys = UF_YieldStress_Pa_base
+        ys_gate = np.clip((ys - self._p("ys_limit_Pa")) / 20.0, 0.0, 1.0)
+        Bogging_factor = 1.0 + 0.25 * Clay_idx * ys_gate
+
+        RakeTorque_kNm_base = (0.35 * ys + 2.0 * bed) * Bogging_factor + np.stack(noise["torque_base"])
+        RakeTorque_kNm_base = np.clip(RakeTorque_kNm_base, 0.0, self._p("torque_clip_kNm"))
+        RakeTorque_pct_base = 100.0 * RakeTorque_kNm_base / self._p("torque_rated_kNm")
+
+        # ------------------ Decide operator mode/actions (based on lagged observables) ------------------
+        # We use "observable" proxies to decide actions (no future info); truth for simplicity.
+        window = minutes_to_rows(self.cfg, OPERATOR_WINDOW_MIN)
+        bed_rm = self._rolling("bed", bed, window=window)
+        torque_rm = self._rolling("torque", RakeTorque_pct_base, window=window)
+
+        # per-row decision thresholds; only the mode / setpoint recursion runs row by row
+        manual_prob = np.clip(
+            0.08
+            + 0.18 * (torque_rm > 85)
+            + 0.15 * (bed_rm > 2.6)
+            + 0.10 * (regime == "UF"),
+            0.02, 0.75
+        )
+        p_enter = manual_prob * self._p("manual_enter_gain")            # AUTO -> MANUAL
+        calm = (torque_rm < 70) & (bed_rm < 2.2)
+        p_exit = self._p("manual_exit_base") + np.where(calm, 0.08, 0.0)  # MANUAL -> AUTO
+        # Action logic (bounded setpoints): INCREASE_UF when bed or torque is high
+        high = (bed_rm > 2.6) | (torque_rm > 90)
+
+        # the operator decides once per freq_min point (rows with i % R == 0, past row 0);
+        # the mode holds in between
+        first = (-x["i0"]) % self.R
+        dec = np.arange(first + self.R if first < k0 else first, m, self.R)
+        manual = np.zeros((self.K, m), dtype=bool)
+        Qu_sp_delta = np.zeros((self.K, m), dtype=float)
+        acted = np.zeros((self.K, m), dtype=bool)
+        held = np.full(m, -1)                   # last decision row at or before each row
+        held[dec] = dec
+        held = np.maximum.accumulate(held)
+        draws = self._operator_draws(2 * len(dec))
+        for u, cfg in enumerate(self.cfgs):
+            lo, hi = cfg.qu_setpoint_clip
+            before = bool(self.manual[u])
+            modes, deltas, acts, self.manual[u], self.sp_delta[u], used = _operator_recursion(
+                p_enter[u, dec].tolist(), p_exit[u, dec].tolist(), high[u, dec].tolist(), draws[u].tolist(),
+                before, float(self.sp_delta[u]), cfg.qu_setpoint_step, lo, hi,
+            )
+            manual[u, dec], Qu_sp_delta[u, dec], acted[u, dec] = modes, deltas, acts
+            if self.R > 1:
+                manual[u] = np.where(held >= 0, manual[u, np.maximum(held, 0)], before)
+            self.op_draws[u] = draws[u][used:]
+        ControlMode = np.array(["AUTO", "MANUAL"], dtype=object)[manual.astype(np.int8)]
+        OperatorAction = np.array(["NONE", "INCREASE_UF"], dtype=object)[acted.astype(np.int8)]
+
+        # forward-fill setpoints (piecewise constant), carrying the last one across chunks
+        Qu_sp_delta = _ffill_nonzero(np.concatenate([self.sp_fill[:, None], Qu_sp_delta], axis=1))[:, 1:]
+        self.sp_fill = Qu_sp_delta[:, -1].copy()
+
+        # planned actions (what-ifs / rollouts) add to the operator's setpoint
+        for u, (plan, cfg) in enumerate(zip(self.plans, self.cfgs)):
+            for start, end, offset in plan.uf_actions:
+                a, b = max(start, x["i0"]) - x["i0"], min(end, x["i1"]) - x["i0"]
+                if a < b:
+                    Qu_sp_delta[u, a:b] = np.clip(Qu_sp_delta[u, a:b] + offset, *cfg.qu_setpoint_clip)
+
+        # ------------------ Apply operator setpoints to manipulated variables ------------------
+        Qu = np.clip(Qu_base + Qu_sp_delta, 60, 500)
+
+        # Flujo de overflow: balance volumétrico + ruido de medición (~1% del rango típico)
+        Qo = np.clip(x["Qf_total"] - Qu + np.stack(noise["qo"]), 50.0, 800.0)
+
+        UF_YieldStress_Pa = 4.5 * dens_term * clay_amp * fines_amp + np.stack(noise["ys"])
+        UF_YieldStress_Pa = np.clip(UF_YieldStress_Pa, 0.5, 60.0)
+
+        # Recompute torque proxy with final YS (this is what operator sees)
+        ys = UF_YieldStress_Pa
+        ys_gate = np.clip((ys - self._p("ys_limit_Pa")) / 20.0, 0.0, 1.0)
+        Bogging_factor = 1.0 + 0.25 * Clay_idx * ys_gate
+        RakeTorque_kNm = (0.35 * ys + 2.0 * bed) * Bogging_factor + np.stack(noise["torque"])
+        RakeTorque_kNm = np.clip(RakeTorque_kNm, 0.0, self._p("torque_clip_kNm"))
+        RakeTorque_pct = 100.0 * RakeTorque_kNm / self._p("torque_rated_kNm")
+
+        return {
+            "Sol_u": Sol_u, "ControlMode": ControlMode, "OperatorAction": OperatorAction,
+            "Qu_sp_delta": Qu_sp_delta, "Qu": Qu, "Qo": Qo,
+            "UF_YieldStress_Pa": UF_YieldStress_Pa, "Bogging_factor": Bogging_factor,
+            "RakeTorque_kNm": RakeTorque_kNm, "RakeTorque_pct": RakeTorque_pct,
+        }
 
-    for i in range(n):
-        if turb_clean[i] < 60 and RakeTorque_pct[i] < 80 and bed[i] < 2.4:
-            continue
+    def _turbidity(self, x: dict) -> dict:
+        cfg, m, regime = self.cfg, x["m"], x["regime"]
+        Qu_sp_delta = x["Qu_sp_delta"]
+
+        # ------------------ Stress components for turbidity ------------------
+        window = minutes_to_rows(cfg, VARIABILITY_WINDOW_MIN)
+        qf_std = self._rolling("Qf_total", x["Qf_total"], window=window, std=True)
+        solf_std = self._rolling("Sol_f", x["Sol_f"], window=window, std=True)
+        fines_c, var_c, uf_c, floc_c = self._normalize(
+            fines=x["PSD"],
+            var=qf_std + solf_std,
+            uf=(1.0 - x["UF_capacity"]) + np.clip((220 - x["Qu"]) / 220.0, 0, 1),
+            floc=1.0 - x["floc_effectiveness"],  # 0 = floc OK; 1 = floc muy degradado (pH fuera de rango)
+        )
+        load_c = x["load_norm"]                   # same series and references as load_norm
+
+        # Carryover trade-off: pushing UF increases turbidity slightly
+        carryover_penalty = self._p("carryover_gain_NTU") * np.clip(Qu_sp_delta, 0.0, 200.0)
+
+        # Pesos (default): fines=0.22, load=0.24, var=0.13, uf=0.31, floc=0.10  (suma=1.0)
+        w = np.array([c.stress_weights for c in self.cfgs], dtype=float).T[:, :, None]   # (5, K, 1)
+        stress = w[0] * fines_c + w[1] * load_c + w[2] * var_c + w[3] * uf_c + w[4] * floc_c
+        stress += np.where(regime == "CLAY", 0.01 * fines_c, 0.0)  # reducido: pH ya captura CLAY
+        stress += np.where(regime == "UF", 0.03 * uf_c, 0.0)
+        stress = np.clip(stress, 0.0, 1.0)
+
+        # lags of 30 / 60 min (STRESS_LAGS_MIN); before row 0 the series is held at stress[0]
+        short, long = (minutes_to_rows(cfg, lag) for lag in STRESS_LAGS_MIN)
+        stress_h = self._with_halo("stress", stress, long, stress[:, 0])
+        lag_short, lag_long = stress_h[:, long - short:long - short + m], stress_h[:, :m]
+        stress_term = np.clip(0.65 * lag_short + 0.35 * lag_long, 0.0, 1.0)
+        deadband = self._p("deadband")
+        effective = np.clip((stress_term - deadband) / (1.0 - deadband), 0.0, 1.0)
+
+        base_turb = np.stack(x["noise"]["base_turb"])
+        noise = np.stack(x["noise"]["turb_noise"])
+
+        # Turbidity is monotone in scale: calibrate on per-window crossing scales, then
+        # evaluate turbidity and its labels once.
+        k = sustain_rows(cfg)
+        gain = effective ** self._p("turb_power")
+        offset = base_turb + carryover_penalty + noise
+        r = np.stack([crossing_scales(o, g, c) for o, g, c in zip(offset, gain, self.cfgs)])
+        r_h = self._with_halo("r", r, k - 1, np.inf)
+        scale = self._turb_scale(window_thresholds(r_h, k))
+
+        t_eval = time.perf_counter()
+        turb_clean = np.clip(base_turb + scale[:, None] * gain + carryover_penalty + noise, 5.0, self._p("turb_max"))
+        turb_h = self._with_halo("turb", turb_clean, k - 1, -np.inf)
+        event_now = np.stack([
+            sustained_above(t, c.event_limit_NTU, k)[k - 1:] for t, c in zip(turb_h, self.cfgs)
+        ]).astype(int)
+        self.t_eval += time.perf_counter() - t_eval
+
+        iters = self.calib.get("scale_search_iters", np.zeros(self.K, dtype=np.int64))
+        return {
+            "fines_c": fines_c, "uf_c": uf_c, "turb_clean": turb_clean, "event_now": event_now,
+            "scale": np.asarray(scale, dtype=np.float64), "scale_search_iters": np.asarray(iters, dtype=np.int64),
+        }
 
-        # if UF constrained -> recommend increase UF (trade-off carryover)
-        if (regime[i] == "UF") or (uf_c[i] > 0.60) or (bed[i] > 2.7):
-            RecommendedAction[i] = "INCREASE_UF_WATCH_CARRYOVER"
-            ExpectedTradeoff[i] = "↓bed/↓torque, possible ↑turbidity via carryover"
-            ActionScore_turb[i] = -0.2
-            ActionScore_torque[i] = +0.7
-        # if clay/fines high -> recommend dilution and floc optimization
-        elif (regime[i] == "CLAY") or (Clay_idx[i] > 0.65):
-            RecommendedAction[i] = "START_DILUTION_AND_OPTIMIZE_FLOC"
-            ExpectedTradeoff[i] = "↓YS/↓torque, likely ↓turbidity, but ↑water use"
-            ActionScore_turb[i] = +0.6
-            ActionScore_torque[i] = +0.5
-        else:
-            RecommendedAction[i] = "MONITOR_AND_TUNE"
-            ExpectedTradeoff[i] = "small adjustments"
-            ActionScore_turb[i] = +0.1
-            ActionScore_torque[i] = +0.1
-
-    # ------------------ Water recovery (fórmula corregida) -----------------------------------
-    # WR = fracción del agua de alimentación recuperada en el underflow (UF denso → más agua)
-    # Qw ≈ Qflow × (1 − Solids_pct/100) — aproximación válida para concentraciones < 70%
-    Qw_feed = Qf_total * (1.0 - Sol_f / 100.0)
-    Qw_uf   = Qu       * (1.0 - Sol_u / 100.0)
-    water_recovery_proxy = Qw_uf / np.maximum(Qw_feed, 1.0)
-    water_recovery_proxy = np.clip(water_recovery_proxy, 0.0, 1.0)
-
-    df = pd.DataFrame(
-        {
-            "timestamp": index,
-            "Qf_pulp_m3h": Qf_pulp,
-            "Qf_dilution_m3h": Qf_dilution,
-            "Qf_total_m3h": Qf_total,
-            "Qf_m3h": Qf_total,
-            "Solids_f_pct": Sol_f,
-            "Feedwell_Solids_pct": Feedwell_Solids_pct,
-            "FeedDilution_On": FeedDilution_On,
-            "FeedDilution_factor": FeedDilution_factor,
-            "PSD_fines_idx": PSD,
-            "Clay_pct": Clay_pct,
-            "Clay_idx": Clay_idx,
-            "Floc_gpt": Floc_gpt,
-            "pH_clean": pH_clean,          # ground truth (como Overflow_Turb_NTU_clean)
-            "pH_feed": pH_clean,           # medido; inject_failures agrega fallas de electrodo
-            "Floc_effectiveness": floc_effectiveness,  # latente — no usar como feature
-            "UF_capacity_factor": UF_capacity,
-            "Qu_base_m3h": Qu_base,
-            "Qu_sp_delta_m3h": Qu_sp_delta,
-            "Qu_m3h": Qu,
-            "Qo_m3h": Qo,              # flujo de overflow (balance volumétrico)
-            "Solids_u_pct": Sol_u,
-            "BedLevel_m": bed,
-            "UF_YieldStress_Pa": UF_YieldStress_Pa,
-            "Bogging_factor": Bogging_factor,
-            "RakeTorque_kNm": RakeTorque_kNm,
-            "RakeTorque_pct": RakeTorque_pct,
-            "Overflow_Turb_NTU_clean": turb_clean,
-            "Overflow_Turb_NTU": turb_clean,
-            "ControlMode": ControlMode,
-            "OperatorAction": OperatorAction,
-            "RecommendedAction": RecommendedAction,
-            "ExpectedTradeoff": ExpectedTradeoff,
-            "ActionScore_turb": ActionScore_turb,
-            "ActionScore_torque": ActionScore_torque,
+    def _labels(self, x: dict) -> dict:
+        regime = x["regime"]
+        event_now, fines_c, uf_c = x["event_now"], x["fines_c"], x["uf_c"]
+
+        # ------------------ Diagnosis / event typing (CLAY vs UF) ------------------
+        dominant_raw = np.array(["CLAY", "UF"], dtype=object)[
+            np.argmax(np.stack([fines_c, uf_c], axis=-1), axis=-1)
+        ]
+        event_type_raw = np.full(event_now.shape, "NONE", dtype=object)
+        event_type_raw[event_now == 1] = dominant_raw[event_now == 1]
+
+        event_type = event_type_raw.copy()
+        ev_mask = (event_now == 1)
+
+        uf_override = ev_mask & (regime == "UF") & (uf_c > self._p("event_type_override_th_uf"))
+        event_type[uf_override] = "UF"
+
+        # ------------------ Playbook recommendation (heuristic) ------------------
+        # Provide a recommended action and a simple trade-off annotation.
+        action_code = playbook_codes(x["turb_clean"], x["RakeTorque_pct"], x["bed"], regime, uf_c, x["Clay_idx"])
+        _, _, score_turb, score_torque = zip(*PLAYBOOK_RULES)
+
+        # ------------------ Water recovery (fórmula corregida) -----------------------------------
+        # WR = fracción del agua de alimentación recuperada en el underflow (UF denso → más agua)
+        # Qw ≈ Qflow × (1 − Solids_pct/100) — aproximación válida para concentraciones < 70%
+        Qw_feed = x["Qf_total"] * (1.0 - x["Sol_f"] / 100.0)
+        Qw_uf   = x["Qu"]       * (1.0 - x["Sol_u"] / 100.0)
+        water_recovery_proxy = Qw_uf / np.maximum(Qw_feed, 1.0)
+        water_recovery_proxy = np.clip(water_recovery_proxy, 0.0, 1.0)
+
+        return {
+            "action_code": action_code,
+            "ActionScore_turb": np.asarray(score_turb, dtype=float)[action_code],
+            "ActionScore_torque": np.asarray(score_torque, dtype=float)[action_code],
             "WaterRecovery_proxy": water_recovery_proxy,
-            "spec_limit_NTU": cfg.spec_limit_NTU,
-            "event_limit_NTU": cfg.event_limit_NTU,
-            "event_now": event_now,
-            "event_type_raw": event_type_raw,
-            "event_type": event_type,
-            "Regime": regime,
+            "event_type_raw": event_type_raw, "event_type": event_type,
         }
-    )
 
-    df["target_event_30m"] = df["event_now"].shift(-cfg.horizon_points).fillna(0).astype(int)
 
-    debug = {
+def _operator_recursion(
+    p_enter: list, p_exit: list, high: list, draws: list,
+    manual: bool, delta: float, step: float, lo: float, hi: float,
+) -> tuple[list, list, list, bool, float, int]:
+    """
+    Operator mode / setpoint recursion of one unit over precomputed per-row thresholds.
+
+    Consumes one uniform per row for the mode transition and one more when a manual row
+    is not forced by high bed / torque (the occasional minor tweak). Plain Python floats:
+    this is the only per-row loop of the simulator. Returns per-row (manual, setpoint,
+    acted) lists, the final mode / setpoint and the number of draws used.
+    """
+    modes, deltas, acts = [], [], []
+    p = 0
+    for enter, leave, forced in zip(p_enter, p_exit, high):
+        r = draws[p]
+        p += 1
+        manual = not (r < leave) if manual else r < enter
+        if not manual:
+            delta = 0.0
+            modes.append(False)
+            deltas.append(0.0)
+            acts.append(False)
+            continue
+        if forced:
+            delta = min(max(delta + step, lo), hi)
+            act = True
+        else:
+            r = draws[p]
+            p += 1
+            act = r >= 0.85             # sometimes do nothing or minor tweaks
+            if act:
+                delta = min(max(delta + 0.5 * step, lo), hi)
+        modes.append(True)
+        deltas.append(delta)
+        acts.append(act)
+    return modes, deltas, acts, manual, delta, p
+
+
+def _ffill_nonzero(x: np.ndarray) -> np.ndarray:
+    # along the last axis: every zero takes the last nonzero value before it (0.0 if none)
+    pos = np.where(x != 0.0, np.arange(x.shape[-1]), 0)
+    return np.take_along_axis(x, np.maximum.accumulate(pos, axis=-1), axis=-1)
+
+
+def _unit_columns(cols: dict, u: int) -> dict:
+    # one unit's 1-D columns from Engine.rows() output
+    actions, tradeoffs = (list(c) for c in list(zip(*PLAYBOOK_RULES))[:2])
+    out = {}
+    for name, v in cols.items():
+        if name == "timestamp":
+            out[name] = v
+        elif name == "RecommendedAction":
+            out[name] = pd.Categorical.from_codes(v[u], categories=actions)
+        elif name == "ExpectedTradeoff":
+            out[name] = pd.Categorical.from_codes(v[u], categories=tradeoffs)
+        else:
+            out[name] = v[u]
+    return out
+
+
+def _frame(cols: dict, next_event_now: np.ndarray, cfg: SimConfig) -> pd.DataFrame:
+    # target_event_30m = event_now shifted back by horizon_points (0 past the horizon end)
+    df = pd.DataFrame(cols)
+    m, h = len(df), horizon_rows(cfg)
+    target = np.concatenate([cols["event_now"][h:], next_event_now[:h]])[:m]
+    df["target_event_30m"] = np.concatenate([target, np.zeros(m - len(target), dtype=int)])
+    return df
+
+
+def _debug(df: pd.DataFrame, cfg: SimConfig, scale: float, search: dict) -> dict:
+    return {
         "deadband": cfg.deadband,
-        "scale": float(best_scale),
+        "scale": scale,
+        **search,
         "event_rate": float(df["event_now"].mean()),
         "manual_rate": float((df["ControlMode"] == "MANUAL").mean()),
         "torque_pct_p95": float(np.nanquantile(df["RakeTorque_pct"], 0.95)),
         "turb_clean_p50": float(np.nanquantile(df["Overflow_Turb_NTU_clean"], 0.50)),
     }
+
+
+def _search_stats(engine: _Engine, u: int) -> dict:
+    # search timings are measured for the whole fleet (split evenly) and only when the
+    # turbidity stage actually ran
+    iters = int(engine.x["scale_search_iters"][u])
+    search_s = engine.calib.get("scale_search_s", 0.0) / engine.K
+    stats = {
+        "scale_search_iters": iters,
+        "scale_search_s": search_s,
+        "scale_search_saved_s": iters * engine.t_eval / engine.K - search_s,
+    }
+    if engine.cache is not None:
+        stats.update(cache_hits=engine.cache.hits, cache_misses=engine.cache.misses)
+    return stats
+
+
+def simulate_clean(
+    cfg: SimConfig,
+    cache_dir: Path | None = None,
+    checkpoint_dir: Path | None = None,
+    checkpoint_every: int | None = None,
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Simulate the whole horizon. With cache_dir, stage outputs are cached on disk
+    (tws.cache.StageCache), so e.g. a deadband / turb_power sweep only recomputes the
+    turbidity and label stages. With checkpoint_dir, the engine state is saved every
+    checkpoint_every rows (default: one day) so resume() can re-simulate what-ifs from
+    the nearest one.
+    """
+    if cfg.drift_magnitude is None:
+        object.__setattr__(cfg, "drift_magnitude", _default_drift_magnitude())
+
+    plan = make_plan(cfg)
+    cache = StageCache(cache_dir) if cache_dir is not None else None
+    engine = _Engine([cfg], [plan], refs={}, inline=True, cache=cache)
+    df = _frame(_unit_columns(engine.rows(engine.n), 0), np.zeros(0, dtype=int), cfg)
+
+    debug = _debug(df, cfg, float(engine.x["scale"][0]), _search_stats(engine, 0))
+    if checkpoint_dir is not None:
+        refs = engine.refs
+        if cache is not None and cache.hits:
+            # stages loaded from the cache computed no references
+            ref_engine = _Engine([cfg], [plan], refs={}, inline=True)
+            ref_engine.rows(plan.n)
+            refs = ref_engine.refs
+        every = checkpoint_every or day_to_idx(1, cfg)
+        debug["checkpoints"] = write_checkpoints(cfg, plan, refs, checkpoint_dir, every)
     return df, debug
 
 
-def inject_failures(cfg: SimConfig, df: pd.DataFrame) -> pd.DataFrame:
-    rng = np.random.default_rng(cfg.seed + 7)
-    out = df.copy()
-    n = len(out)
-
-    points_per_day = int(24 * 60 / cfg.freq_min)
-    points_per_hour = int(60 / cfg.freq_min)
-
-    tags = ["Qf_m3h", "Solids_u_pct", "Overflow_Turb_NTU", "pH_feed"]
-
-    for tag in tags:
-        x = out[tag].to_numpy().copy()
-
-        expected_spikes = int(cfg.spikes_per_day_per_tag * cfg.days)
-        idx = rng.integers(0, n, size=expected_spikes)
-        for i in idx:
-            if tag == "Qf_m3h":
-                x[i] += rng.uniform(-250, 250)
-            elif tag == "Solids_u_pct":
-                x[i] += rng.uniform(-15, 15)
-            elif tag == "pH_feed":
-                x[i] += rng.uniform(-0.8, 0.8)   # artefactos de calibración del electrodo
-            else:
-                x[i] += rng.uniform(-40, 40)
-
-        stuck_segments = int(cfg.stuck_events_per_30d_per_tag * (cfg.days / 30.0))
-        for _ in range(stuck_segments):
-            start = rng.integers(0, n - 2 * points_per_hour)
-            dur_min = rng.integers(cfg.stuck_duration_min[0], cfg.stuck_duration_min[1] + 1)
-            dur = int(dur_min / cfg.freq_min)
-            x[start:start + dur] = x[start]
-
-        drift_segments = int(cfg.drift_events_per_90d_per_tag)
-        for _ in range(drift_segments):
-            start = rng.integers(int(0.2 * n), int(0.8 * n))
-            dur = rng.integers(7 * points_per_day, 12 * points_per_day)
-            end = min(n, start + dur)
-
-            mag = (cfg.drift_magnitude or _default_drift_magnitude()).get(tag, 0.0)
-            if tag in ("Qf_m3h", "Solids_u_pct"):
-                x[start:end] *= (1.0 + mag)
-            else:
-                x[start:end] += mag
-
-        missing_n = int(cfg.missing_rate_per_tag * n)
-        miss_idx = rng.choice(np.arange(n), size=missing_n, replace=False)
-        x[miss_idx] = np.nan
-
-        if tag == "Qf_m3h":
-            x = np.clip(x, 0.0, 1200.0)
-        elif tag == "Solids_u_pct":
-            x = np.clip(x, 0.0, 100.0)
-        elif tag == "pH_feed":
-            x = np.clip(x, 6.0, 12.0)   # rango físico del electrodo
+# ------------------ checkpoints / what-if resume ------------------
+CHECKPOINT_MANIFEST = "manifest.json"
+
+
+def _config_key(cfg: SimConfig) -> str:
+    return content_key({f.name: getattr(cfg, f.name) for f in fields(cfg)})
+
+
+def write_checkpoints(cfg: SimConfig, plan: SimPlan, refs: dict, checkpoint_dir: Path, every: int) -> int:
+    """
+    Replay a run with known references in chunks of `every` rows and save the engine
+    state at every chunk start (state_<row>.npz, ~10 KB each) plus a manifest with
+    the references. Returns the number of checkpoints.
+    """
+    if every < min_chunk_rows(cfg):
+        raise ValueError(f"checkpoint_every must be >= {min_chunk_rows(cfg)} rows (min_chunk_rows), got {every}")
+    checkpoint_dir = Path(checkpoint_dir)
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+    engine = _Engine([cfg], [plan], refs)
+    rows = []
+    while engine.i < plan.n:
+        meta, arrays = engine.snapshot()
+        np.savez(checkpoint_dir / f"state_{engine.i:08d}.npz", meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8), **arrays)
+        rows.append(engine.i)
+        engine.rows(min(engine.i + every, plan.n))
+
+    manifest = {
+        "config": _config_key(cfg),
+        "n": plan.n,
+        "every": every,
+        "rows": rows,
+        "refs": {key: np.asarray(ref).tolist() for key, ref in refs.items()},
+    }
+    (checkpoint_dir / CHECKPOINT_MANIFEST).write_text(json.dumps(manifest))
+    return len(rows)
+
+
+def _open_checkpoint(cfg: SimConfig, checkpoint_dir: Path, start: int) -> tuple[int, int, dict, dict, dict]:
+    # (n, checkpoint row c <= start, references, snapshot meta, snapshot arrays)
+    if cfg.drift_magnitude is None:
+        object.__setattr__(cfg, "drift_magnitude", _default_drift_magnitude())
+    checkpoint_dir = Path(checkpoint_dir)
+    manifest = json.loads((checkpoint_dir / CHECKPOINT_MANIFEST).read_text())
+    if manifest["config"] != _config_key(cfg):
+        raise ValueError(f"checkpoints in {checkpoint_dir} were written for a different SimConfig")
+    if not 0 <= start < manifest["n"]:
+        raise ValueError(f"start must be in [0, {manifest['n']}), got {start}")
+
+    c = max(row for row in manifest["rows"] if row <= start)
+    refs = {
+        key: np.array(ref) if key == "scale" else (np.array(ref[0]), np.array(ref[1]))
+        for key, ref in manifest["refs"].items()
+    }
+    with np.load(checkpoint_dir / f"state_{c:08d}.npz", allow_pickle=False) as z:
+        meta = json.loads(z["meta"].tobytes())
+        arrays = {name: z[name] for name in z.files if name != "meta"}
+    return manifest["n"], c, refs, meta, arrays
+
+
+def _tile_snapshot(meta: dict, arrays: dict, refs: dict, K: int) -> tuple[dict, dict, dict]:
+    # single-unit snapshot and references repeated for K units
+    meta = {
+        key: ({k: None if v is None else v * K for k, v in value.items()} if key == "ar" else value * K)
+        if key != "row" else value
+        for key, value in meta.items()
+    }
+    tiled = {name: np.repeat(a, K, axis=0) for name, a in arrays.items() if not name.startswith("op_draws:")}
+    tiled.update({f"op_draws:{u}": arrays["op_draws:0"] for u in range(K)})
+    refs = {
+        key: np.repeat(ref, K) if key == "scale" else tuple(np.repeat(r, K) for r in ref)
+        for key, ref in refs.items()
+    }
+    return meta, tiled, refs
+
+
+def simulate_branches(
+    cfg: SimConfig,
+    checkpoint_dir: Path,
+    start: int,
+    stop: int,
+    plans: Sequence[SimPlan],
+    noise_keys: Sequence[int] | None = None,
+) -> dict:
+    """
+    Branch a checkpointed run at row `start` into K = len(plans) futures, simulated
+    together as one (K, m) engine; returns the rows() columns of [start, stop).
+
+    The recorded run is replayed from the nearest checkpoint up to `start`; from there
+    branch k follows plans[k] (e.g. actions starting at `start`). With noise_keys, branch
+    k's noise from `start` on is redrawn per key (_Engine.reseed): branches sharing a key
+    see the same future, so plans are compared on common random numbers. Without them
+    every branch replays the recorded noise.
+    """
+    n, c, refs, meta, arrays = _open_checkpoint(cfg, checkpoint_dir, start)
+    stop = min(stop, n)
+    if not start < stop:
+        raise ValueError(f"need start < stop <= {n}, got start={start}, stop={stop}")
+    if c == 0 and 0 < start < min_chunk_rows(cfg):
+        raise ValueError(f"branching inside the first {min_chunk_rows(cfg)} rows (min_chunk_rows) is not supported")
+
+    trunk = _Engine([cfg], [make_plan(cfg)], refs)
+    trunk.restore(meta, arrays)
+    if start > c:
+        trunk.rows(start)
+
+    meta, arrays, refs = _tile_snapshot(*trunk.snapshot(), refs, len(plans))
+    engine = _Engine([cfg] * len(plans), list(plans), refs)
+    engine.restore(meta, arrays)
+    if noise_keys is not None:
+        engine.reseed(noise_keys)
+    return engine.rows(stop)
+
+
+def resume(
+    cfg: SimConfig,
+    checkpoint_dir: Path,
+    start: int,
+    stop: int | None = None,
+    plan: SimPlan | None = None,
+) -> pd.DataFrame:
+    """
+    Re-simulate rows [c, stop) from the last checkpoint c <= start, with an edited plan.
+
+    The normalization percentiles and the turbidity scale are the baseline run's, so the
+    result lines up with the baseline frame row for row (index = row numbers). With the
+    unedited plan it equals df.iloc[c:stop]. Cost is proportional to stop - c. Example,
+    dilution started 30 minutes (6 rows) earlier:
+
+        plan = make_plan(cfg)
+        moved = tuple((s - 6, e, f) if s == t else (s, e, f) for s, e, f in plan.dilution)
+        what_if = resume(cfg, ckpt_dir, t - 6, t + 288, replace(plan, dilution=moved))
+        delta = what_if["Overflow_Turb_NTU_clean"] - df.loc[what_if.index, "Overflow_Turb_NTU_clean"]
+    """
+    n, c, refs, meta, arrays = _open_checkpoint(cfg, checkpoint_dir, start)
+    stop = n if stop is None else min(stop, n)
+    if not start < stop:
+        raise ValueError(f"need start < stop <= {n}, got start={start}, stop={stop}")
+
+    engine = _Engine([cfg], [plan if plan is not None else make_plan(cfg)], refs)
+    engine.restore(meta, arrays)
+    # horizon rows extra for target_event_30m; >= min_chunk_rows when starting at row 0
+    m, h = stop - c, horizon_rows(cfg)
+    cols = _unit_columns(engine.rows(min(max(stop + h, c + min_chunk_rows(cfg)), n)), 0)
+    df = _frame({name: v[:m] for name, v in cols.items()}, cols["event_now"][m:m + h], cfg)
+    df.index = pd.RangeIndex(c, stop)
+    return df
+
+
+def simulate_stream(cfg: SimConfig, chunk_points: int | None = None) -> Iterator[pd.DataFrame]:
+    """
+    simulate_clean in fixed-size chunks: pd.concat(simulate_stream(cfg, c)) equals
+    simulate_clean(cfg)[0] for any chunk size c >= min_chunk_rows(cfg) (default: one day).
+
+    The normalization percentiles and the turbidity scale depend on the whole horizon,
+    so cheap reference passes run first: each pass streams the simulator up to the next
+    unresolved reference and keeps only the tails the reference needs (~1% per
+    normalized series, ~target_event_rate of the window thresholds). With
+    cfg.norm_mode "warmup" / "running" the passes only cover the warmup, so a live feed
+    waits norm_warmup_days instead of the whole horizon. Output chunks are held back by
+    one chunk so target_event_30m can look horizon_points ahead.
+    """
+    if cfg.drift_magnitude is None:
+        object.__setattr__(cfg, "drift_magnitude", _default_drift_magnitude())
+    chunk_points = chunk_points or day_to_idx(1, cfg)
+    if chunk_points < min_chunk_rows(cfg):
+        raise ValueError(f"chunk_points must be >= {min_chunk_rows(cfg)} rows (min_chunk_rows), got {chunk_points}")
+
+    plan = make_plan(cfg)
+    refs: dict = {}
+    while True:
+        engine = _Engine([cfg], [plan], refs)
+        try:
+            pending = engine.rows(min(chunk_points, plan.n))
+            break
+        except _NeedRefs:
+            while engine.i < engine.n_ref:
+                try:
+                    engine.rows(min(engine.i + chunk_points, plan.n))
+                except _NeedRefs:
+                    pass
+            engine.finalize()
+
+    pending = _unit_columns(pending, 0)
+    while engine.i < plan.n:
+        cols = _unit_columns(engine.rows(min(engine.i + chunk_points, plan.n)), 0)
+        yield _frame(pending, cols["event_now"], cfg)
+        pending = cols
+    yield _frame(pending, np.zeros(0, dtype=int), cfg)
+
+
+def simulate_fleet(
+    cfgs: Sequence[SimConfig], shared_feed: bool = False, cache_dir: Path | None = None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Simulate K thickeners in one vectorized run: every series is a (K, n) array.
+
+    cfgs[k] configures unit k (seed, campaigns, deadband, ...); the FLEET_SHARED_FIELDS
+    must agree. Unit k equals simulate_clean(cfgs[k]) unless shared_feed=True, where
+    every unit receives unit 0's upstream pulp feed (flow and solids; dilution stays
+    per unit). Returns the long-format frame (unit_id + the simulate_clean columns,
+    unit after unit) and one debug row per unit.
+    """
+    for cfg in cfgs:
+        if cfg.drift_magnitude is None:
+            object.__setattr__(cfg, "drift_magnitude", _default_drift_magnitude())
+
+    cache = StageCache(cache_dir) if cache_dir is not None else None
+    engine = _Engine(cfgs, [make_plan(c) for c in cfgs], refs={}, inline=True, cache=cache, shared_feed=shared_feed)
+    cols = engine.rows(engine.n)
+    K, n, h = engine.K, engine.n, horizon_rows(engine.cfg)
+
+    # long format, unit after unit: (K, n) columns flattened row-major
+    actions, tradeoffs = (list(c) for c in list(zip(*PLAYBOOK_RULES))[:2])
+    long = {"unit_id": np.repeat(np.arange(K), n)}
+    for name, v in cols.items():
+        if name == "timestamp":
+            long[name] = pd.DatetimeIndex(np.tile(v.to_numpy(), K))
+        elif name in ("RecommendedAction", "ExpectedTradeoff"):
+            long[name] = pd.Categorical.from_codes(
+                v.reshape(-1), categories=actions if name == "RecommendedAction" else tradeoffs
+            )
         else:
-            x = np.clip(x, 0.0, cfg.turb_max)
+            long[name] = v.reshape(-1)
+    target = np.zeros((K, n), dtype=int)
+    target[:, :max(n - h, 0)] = cols["event_now"][:, h:]
+    long["target_event_30m"] = target.reshape(-1)
+    df = pd.DataFrame(long)
+
+    summary = []
+    for u, cfg in enumerate(cfgs):
+        unit = df.iloc[u * n:(u + 1) * n]
+        summary.append({
+            "unit_id": u, "seed": cfg.seed, **_debug(unit, cfg, float(engine.x["scale"][u]), _search_stats(engine, u))
+        })
+    return df, pd.DataFrame(summary)
+
+
+# Measured tags: (column, spike half-range, drift mode, clip range). hi=None -> cfg.turb_max
+FAILURE_TAGS: Tuple[Tuple[str, float, str, Tuple[float, float | None]], ...] = (
+    ("Qf_m3h", 250.0, "mul", (0.0, 1200.0)),
+    ("Solids_u_pct", 15.0, "mul", (0.0, 100.0)),
+    ("Overflow_Turb_NTU", 40.0, "add", (0.0, None)),
+    ("pH_feed", 0.8, "add", (6.0, 12.0)),     # artefactos de calibración / rango físico del electrodo
+)
+FAILURE_TYPES: Tuple[str, ...] = ("spike", "stuck", "drift", "missing")
+
+
+def sample_failures(cfg: SimConfig, n: int) -> pd.DataFrame:
+    """
+    Ground-truth failure log for a series of n rows: one row per event with
+    tag, failure type, start (inclusive), end (exclusive) and magnitude
+    (spike offset, drift fraction / offset, NaN otherwise).
+
+    Every event type is drawn for all tags at once; the log depends only on
+    (cfg, n), so it can be rebuilt without re-simulating.
+    """
+    rng = np.random.default_rng(seed_tree(cfg.seed)["failures"])
+    n_tags = len(FAILURE_TAGS)
+    points_per_day = day_to_idx(1, cfg)
+    points_per_hour = 3600 // step_seconds(cfg)
+    drift_magnitude = cfg.drift_magnitude or _default_drift_magnitude()
+
+    def events(kind: str, start: np.ndarray, end: np.ndarray, magnitude: np.ndarray) -> dict:
+        # (n_tags, k) arrays -> flat log columns
+        tag = np.repeat(np.arange(n_tags), start.shape[1])
+        return {
+            "tag": tag, "failure": np.full(len(tag), FAILURE_TYPES.index(kind)),
+            "start": start.ravel(), "end": np.minimum(end, n).ravel(), "magnitude": magnitude.ravel(),
+        }
+
+    n_spikes = int(cfg.spikes_per_day_per_tag * cfg.days)
+    spike_start = rng.integers(0, n, size=(n_tags, n_spikes))
+    spike_half = np.array([t[1] for t in FAILURE_TAGS])[:, None]
+    spike_mag = rng.uniform(-1.0, 1.0, size=(n_tags, n_spikes)) * spike_half
+
+    n_stuck = int(cfg.stuck_events_per_30d_per_tag * (cfg.days / 30.0))
+    stuck_start = rng.integers(0, n - 2 * points_per_hour, size=(n_tags, n_stuck))
+    stuck_min = rng.integers(cfg.stuck_duration_min[0], cfg.stuck_duration_min[1] + 1, size=(n_tags, n_stuck))
+    stuck_end = stuck_start + stuck_min * 60 // step_seconds(cfg)
+
+    n_drift = int(cfg.drift_events_per_90d_per_tag)
+    drift_start = rng.integers(int(0.2 * n), int(0.8 * n), size=(n_tags, n_drift))
+    drift_end = drift_start + rng.integers(7 * points_per_day, 12 * points_per_day, size=(n_tags, n_drift))
+    drift_mag = np.array([drift_magnitude.get(t[0], 0.0) for t in FAILURE_TAGS])[:, None]
+
+    missing_n = int(cfg.missing_rate_per_tag * n)
+    missing = np.stack([rng.choice(n, size=missing_n, replace=False) for _ in FAILURE_TAGS])
+
+    parts = [
+        events("spike", spike_start, spike_start + 1, spike_mag),
+        events("stuck", stuck_start, stuck_end, np.full(stuck_start.shape, np.nan)),
+        events("drift", drift_start, drift_end, np.broadcast_to(drift_mag, drift_start.shape)),
+        events("missing", missing, missing + 1, np.full(missing.shape, np.nan)),
+    ]
+    cols = {key: np.concatenate([p[key] for p in parts]) for key in parts[0]}
+    return pd.DataFrame(
+        {
+            "tag": pd.Categorical.from_codes(cols["tag"].astype(np.int8), categories=[t[0] for t in FAILURE_TAGS]),
+            "failure": pd.Categorical.from_codes(cols["failure"].astype(np.int8), categories=list(FAILURE_TYPES)),
+            "start": cols["start"].astype(np.int64),
+            "end": cols["end"].astype(np.int64),
+            "magnitude": cols["magnitude"].astype(float),
+        }
+    )
 
-        out[tag] = x
 
+def _segment_rows(start: np.ndarray, end: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # (row, segment) pairs for every row of the [start, end) segments, in segment order
+    lengths = np.maximum(end - start, 0)
+    seg = np.repeat(np.arange(len(start)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    return start[seg] + (np.arange(len(seg)) - offsets[seg]), seg
+
+
+def apply_failures(cfg: SimConfig, df: pd.DataFrame, log: pd.DataFrame) -> pd.DataFrame:
+    """
+    Measured tags = clean tags + the failures in `log`, applied in the order
+    spikes -> stuck -> drift -> missing -> clip.
+
+    Tags are processed together in one preallocated (n, n_tags) buffer and only
+    the rows a failure touches are indexed; every other column is shared with
+    `df` rather than copied. Overlapping stuck segments merge into one segment
+    held at the value read when it started; segments that only touch stay
+    separate, each at its own start reading. Overlapping drifts compound.
+    """
+    n, n_tags = len(df), len(FAILURE_TAGS)
+    tags = [t[0] for t in FAILURE_TAGS]
+    X = np.empty((n, n_tags))
+    for j, tag in enumerate(tags):
+        X[:, j] = df[tag].to_numpy(dtype=float)
+
+    tag_id = log["tag"].cat.codes.to_numpy().astype(np.int64)
+    kind = log["failure"].cat.codes.to_numpy()
+    start, end, mag = log["start"].to_numpy(), log["end"].to_numpy(), log["magnitude"].to_numpy()
+    sel = {name: kind == code for code, name in enumerate(FAILURE_TYPES)}
+
+    # spikes (repeated rows accumulate)
+    s = sel["spike"]
+    np.add.at(X, (start[s], tag_id[s]), mag[s])
+
+    # stuck: segments of a tag that overlap form one run repeating the reading at its
+    # first row; a segment starting where the previous one ends is a run of its own
+    s = sel["stuck"]
+    order = np.lexsort((start[s], tag_id[s]))
+    t_s, a_s, b_s = tag_id[s][order], start[s][order], end[s][order]
+    reach = np.maximum.accumulate(t_s * (n + 1) + b_s)     # tags offset: reach never crosses a tag
+    new_run = t_s * (n + 1) + a_s >= np.r_[-1, reach[:-1]]
+    run_start = a_s[np.maximum.accumulate(np.where(new_run, np.arange(len(a_s)), 0))]
+    rows, seg = _segment_rows(a_s, b_s)
+    cols = t_s[seg]
+    X[rows, cols] = X[run_start[seg], cols]
+
+    # drift: multiplicative for flow / density, additive offsets otherwise
+    s = sel["drift"]
+    rows, seg = _segment_rows(start[s], end[s])
+    cols, d = tag_id[s][seg], mag[s][seg]
+    mul = np.array([t[2] == "mul" for t in FAILURE_TAGS])[cols]
+    np.multiply.at(X, (rows[mul], cols[mul]), 1.0 + d[mul])
+    np.add.at(X, (rows[~mul], cols[~mul]), d[~mul])
+
+    s = sel["missing"]
+    X[start[s], tag_id[s]] = np.nan
+
+    lo = np.array([t[3][0] for t in FAILURE_TAGS])
+    hi = np.array([cfg.turb_max if t[3][1] is None else t[3][1] for t in FAILURE_TAGS])
+    X = np.clip(X, lo, hi, out=X)
+
+    out = df.copy(deep=False)
+    for j, tag in enumerate(tags):
+        out[tag] = X[:, j]
     return out
 
 
+def inject_failures(cfg: SimConfig, df: pd.DataFrame) -> pd.DataFrame:
+    return apply_failures(cfg, df, sample_failures(cfg, len(df)))
+
+
 def main() -> None:
+    ap = argparse.ArgumentParser(description="Synthetic thickener timeseries")
+    ap.add_argument("--compact", action="store_true",
+                    help="write the compact schema (categoricals, int8 flags, float32 tags; see tws.schema)")
+    ap.add_argument("--cache", type=Path, default=None, metavar="DIR",
+                    help="cache stage outputs under DIR and reuse them on later runs (see tws.cache)")
+    ap.add_argument("--checkpoints", type=Path, default=None, metavar="DIR",
+                    help="save engine state snapshots (one per day) under DIR for resume() what-ifs")
+    args = ap.parse_args()
+
     cfg = SimConfig()
-    df_clean, debug = simulate_clean(cfg)
-    df = inject_failures(cfg, df_clean)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # the failure schedule has its own stream and only needs n: drawn alongside the run
+        failures = pool.submit(sample_failures, cfg, n_points(cfg))
+        df_clean, debug = simulate_clean(cfg, cache_dir=args.cache, checkpoint_dir=args.checkpoints)
+        failures = failures.result()
+    df = apply_failures(cfg, df_clean, failures)
 
     out_dir = Path("data/processed")
     out_dir.mkdir(parents=True, exist_ok=True)
+    failures.to_parquet(out_dir / "thickener_failures.parquet", index=False)
 
     out_path = out_dir / f"thickener_timeseries_deadband{str(cfg.deadband).replace('.','p')}_sp{cfg.sustain_points}.parquet"
-    df.to_parquet(out_path, index=False)
-    df.to_parquet(out_dir / "thickener_timeseries.parquet", index=False)
+    write_timeseries(df, out_path, compact=args.compact)
+    link_latest(out_path, out_dir / "thickener_timeseries.parquet")
 
     print("DEBUG SUMMARY:", debug)
     print("Wrote:", out_path)
@@ -0,0 +1,6 @@
+"""
+tws - reusable numerical building blocks for the TWS simulator and pipelines.
+
+Scripts in src/ (simulate_fixed.py, lead_time_analysis.py, ...) import from here;
+running them as `python src/<script>.py` puts src/ on sys.path.
+"""
@@ -0,0 +1,93 @@
+"""
+cache.py - content-addressed on-disk cache for pipeline stage outputs.
+
+A stage key hashes the stage name, its code version, the parameters it reads and the
+key of the stage upstream of it. Changing a parameter therefore invalidates that stage
+and everything after it, while upstream stages keep hitting the cache:
+
+    key_feed = cache.key("feed", 1, {"seed": 42, "days": 90, ...})
+    key_lat  = cache.key("latent", 1, {"clay_pct_min": 1.0, ...}, parent=key_feed)
+
+Entries are .npz files named by key (<root>/<stage>/<key>.npz) holding a dict of
+arrays; object (string label) arrays are stored as fixed-width unicode and restored as
+object arrays. Writes go to a temporary file first, so concurrent workers computing the
+same entry never expose a partial file.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+_OBJECT_KEYS = "__object_keys__"
+
+
+def _jsonable(v):
+    if isinstance(v, (tuple, list)):
+        return [_jsonable(e) for e in v]
+    if isinstance(v, dict):
+        return {str(k): _jsonable(e) for k, e in sorted(v.items())}
+    if isinstance(v, np.generic):
+        return v.item()
+    return v
+
+
+def content_key(payload: dict) -> str:
+    """Short sha256 of a JSON-able payload (tuples, dicts and numpy scalars allowed)."""
+    return hashlib.sha256(json.dumps(_jsonable(payload), sort_keys=True).encode()).hexdigest()[:24]
+
+
+class StageCache:
+    """Stage outputs keyed by (stage, version, params, parent key)."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(stage: str, version: int, params: dict, parent: Optional[str] = None) -> str:
+        return content_key({"stage": stage, "version": version, "params": params, "parent": parent})
+
+    def _path(self, stage: str, key: str) -> Path:
+        return self.root / stage / f"{key}.npz"
+
+    def load(self, stage: str, key: str) -> Optional[Dict[str, np.ndarray]]:
+        path = self._path(stage, key)
+        if not path.exists():
+            self.misses += 1
+            return None
+        with np.load(path, allow_pickle=False) as z:
+            out = {name: z[name] for name in z.files if name != _OBJECT_KEYS}
+            for name in (z[_OBJECT_KEYS].tolist() if _OBJECT_KEYS in z.files else []):
+                out[name] = out[name].astype(object)
+        self.hits += 1
+        return out
+
+    def save(self, stage: str, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        path = self._path(stage, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data, objects = {}, []
+        for name, a in arrays.items():
+            a = np.asarray(a)
+            if a.dtype == object:
+                a = a.astype(str)
+                objects.append(name)
+            data[name] = a
+        data[_OBJECT_KEYS] = np.array(objects, dtype=str)
+
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
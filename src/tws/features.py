@@ -0,0 +1,587 @@
+"""
+features.py - the feature set of notebooks/02_feature_engineering.ipynb as one compiled plan.
+
+The notebook builds its 326 candidate features cell by cell (time of day, rolling
+stats, lags, deltas, flags, sensor-health proxies, interactions, base tags), each cell
+as a list of Series glued with pd.concat. Here the same spec (FeatureSpec: WINDOWS,
+ROLL_VARS, LAG_VARS, DELTA_VARS, ...) compiles into a FeaturePlan, a flat list of named
+features in notebook column order, and compute_features() fills one preallocated
+(rows, features) matrix column by column:
+
+- every variable's rolling windows come from one rolling_stats() call (tws.rolling),
+  shared with the sensor-health features that reuse them, and are freed after their
+  last use;
+- lags / deltas / flags / interactions are single numpy expressions on the input tags;
+- rows before `start` (the warmup) are never stored.
+
+clean_features() then applies the notebook's cleanup (ffill / bfill, drop constant and
+duplicate columns) in place, and build_feature_frame() returns the frame that
+thickener_features.parquet holds: timestamp, FEATURES_ALL, TARGET_COLS. Values are the
+notebook's float64 results, up to pandas' rolling-variance rounding (rstd), stored in
+`dtype` (default float32).
+
+Column names are parseable (parse_feature): `<tag>__rmax_1h` is the max of <tag> over
+1 h (12 points), `turb_x_torque` a DERIVED entry with its declared input tags. So any
+catalog list (feature_catalogs.json) maps to a plan of just those columns (plan_for),
+whose inputs() are the only tags to read; materialize() computes it.
+
+Rows can be computed in chunks of the series: FeaturePlan.chunk_start() gives the
+left halo (longest window / lag, aligned to the rolling-sum block) that makes a chunk's
+rows equal to the whole series' (tws.store appends days this way), and
+compute_features_parallel() computes time blocks in a process pool.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from tws.rolling import EXTREMA_STATS, rolling_stats, sum_block
+
+TIME_COLUMN = "timestamp"
+
+# Windows in 5-min steps
+WINDOWS: Tuple[Tuple[str, int], ...] = (("15m", 3), ("30m", 6), ("1h", 12), ("2h", 24), ("4h", 48))
+# Long windows, only for tags with a sustained CLAY signature
+WINDOWS_LONG: Tuple[Tuple[str, int], ...] = (("12h", 144), ("24h", 288))
+EXTREMA_MAX_WINDOW = 12         # rmax / rmin only up to 1 h
+
+ROLL_VARS: Tuple[str, ...] = (
+    "Overflow_Turb_NTU", "BedLevel_m", "RakeTorque_pct", "Qu_m3h", "Qo_m3h", "Solids_u_pct",
+    "Floc_gpt", "pH_feed", "Clay_idx", "PSD_fines_idx", "UF_YieldStress_Pa", "UF_capacity_factor",
+)
+ROLL_VARS_LONG: Tuple[str, ...] = ("BedLevel_m", "RakeTorque_pct", "Qu_m3h", "Overflow_Turb_NTU", "pH_feed")
+
+LAGS: Tuple[int, ...] = (1, 3, 6, 12)
+LAG_VARS: Tuple[str, ...] = (
+    "Overflow_Turb_NTU", "BedLevel_m", "RakeTorque_pct", "pH_feed", "Qu_m3h",
+    "Clay_idx", "PSD_fines_idx", "UF_YieldStress_Pa", "UF_capacity_factor",
+)
+DELTA_VARS: Tuple[str, ...] = (
+    "Overflow_Turb_NTU", "BedLevel_m", "RakeTorque_pct", "pH_feed", "Qu_m3h",
+    "Clay_idx", "PSD_fines_idx", "UF_YieldStress_Pa",
+)
+
+# Base tags: plant measurements, then simulator latents (except the clean turbidity)
+PRODUCTION: Tuple[str, ...] = (
+    "Qf_m3h", "Qf_pulp_m3h", "Qf_dilution_m3h", "Qf_total_m3h", "Solids_f_pct", "FeedDilution_On",
+    "FeedDilution_factor", "Qu_m3h", "Qu_sp_delta_m3h", "Qo_m3h", "BedLevel_m", "RakeTorque_kNm",
+    "RakeTorque_pct", "Floc_gpt", "Solids_u_pct", "pH_feed", "Overflow_Turb_NTU", "WaterRecovery_proxy",
+)
+SIMULATION_LATENT: Tuple[str, ...] = (
+    "Clay_pct", "Clay_idx", "PSD_fines_idx", "UF_capacity_factor", "Qu_base_m3h",
+    "UF_YieldStress_Pa", "Bogging_factor", "Overflow_Turb_NTU_clean", "pH_clean", "Floc_effectiveness",
+)
+BASE_FEAT_COLS: Tuple[str, ...] = PRODUCTION + tuple(c for c in SIMULATION_LATENT if c != "Overflow_Turb_NTU_clean")
+
+STEP_MIN = 5                    # minutes per row: window names are durations
+TARGET_COLS: Tuple[str, ...] = ("target_event_30m", "event_type", "event_now")
+WARMUP = 48                     # rows dropped at the start (4 h)
+CONSTANT_STD = 1e-8             # columns with a smaller std are dropped
+PARALLEL_MIN_ROWS = 1 << 14     # rows per block of compute_features_parallel, at least (halo <= ~1.3k rows)
+
+
+def min_periods(window: int) -> int:
+    """Half the window, as the notebook's MIN_PERIODS."""
+    return max(1, window // 2)
+
+
+# ---------------------------------------------------------------------------
+# Derived features: name -> (function of a source, tags it reads, rolling stats it
+# reads). Sources: _Source (whole columns) here, tws.online's row source (scalars of
+# the newest row). Rolling dependencies are (var, stat, window).
+# ---------------------------------------------------------------------------
+
+def _fill(x: np.ndarray, value) -> np.ndarray:
+    return np.where(np.isnan(x), value, x)
+
+
+def _flag(mask: np.ndarray) -> np.ndarray:
+    return np.asarray(mask, dtype=float)
+
+
+_TURB = "Overflow_Turb_NTU"
+
+
+def _turb_zscore(s: "_Source") -> np.ndarray:
+    return (s.col(_TURB) - s.roll(_TURB, "mean", 12)) / (s.roll(_TURB, "std", 12) + 1e-3)
+
+
+class Derived(NamedTuple):
+    fn: Callable[["_Source"], np.ndarray]
+    inputs: Tuple[str, ...] = ()
+    rolls: Tuple[Tuple[str, str, int], ...] = ()
+
+
+TIME_FEATURES: Dict[str, Derived] = {
+    "hour_sin": Derived(lambda s: np.sin(2 * np.pi * s.hour_frac / 24.0)),
+    "hour_cos": Derived(lambda s: np.cos(2 * np.pi * s.hour_frac / 24.0)),
+    "dow_sin": Derived(lambda s: np.sin(2 * np.pi * s.dow / 7.0)),
+    "dow_cos": Derived(lambda s: np.cos(2 * np.pi * s.dow / 7.0)),
+    "hour_of_day": Derived(lambda s: s.hour),
+}
+
+FLAG_FEATURES: Dict[str, Derived] = {
+    "is_CLAY": Derived(lambda s: _flag(s.label("Regime") == "CLAY"), ("Regime",)),
+    "is_UF": Derived(lambda s: _flag(s.label("Regime") == "UF"), ("Regime",)),
+    "is_MANUAL": Derived(lambda s: _flag(s.label("ControlMode") == "MANUAL"), ("ControlMode",)),
+    "is_dilution": Derived(lambda s: s.col("FeedDilution_On"), ("FeedDilution_On",)),
+    "turb_above_50": Derived(lambda s: _flag(_fill(s.col(_TURB), 0) > 50), (_TURB,)),
+    "turb_above_100": Derived(lambda s: _flag(_fill(s.col(_TURB), 0) > 100), (_TURB,)),
+    "bed_high": Derived(lambda s: _flag(s.col("BedLevel_m") > 2.5), ("BedLevel_m",)),
+    "torque_high": Derived(lambda s: _flag(s.col("RakeTorque_pct") > 80), ("RakeTorque_pct",)),
+    "clay_high": Derived(lambda s: _flag(s.col("Clay_idx") > 0.65), ("Clay_idx",)),
+    "uf_degraded": Derived(lambda s: _flag(s.col("UF_capacity_factor") < 0.90), ("UF_capacity_factor",)),
+    # pH above the flocculation optimum; gaps take the series median
+    "pH_off_spec": Derived(lambda s: _flag(_fill(s.col("pH_feed"), s.median("pH_feed")) > 9.5),
+                           ("pH_feed",)),
+}
+MEDIAN_TAGS: Tuple[str, ...] = ("pH_feed",)     # tags whose whole-series median fills gaps (s.median)
+
+SENSOR_FEATURES: Dict[str, Derived] = {
+    "turb_cv_1h": Derived(lambda s: s.roll(_TURB, "std", 12) / (np.abs(s.roll(_TURB, "mean", 12)) + 1.0),
+                          rolls=((_TURB, "std", 12), (_TURB, "mean", 12))),
+    "turb_stuck_proxy": Derived(lambda s: _flag(s.roll(_TURB, "std", 12) < 0.5), rolls=((_TURB, "std", 12),)),
+    "turb_zscore_1h": Derived(_turb_zscore, (_TURB,), ((_TURB, "mean", 12), (_TURB, "std", 12))),
+    "turb_spike_proxy": Derived(lambda s: _flag(np.abs(_turb_zscore(s)) > 4.0), (_TURB,),
+                                ((_TURB, "mean", 12), (_TURB, "std", 12))),
+    "turb_dev_from_median_2h": Derived(lambda s: s.col(_TURB) - s.roll(_TURB, "median", 24), (_TURB,),
+                                       ((_TURB, "median", 24),)),
+    "turb_drift_proxy": Derived(lambda s: s.roll(_TURB, "mean", 6) - s.roll(_TURB, "mean", 48),
+                                rolls=((_TURB, "mean", 6), (_TURB, "mean", 48))),
+}
+
+INTERACTION_FEATURES: Dict[str, Derived] = {
+    "clay_x_psd": Derived(lambda s: s.col("Clay_idx") * s.col("PSD_fines_idx"), ("Clay_idx", "PSD_fines_idx")),
+    "ys_x_bed": Derived(lambda s: s.col("UF_YieldStress_Pa") * s.col("BedLevel_m"), ("UF_YieldStress_Pa", "BedLevel_m")),
+    "uf_stress": Derived(lambda s: (1.0 - s.col("UF_capacity_factor")) * np.clip((220 - s.col("Qu_m3h")) / 220.0, 0, 1),
+                         ("UF_capacity_factor", "Qu_m3h")),
+    "turb_x_torque": Derived(lambda s: (_fill(s.col(_TURB), 0) / 100.0) * (s.col("RakeTorque_pct") / 100.0),
+                             (_TURB, "RakeTorque_pct")),
+    "solids_flux_ratio": Derived(lambda s: _fill(s.col("Qf_m3h"), s.col("Qf_total_m3h")) * (s.col("Solids_f_pct") / 100.0)
+                                 / (s.col("Qu_m3h") + 1.0), ("Qf_m3h", "Qf_total_m3h", "Solids_f_pct", "Qu_m3h")),
+}
+
+
+@dataclass(frozen=True)
+class FeatureSpec:
+    """Feature groups of the notebook; the defaults are its cells."""
+
+    windows: Tuple[Tuple[str, int], ...] = WINDOWS
+    windows_long: Tuple[Tuple[str, int], ...] = WINDOWS_LONG
+    extrema_max_window: int = EXTREMA_MAX_WINDOW
+    roll_vars: Tuple[str, ...] = ROLL_VARS
+    roll_vars_long: Tuple[str, ...] = ROLL_VARS_LONG
+    lags: Tuple[int, ...] = LAGS
+    lag_vars: Tuple[str, ...] = LAG_VARS
+    delta_vars: Tuple[str, ...] = DELTA_VARS
+    time: Tuple[str, ...] = tuple(TIME_FEATURES)
+    flags: Tuple[str, ...] = tuple(FLAG_FEATURES)
+    sensor: Tuple[str, ...] = tuple(SENSOR_FEATURES)
+    interactions: Tuple[str, ...] = tuple(INTERACTION_FEATURES)
+    base: Tuple[str, ...] = BASE_FEAT_COLS
+
+
+@dataclass(frozen=True)
+class Feature:
+    """
+    One output column.
+
+    kind "roll": arg = (stat, window) of `var`; "lag": arg = k; "delta": arg = "d1" |
+    "d6" | "accel"; "base": the tag itself; "derived": arg = (function, rolling deps).
+    """
+
+    name: str
+    kind: str
+    var: Optional[str] = None
+    arg: object = None
+
+
+DERIVED: Dict[str, Derived] = {**TIME_FEATURES, **FLAG_FEATURES, **SENSOR_FEATURES, **INTERACTION_FEATURES}
+
+
+def _feature_inputs(f: Feature) -> Tuple[str, ...]:
+    if f.kind == "derived":
+        return f.arg.inputs + tuple(var for var, _, _ in f.arg.rolls)
+    return (f.var,)
+
+
+@dataclass(frozen=True)
+class FeaturePlan:
+    features: Tuple[Feature, ...]
+
+    @property
+    def names(self) -> List[str]:
+        return [f.name for f in self.features]
+
+    def inputs(self) -> List[str]:
+        """Timeseries tags the plan reads (besides the timestamp), in first-use order."""
+        tags: Dict[str, None] = {}
+        for f in self.features:
+            tags.update(dict.fromkeys(_feature_inputs(f)))
+        return list(tags)
+
+    def check_inputs(self, df: pd.DataFrame) -> None:
+        """
+        ValueError naming the first feature whose tag df lacks (e.g. an unknown name
+        parsed as a bare tag) or, outside the derived features, is not numeric.
+        """
+        for f in self.features:
+            for tag in _feature_inputs(f):
+                if tag not in df.columns:
+                    raise ValueError(f"{f.name}: needs column {tag!r}, not in the timeseries (unknown feature name?)")
+            if f.kind != "derived" and not pd.api.types.is_numeric_dtype(df[f.var]):
+                raise ValueError(f"{f.name}: column {f.var!r} is not numeric ({df[f.var].dtype}), it has no features")
+
+    def rolling_uses(self) -> Counter:
+        """(var, stat, window) -> number of features reading it."""
+        uses: Counter = Counter()
+        for f in self.features:
+            if f.kind == "roll":
+                uses[(f.var, *f.arg)] += 1
+            elif f.kind == "derived":
+                uses.update(f.arg.rolls)
+        return uses
+
+    def lookback(self) -> int:
+        """Rows before a row that its features read: longest window - 1, lag or delta."""
+        back = [w - 1 for _, _, w in self.rolling_uses()]
+        for f in self.features:
+            if f.kind == "lag":
+                back.append(f.arg)
+            elif f.kind == "delta":
+                back.append(2 if f.arg == "accel" else int(f.arg[1:]))
+        return max(back, default=0)
+
+    def block(self) -> int:
+        """
+        Row period of the rolling sums: mean / std windows restart their prefix sums every
+        sum_block(window) rows from the first row, so a row's value depends on which block
+        it falls in (last bits only). 1 when the plan has no such window.
+        """
+        return max((sum_block(w) for _, stat, w in self.rolling_uses() if stat not in EXTREMA_STATS + ("median",)),
+                   default=1)
+
+    def chunk_start(self, row: int) -> int:
+        """
+        First row of a chunk that computes rows row.. exactly as the whole series does:
+        lookback() rows earlier, rounded down to a multiple of block(). The chunk must also
+        end on a multiple of block() (or at the series end) for its last rows to match.
+        """
+        B = self.block()
+        return max(0, (row - self.lookback()) // B * B)
+
+
+def compile_plan(spec: FeatureSpec = FeatureSpec()) -> FeaturePlan:
+    """All features of `spec`, in the notebook's column order."""
+    feats: List[Feature] = [Feature(name, "derived", arg=TIME_FEATURES[name]) for name in spec.time]
+    for var in spec.roll_vars:
+        for label, w in spec.windows:
+            feats.append(Feature(f"{var}__rmean_{label}", "roll", var, ("mean", w)))
+            feats.append(Feature(f"{var}__rstd_{label}", "roll", var, ("std", w)))
+            if w <= spec.extrema_max_window:
+                feats.append(Feature(f"{var}__rmax_{label}", "roll", var, ("max", w)))
+                feats.append(Feature(f"{var}__rmin_{label}", "roll", var, ("min", w)))
+    for var in spec.roll_vars_long:
+        for label, w in spec.windows_long:
+            feats.append(Feature(f"{var}__rmean_{label}", "roll", var, ("mean", w)))
+            feats.append(Feature(f"{var}__rstd_{label}", "roll", var, ("std", w)))
+    feats += [Feature(f"{var}__lag_{k}", "lag", var, k) for var in spec.lag_vars for k in spec.lags]
+    feats += [Feature(f"{var}__{d}", "delta", var, d) for var in spec.delta_vars for d in ("d1", "d6", "accel")]
+    for group in (spec.flags, spec.sensor, spec.interactions):
+        feats += [Feature(name, "derived", arg=DERIVED[name]) for name in group]
+    feats += [Feature(var, "base", var) for var in spec.base]
+    return FeaturePlan(tuple(feats))
+
+
+_ROLL_NAME = re.compile(r"^(?P<var>.+)__r(?P<stat>mean|std|max|min)_(?P<n>\d+)(?P<unit>[mh])$")
+_LAG_NAME = re.compile(r"^(?P<var>.+)__lag_(?P<k>\d+)$")
+_DELTA_NAME = re.compile(r"^(?P<var>.+)__(?P<op>d\d+|accel)$")
+
+
+def parse_feature(name: str, step_min: int = STEP_MIN) -> Feature:
+    """
+    The Feature a column name stands for, in the notebook's naming scheme:
+    `<tag>__r{mean,std,max,min}_<n>{m,h}` (window as a duration), `<tag>__lag_<k>`,
+    `<tag>__d<k>` / `<tag>__accel`, a derived name (DERIVED) or a bare tag.
+    """
+    if name in DERIVED:
+        return Feature(name, "derived", arg=DERIVED[name])
+    m = _ROLL_NAME.match(name)
+    if m:
+        minutes = int(m["n"]) * (60 if m["unit"] == "h" else 1)
+        if minutes % step_min or not minutes:
+            raise ValueError(f"{name}: window of {minutes} min is not a positive multiple of the {step_min}-min step")
+        return Feature(name, "roll", m["var"], (m["stat"], minutes // step_min))
+    m = _LAG_NAME.match(name)
+    if m:
+        if not int(m["k"]):
+            raise ValueError(f"{name}: lag 0 is the tag itself; use {m['var']!r}")
+        return Feature(name, "lag", m["var"], int(m["k"]))
+    m = _DELTA_NAME.match(name)
+    if m:
+        if m["op"] != "accel" and not int(m["op"][1:]):
+            raise ValueError(f"{name}: a delta over 0 steps is always 0")
+        return Feature(name, "delta", m["var"], m["op"])
+    if "__" in name:
+        raise ValueError(f"Unknown feature name: {name!r}")
+    return Feature(name, "base", name)
+
+
+def plan_for(names: Sequence[str], step_min: int = STEP_MIN) -> FeaturePlan:
+    """Plan of exactly `names` (e.g. a list from feature_catalogs.json), in that order."""
+    return FeaturePlan(tuple(parse_feature(name, step_min) for name in names))
+
+
+class _Source:
+    """
+    Input tags as float64 arrays, time-of-day fields, and the plan's rolling stats:
+    one rolling_stats() pass per variable on first use (medians in their own pass,
+    they sort every window), each result dropped after its last reader.
+    """
+
+    def __init__(self, df: pd.DataFrame, time: pd.DatetimeIndex, uses: Counter,
+                 medians: Optional[Mapping[str, float]] = None):
+        self.df, self.time = df, time
+        self.uses = uses
+        self.medians = dict(medians or {})
+        self.stats: Dict[Tuple[str, str, int], np.ndarray] = {}
+
+    def col(self, name: str) -> np.ndarray:
+        return self.df[name].to_numpy(dtype=float)
+
+    def label(self, name: str) -> np.ndarray:
+        return self.df[name].to_numpy()
+
+    def median(self, name: str) -> float:
+        if name not in self.medians:
+            self.medians[name] = float(np.nanmedian(self.col(name)))
+        return self.medians[name]
+
+    @property
+    def hour(self) -> np.ndarray:
+        return self.time.hour.to_numpy(dtype=float)
+
+    @property
+    def hour_frac(self) -> np.ndarray:
+        return self.time.hour.to_numpy() + self.time.minute.to_numpy() / 60.0
+
+    @property
+    def dow(self) -> np.ndarray:
+        return self.time.dayofweek.to_numpy(dtype=float)
+
+    def roll(self, var: str, stat: str, window: int) -> np.ndarray:
+        key = (var, stat, window)
+        if key not in self.stats:
+            self._compute(var, median=stat == "median")
+        self.uses[key] -= 1
+        return self.stats.pop(key) if self.uses[key] <= 0 else self.stats[key]
+
+    def _compute(self, var: str, median: bool) -> None:
+        keys = [k for k, n in self.uses.items() if k[0] == var and n > 0 and (k[1] == "median") == median]
+        windows = sorted({w for _, _, w in keys})
+        stats = sorted({s for _, s, _ in keys})
+        out = rolling_stats(self.col(var), windows, stats, min_periods)
+        self.stats.update({k: out[k[1], k[2]] for k in keys})
+
+
+def _shift(x: np.ndarray, k: int) -> np.ndarray:
+    out = np.full_like(x, np.nan)
+    out[k:] = x[:-k]
+    return out
+
+
+def _diff(x: np.ndarray, k: int) -> np.ndarray:
+    out = np.full_like(x, np.nan)
+    out[k:] = x[k:] - x[:-k]
+    return out
+
+
+def _values(f: Feature, src: _Source) -> np.ndarray:
+    if f.kind == "roll":
+        return src.roll(f.var, *f.arg)
+    if f.kind == "lag":
+        return _shift(src.col(f.var), f.arg)
+    if f.kind == "delta":
+        x = src.col(f.var)
+        if f.arg == "accel":
+            return _diff(_diff(x, 1), 1)
+        return _diff(x, int(f.arg[1:]))
+    if f.kind == "base":
+        return src.col(f.var)
+    return f.arg.fn(src)
+
+
+def _time_index(df: pd.DataFrame) -> pd.DatetimeIndex:
+    if TIME_COLUMN in df.columns:
+        return pd.DatetimeIndex(df[TIME_COLUMN])
+    return pd.DatetimeIndex(df.index)
+
+
+def compute_features(
+    df: pd.DataFrame, plan: Optional[FeaturePlan] = None, start: int = 0, dtype=np.float32,
+    medians: Optional[Mapping[str, float]] = None,
+) -> np.ndarray:
+    """
+    (len(df) - start, len(plan.features)) matrix of the plan's features for df rows
+    start..end, in plan order; earlier rows only feed windows, lags and deltas.
+
+    df is a simulator timeseries in time order (timestamp column or DatetimeIndex).
+    The matrix is Fortran-ordered, so every feature is one contiguous column write.
+    `medians` replaces the series medians that gap fills use (pH_off_spec), e.g. the
+    whole series' when df is one chunk of it.
+    """
+    plan = plan or compile_plan()
+    plan.check_inputs(df)
+    src = _Source(df, _time_index(df), plan.rolling_uses(), medians)
+    X = np.empty((max(len(df) - start, 0), len(plan.features)), dtype=dtype, order="F")
+    for j, f in enumerate(plan.features):
+        X[:, j] = _values(f, src)[start:]
+    return X
+
+
+def series_medians(df: pd.DataFrame, plan: FeaturePlan) -> Dict[str, float]:
+    """The whole-series medians the plan's gap fills read (MEDIAN_TAGS among its inputs)."""
+    inputs = plan.inputs()
+    return {tag: float(np.nanmedian(df[tag].to_numpy(dtype=float))) for tag in MEDIAN_TAGS if tag in inputs}
+
+
+def time_blocks(n: int, plan: FeaturePlan, start: int = 0, rows: int = PARALLEL_MIN_ROWS) -> List[Tuple[int, int, int, int]]:
+    """
+    Rows start..n split into time blocks of ~`rows` (rounded up to plan.block()):
+    (lo, a, b, hi) computes rows a..b from rows lo..hi, lo = plan.chunk_start(a) (the left
+    halo) and hi = b, a multiple of plan.block() or n. Every block then equals the same
+    rows of the whole series exactly.
+    """
+    B = plan.block()
+    rows = -(-max(rows, 1) // B) * B
+    cuts = [start, *range((start // rows + 1) * rows, n, rows), n] if n > start else []
+    return [(plan.chunk_start(a), a, b, b) for a, b in zip(cuts, cuts[1:])]
+
+
+def _compute_block(job) -> np.ndarray:
+    chunk, names, start, dtype, medians = job
+    return compute_features(chunk, plan_for(names), start, dtype, medians)
+
+
+def compute_features_parallel(
+    df: pd.DataFrame, plan: Optional[FeaturePlan] = None, start: int = 0, dtype=np.float32,
+    medians: Optional[Mapping[str, float]] = None, max_workers: Optional[int] = None,
+    block_rows: Optional[int] = None,
+) -> np.ndarray:
+    """
+    compute_features() over time blocks in a process pool, equal to it value for value.
+
+    Each block (time_blocks: ~len(df) / workers rows, at least PARALLEL_MIN_ROWS) is
+    computed from its left halo on, with the whole series' medians; the workers rebuild
+    the plan from its names (plan_for), so custom plans need parseable names.
+
+    Workers are capped at os.cpu_count(); on one CPU, or for fewer than two blocks of
+    PARALLEL_MIN_ROWS, the pool only adds pickling and halo rows, so this is
+    compute_features() itself. An explicit block_rows always computes the blocks (in
+    this process when there is one worker), e.g. to check the halos on short series.
+    """
+    plan = plan or compile_plan()
+    plan.check_inputs(df)
+    cpus = os.cpu_count() or 1
+    workers = min(max_workers or cpus, cpus)
+    n = len(df)
+    rows = block_rows or max(PARALLEL_MIN_ROWS, -(-(n - start) // workers))
+    blocks = time_blocks(n, plan, start, rows)
+    medians = dict(series_medians(df, plan), **(medians or {}))
+    if len(blocks) <= 1 or (block_rows is None and (workers == 1 or n - start < 2 * PARALLEL_MIN_ROWS)):
+        return compute_features(df, plan, start, dtype, medians)
+    if plan_for(plan.names).features != plan.features:
+        raise ValueError("plan names do not parse back to the plan (plan_for); use compute_features")
+
+    frame = df[[c for c in dict.fromkeys([TIME_COLUMN, *plan.inputs()]) if c in df.columns]]
+    jobs = [(frame.iloc[lo:hi], plan.names, a - lo, dtype, medians) for lo, a, _, hi in blocks]
+    X = np.empty((max(n - start, 0), len(plan.features)), dtype=dtype, order="F")
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) if workers > 1 else nullcontext() as pool:
+        parts = pool.map(_compute_block, jobs) if pool is not None else map(_compute_block, jobs)
+        for (_, a, b, _), part in zip(blocks, parts):
+            X[a - start:b - start] = part
+    return X
+
+
+def _fill_gaps(col: np.ndarray) -> None:
+    # forward fill, then back-fill the leading gap (all-NaN columns stay NaN)
+    gaps = np.isnan(col)
+    if gaps.any() and not gaps.all():
+        idx = np.where(gaps, 0, np.arange(len(col)))
+        np.maximum.accumulate(idx, out=idx)
+        col[:] = col[idx]
+        head = np.isnan(col)
+        col[head] = col[np.argmin(head)]
+
+
+def fill_gaps(X: np.ndarray) -> np.ndarray:
+    """Forward- then back-fill the NaNs of every column of X in place, as the feature file stores them."""
+    for j in range(X.shape[1]):
+        _fill_gaps(X[:, j])
+    return X
+
+
+def clean_features(X: np.ndarray, names: Sequence[str]) -> Tuple[np.ndarray, List[str]]:
+    """
+    The notebook's cleanup, in place: forward- then back-fill NaNs per column, drop
+    constant columns (std < CONSTANT_STD) and later duplicates of a column. Kept columns
+    are moved left inside X; returns (view of the kept columns, their names).
+    """
+    n = X.shape[0]
+    keep: List[int] = []
+    seen: Dict[float, List[int]] = {}
+    for j in range(X.shape[1]):
+        col = X[:, j]
+        _fill_gaps(col)
+        if n < 2 or col.std(ddof=1, dtype=np.float64) < CONSTANT_STD:
+            continue
+        key = float(np.nansum(col, dtype=np.float64))
+        if any(np.array_equal(X[:, i], col, equal_nan=True) for i in seen.get(key, ())):
+            continue
+        X[:, len(keep)] = col
+        seen.setdefault(key, []).append(len(keep))
+        keep.append(j)
+    return X[:, :len(keep)], [names[j] for j in keep]
+
+
+def build_feature_frame(
+    ts: pd.DataFrame, spec: FeatureSpec = FeatureSpec(), warmup: int = WARMUP, dtype=np.float32,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """
+    The thickener_features.parquet table from a simulator timeseries: timestamp, the
+    cleaned features (FEATURES_ALL) and TARGET_COLS, rows from `warmup` on. workers > 1
+    computes time blocks in a process pool (compute_features_parallel), same values.
+    """
+    if not _time_index(ts).is_monotonic_increasing:
+        ts = ts.sort_values(TIME_COLUMN) if TIME_COLUMN in ts.columns else ts.sort_index()
+    plan = compile_plan(spec)
+    X = compute_features_parallel(ts, plan, warmup, dtype, max_workers=workers)
+    X, names = clean_features(X, plan.names)
+    feat = pd.DataFrame(X, columns=names, copy=False)
+    feat.insert(0, TIME_COLUMN, _time_index(ts)[warmup:])
+    for col in TARGET_COLS:
+        feat[col] = ts[col].to_numpy()[warmup:]
+    return feat
+
+
+def materialize(
+    ts: pd.DataFrame, names: Sequence[str], start: int = WARMUP, dtype=np.float32,
+    medians: Optional[Mapping[str, float]] = None, workers: int = 1,
+) -> pd.DataFrame:
+    """
+    Only the features `names`, rows start.. of ts, as thickener_features.parquet stores
+    them (gaps forward- / back-filled); nothing else is computed. ts needs the
+    timestamp and plan_for(names).inputs() only.
+    """
+    X = fill_gaps(compute_features_parallel(ts, plan_for(names), start, dtype, medians, max_workers=workers))
+    return pd.DataFrame(X, columns=list(names), copy=False)
@@ -0,0 +1,213 @@
+"""
+kernels.py - array recursions used by the simulator state variables.
+
+The simulator advances several latent drivers with first-order recursions.
+Running them element by element in Python dominates wall time on long, fine-grained
+horizons (1 year at 1 min = 525,600 steps), so the recursions live here as
+whole-array kernels.
+
+Fleets (K units advanced together) use the *_units variants: below LOCKSTEP_MIN_UNITS
+they run the 1-D kernel per unit, above it they step all units together, one
+vectorized step per row, which costs about the same as a few 1-D runs.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+LOCKSTEP_MIN_UNITS = 4
+
+
+def _ar1_block_size(a: float, max_block: int = 4096) -> int:
+    # Largest block for which a**-block stays far from overflow (|a|**-block <= 1e10).
+    # a == 0 never divides by a power (ar1_step copies u), so any block will do.
+    if a == 0.0 or abs(a) >= 1.0:
+        return max_block
+    return int(np.clip(np.log(1e10) / -np.log(abs(a)), 1, max_block))
+
+
+@dataclass
+class AR1State:
+    """
+    Resumable state of ar1_filter: feeding a series in consecutive pieces through
+    ar1_step() gives exactly the same floats as one call over the whole series.
+    """
+
+    a: float
+    s: float            # filter output just before the current block
+    S: float = 0.0      # scaled partial cumulative sum inside the current block
+    k: int = 0          # position inside the current block
+
+    def __post_init__(self):
+        self.block = _ar1_block_size(self.a)
+        self.apow = self.a ** np.arange(self.block)
+        self.a_block = self.a ** self.block
+
+
+def _ar1_partial(u: np.ndarray, st: AR1State) -> np.ndarray:
+    # piece lying inside a single block, starting at st.k
+    ap = st.apow[st.k:st.k + len(u)]
+    S = np.cumsum(np.concatenate(([st.S], u / ap)))[1:]
+    Z = S * ap
+    y = Z + st.s * (ap * st.a)
+    st.k += len(u)
+    if st.k == st.block:
+        st.s = Z[-1] + st.a_block * st.s
+        st.S, st.k = 0.0, 0
+    else:
+        st.S = S[-1]
+    return y
+
+
+def ar1_step(u: np.ndarray, st: AR1State) -> np.ndarray:
+    """Advance an AR1State over the innovations u; returns the filter output for u."""
+    u = np.asarray(u, dtype=float)
+    n = len(u)
+    if n == 0:
+        return u.copy()
+    if st.a == 0.0:
+        st.s = float(u[-1])
+        return u.copy()
+
+    out = []
+    i = 0
+    if st.k:
+        i = min(st.block - st.k, n)
+        out.append(_ar1_partial(u[:i], st))
+
+    nb = (n - i) // st.block
+    if nb:
+        U = u[i:i + nb * st.block].reshape(nb, st.block)
+        # zero-state response inside each block: Z[b, k] = sum_{j<=k} a^(k-j) * U[b, j]
+        Z = np.cumsum(np.concatenate((np.zeros((nb, 1)), U / st.apow), axis=1), axis=1)[:, 1:] * st.apow
+
+        # propagate block carries: y[b, k] = Z[b, k] + a^(k+1) * s_b
+        carry = np.empty(nb)
+        s = st.s
+        for b in range(nb):
+            carry[b] = s
+            s = Z[b, -1] + st.a_block * s
+        st.s = s
+        out.append((Z + np.outer(carry, st.apow * st.a)).reshape(-1))
+        i += nb * st.block
+
+    if i < n:
+        out.append(_ar1_partial(u[i:], st))
+    return np.concatenate(out)
+
+
+def ar1_filter(u: np.ndarray, a: float, y0: float = 0.0) -> np.ndarray:
+    """
+    First-order recursive filter  y[i] = a * y[i-1] + u[i],  with y[-1] = y0.
+
+    All innovations are passed in `u` (draw the noise up front), so the result is
+    fully determined by the caller's RNG stream. The recursion is solved in blocks:
+    inside a block the zero-state response is a scaled cumulative sum, and only the
+    block carries are propagated sequentially (n / block Python steps). Blocks are
+    aligned to the start of the series, so chunked runs (ar1_step) match exactly.
+    """
+    return ar1_step(u, AR1State(a, float(y0)))
+
+
+def clipped_cumsum(
+    y0: float,
+    terms: np.ndarray | list,
+    lo: float,
+    hi: float,
+    min_block: int = 16,
+    max_block: int = 65536,
+) -> np.ndarray:
+    """
+    Bounded integrator  y[i] = clip(y[i-1] + t0[i] + t1[i] + ..., lo, hi),  with y[-1] = y0.
+
+    `terms` is a 1-D increment array or a sequence / (n, k) array of increments that are
+    added left to right, exactly as in the scalar loop, so the result is bit-identical to
+    it. Subtractions should be passed as negated terms (x - d == x + (-d) in IEEE 754).
+
+    The kernel alternates two vectorized phases:
+    - free: a sequential np.cumsum from the current state until the first bound crossing;
+    - saturated: while pinned at a bound, candidate values bound + terms are evaluated
+      for a whole block and the first step that leaves the bound is located.
+    Blocks start small after every phase switch and double while a phase persists.
+    """
+    if isinstance(terms, (list, tuple)):
+        T = np.column_stack([np.asarray(t, dtype=float) for t in terms])
+    else:
+        T = np.asarray(terms, dtype=float)
+        if T.ndim == 1:
+            T = T[:, None]
+    n, k = T.shape
+    out = np.empty(n)
+
+    y = float(y0)
+    i = 0
+    block = min_block
+    while i < n:
+        j = min(n, i + block)
+        seg = T[i:j]
+        m = j - i
+
+        if lo < y < hi:
+            # free phase: sequential cumsum reproduces ((y + t0) + t1) + ... per step
+            flat = np.empty(m * k + 1)
+            flat[0] = y
+            flat[1:] = seg.ravel()
+            cs = np.cumsum(flat)[k::k]
+            exits = np.flatnonzero((cs < lo) | (cs > hi))
+            if len(exits) == 0:
+                out[i:j] = cs
+                y = float(cs[-1])
+                i = j
+                block = min(2 * block, max_block)
+                continue
+            f = int(exits[0])
+            out[i:i + f] = cs[:f]
+            y = min(max(float(cs[f]), lo), hi)
+        else:
+            # saturated phase: stays pinned while clip(y + terms) == y
+            c = np.full(m, y)
+            for col in range(k):
+                c = c + seg[:, col]
+            c = np.clip(c, lo, hi)
+            leaves = np.flatnonzero(c != y)
+            if len(leaves) == 0:
+                out[i:j] = y
+                i = j
+                block = min(2 * block, max_block)
+                continue
+            f = int(leaves[0])
+            out[i:i + f] = y
+            y = float(c[f])
+
+        out[i + f] = y
+        i += f + 1
+        block = min_block
+
+    return out
+
+
+def clipped_cumsum_units(y0: np.ndarray, terms: list, lo: float, hi: float) -> np.ndarray:
+    """
+    clipped_cumsum for K independent units: y0 (K,), terms a list of (K, n) increments.
+
+    Each row of the (K, n) result is bit-identical to clipped_cumsum(y0[k], [t[k] for t
+    in terms], lo, hi): the lockstep path adds the terms left to right and clips, per
+    step, exactly like the scalar loop.
+    """
+    y0 = np.asarray(y0, dtype=float)
+    K = len(y0)
+    n = terms[0].shape[1] if K else 0
+    if K < LOCKSTEP_MIN_UNITS:
+        return np.stack([clipped_cumsum(y0[k], [t[k] for t in terms], lo, hi) for k in range(K)]).reshape(K, n)
+
+    steps = [np.ascontiguousarray(np.asarray(t, dtype=float).T) for t in terms]
+    out = np.empty((n, K))
+    y = y0.copy()
+    for i in range(n):
+        for t in steps:
+            y = y + t[i]
+        np.clip(y, lo, hi, out=y)
+        out[i] = y
+    return out.T.copy()
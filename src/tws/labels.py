@@ -0,0 +1,60 @@
+"""
+labels.py - run-length labeling of sustained threshold crossings.
+
+Crisis labels ("clean turbidity above event_limit_NTU for >= sustain_points") and
+episode tables both reduce to run-length encoding of a boolean mask. Everything here
+is a single O(n) numpy pass: no pandas rolling windows, no Python loops over samples.
+
+Conventions:
+- run / episode starts are inclusive indices;
+- run_bounds() ends are exclusive (slice-friendly), find_episodes() ends are inclusive
+  (same as the (idx_start, idx_end) tuples used in lead_time_analysis.py).
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+
+def run_bounds(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Start (inclusive) and end (exclusive) indices of every run of True values."""
+    m = np.asarray(mask, dtype=bool)
+    edges = np.diff(m.astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def sustained_mask(mask: np.ndarray, sustain_points: int) -> np.ndarray:
+    """
+    True at i when mask[i - sustain_points + 1 : i + 1] is all True.
+
+    Equivalent to a rolling sum == sustain_points with min_periods=sustain_points:
+    inside every run of length L >= sustain_points, the last L - sustain_points + 1
+    points are flagged.
+    """
+    m = np.asarray(mask, dtype=bool)
+    if sustain_points <= 1:
+        return m.copy()
+    n = len(m)
+    starts, ends = run_bounds(m)
+    keep = (ends - starts) >= sustain_points
+    delta = np.zeros(n + 1, dtype=np.int32)
+    delta[starts[keep] + sustain_points - 1] += 1
+    delta[ends[keep]] -= 1
+    return np.cumsum(delta[:n]) > 0
+
+
+def sustained_above(x: np.ndarray, threshold: float, sustain_points: int) -> np.ndarray:
+    """x > threshold for at least sustain_points consecutive samples (NaN counts as below)."""
+    return sustained_mask(np.asarray(x) > threshold, sustain_points)
+
+
+def find_episodes(mask: np.ndarray, min_points: int = 1) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Episodes = runs of True with at least min_points samples.
+
+    Returns (start, end, duration) index arrays; end is inclusive, duration in points.
+    """
+    starts, ends = run_bounds(np.asarray(mask) == 1)
+    durations = ends - starts
+    keep = durations >= min_points
+    return starts[keep], ends[keep] - 1, durations[keep]
@@ -0,0 +1,283 @@
+"""
+online.py - incremental feature state for live scoring: one update per new row.
+
+OnlineFeatures keeps, per input tag, a ring buffer of the last rows (the longest
+window, lag or delta it feeds: 288 points for the 24 h windows) and per window:
+
+- count and running sums of d = x - ref, added for the entering row and subtracted
+  for the leaving one. Every `window` updates, and whenever the window's variance
+  becomes small next to the squares the sums have carried (a spike leaving), they
+  are re-summed from the ring buffer around the window mean, so rounding error stays
+  that of one window (amortized O(1));
+- min / max: monotonic deques of (row, value), amortized O(1);
+- median: the window's valid values kept sorted (bisect, O(log w) search).
+
+Lags and deltas read the ring buffer. Time, flag, sensor and interaction features
+are the DERIVED functions of tws.features, evaluated on this row's scalars, so online
+and batch share one definition per feature. The output row is forward-filled per
+feature, as in thickener_features.parquet (which also back-fills its first rows: the
+two agree once every feature has had a first valid value).
+
+The batch pH_off_spec fills pH gaps with the median of the whole series; online the
+fill is `medians["pH_feed"]` (e.g. the training-set median), gaps count as in spec
+without one.
+
+    state = OnlineFeatures(catalogs["FEATURES_PROD"], medians={"pH_feed": 8.6})
+    for row in stream:                       # mapping: timestamp + tags
+        x = state.update(row)                # float64 vector in catalog order
+"""
+
+from __future__ import annotations
+
+import math
+import operator
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import datetime
+from typing import Dict, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from tws.features import STEP_MIN, TIME_COLUMN, FeaturePlan, min_periods, plan_for
+
+NAN = float("nan")
+STD_RESUM = 1e-6        # re-sum a window when its centred sum of squares falls below this share of the squares carried
+
+
+def _value(v) -> float:
+    if v is None:
+        return NAN
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return NAN
+
+
+class _Window:
+    """Trailing-window state of one tag for one window length (only the stats asked for)."""
+
+    __slots__ = ("w", "mp", "ring", "ref", "n", "s1", "s2", "mass", "age", "hi", "lo", "sorted")
+
+    def __init__(self, w: int, stats: set, ring: "_Ring"):
+        self.w, self.mp, self.ring = w, max(min_periods(w), 1), ring
+        self.ref, self.n, self.s1, self.s2, self.mass, self.age = NAN, 0, 0.0, 0.0, 0.0, 0
+        self.hi: Optional[deque] = deque() if "max" in stats else None
+        self.lo: Optional[deque] = deque() if "min" in stats else None
+        self.sorted: Optional[list] = [] if "median" in stats else None
+
+    def push(self, t: int, x: float, old: float) -> None:
+        if x == x:
+            if self.ref != self.ref:
+                self.ref = x
+            d = x - self.ref
+            self.n += 1
+            self.s1 += d
+            self.s2 += d * d
+            self.mass += d * d
+        if old == old:
+            d = old - self.ref
+            self.n -= 1
+            self.s1 -= d
+            self.s2 -= d * d
+            self.mass += d * d
+        self.age += 1
+        if self.age >= self.w:
+            self._resum()
+
+        if self.hi is not None:
+            _push_extreme(self.hi, t, x, self.w, operator.le)
+        if self.lo is not None:
+            _push_extreme(self.lo, t, x, self.w, operator.ge)
+        if self.sorted is not None:
+            if old == old:
+                del self.sorted[bisect_left(self.sorted, old)]
+            if x == x:
+                insort(self.sorted, x)
+
+    def _resum(self) -> None:
+        # exact sums of the window, centred on its mean
+        vals = [v for v in self.ring.last(self.w) if v == v]
+        self.age = 0
+        self.n = len(vals)
+        if not vals:
+            self.ref, self.s1, self.s2, self.mass = NAN, 0.0, 0.0, 0.0
+            return
+        self.ref = sum(vals) / len(vals)
+        self.s1 = sum(v - self.ref for v in vals)
+        self.s2 = self.mass = sum((v - self.ref) ** 2 for v in vals)
+
+    def stat(self, stat: str) -> float:
+        n = self.n
+        if n < self.mp:
+            return NAN
+        if stat == "mean":
+            return self.ref + self.s1 / n
+        if stat == "std":
+            if n < 2:
+                return NAN
+            m2 = self.s2 - self.s1 * self.s1 / n
+            if m2 < STD_RESUM * self.mass:
+                # the sums carried (and dropped) far larger squares than the window's own,
+                # e.g. a spike that just left: their rounding would dominate
+                self._resum()
+                m2 = self.s2 - self.s1 * self.s1 / n
+            return math.sqrt(max(m2 / (n - 1), 0.0))
+        if stat == "max":
+            return self.hi[0][1]
+        if stat == "min":
+            return self.lo[0][1]
+        s = self.sorted
+        return 0.5 * (s[(n - 1) // 2] + s[n // 2])
+
+
+def _push_extreme(dq: deque, t: int, x: float, w: int, dominated) -> None:
+    # dominated(old, new): old can never be the window extremum again
+    if x == x:
+        while dq and dominated(dq[-1][1], x):
+            dq.pop()
+        dq.append((t, x))
+    while dq and dq[0][0] <= t - w:
+        dq.popleft()
+
+
+class _Ring:
+    """The last `size` values of one tag (NaN before the first row)."""
+
+    __slots__ = ("buf", "size", "t")
+
+    def __init__(self, size: int):
+        self.buf, self.size, self.t = [NAN] * size, size, -1
+
+    def push(self, x: float) -> None:
+        self.t += 1
+        self.buf[self.t % self.size] = x
+
+    def back(self, k: int) -> float:
+        """Value k rows before the newest (k < size)."""
+        return self.buf[(self.t - k) % self.size] if k <= self.t else NAN
+
+    def last(self, w: int) -> list:
+        return [self.back(k) for k in range(min(w, self.t + 1))]
+
+
+class _Tag:
+    """Ring buffer and windows of one input tag."""
+
+    def __init__(self, history: int, windows: Dict[int, set]):
+        # the ring also holds the row leaving each window (w rows back)
+        self.ring = _Ring(max([history] + list(windows)) + 1)
+        self.windows = {w: _Window(w, stats, self.ring) for w, stats in windows.items()}
+
+    def push(self, x: float) -> None:
+        ring = self.ring
+        ring.push(x)
+        for w, win in self.windows.items():
+            win.push(ring.t, x, ring.back(w))
+
+
+class _RowSource:
+    """The tws.features source interface on the current row (scalars)."""
+
+    def __init__(self, state: "OnlineFeatures"):
+        self.state = state
+        self.row: Mapping = {}
+        self.time: Optional[datetime] = None
+
+    def col(self, name: str) -> float:
+        return _value(self.row.get(name))
+
+    def label(self, name: str):
+        return self.row.get(name)
+
+    def median(self, name: str) -> float:
+        return self.state.medians.get(name, NAN)
+
+    @property
+    def hour(self) -> float:
+        return float(self.time.hour)
+
+    @property
+    def hour_frac(self) -> float:
+        return self.time.hour + self.time.minute / 60.0
+
+    @property
+    def dow(self) -> float:
+        return float(self.time.weekday())
+
+    def roll(self, var: str, stat: str, window: int) -> float:
+        return self.state.tags[var].windows[window].stat(stat)
+
+
+class OnlineFeatures:
+    """
+    Features `names` (any catalog list, see tws.features.plan_for) updated one row at a
+    time; update() costs O(1) amortized per rolling window (O(log w) for medians).
+    """
+
+    def __init__(self, names: Sequence[str], medians: Optional[Mapping[str, float]] = None,
+                 step_min: int = STEP_MIN):
+        self.plan: FeaturePlan = plan_for(names, step_min)
+        self.names = list(names)
+        self.medians = dict(medians or {})
+        history: Dict[str, int] = {}
+        windows: Dict[str, Dict[int, set]] = {}
+        for f in self.plan.features:
+            if f.kind == "lag":
+                history[f.var] = max(history.get(f.var, 0), f.arg)
+            elif f.kind == "delta":
+                history[f.var] = max(history.get(f.var, 0), 2 if f.arg == "accel" else int(f.arg[1:]))
+        for var, stat, w in self.plan.rolling_uses():
+            windows.setdefault(var, {}).setdefault(w, set()).add(stat)
+        self.tags = {var: _Tag(history.get(var, 0), windows.get(var, {}))
+                     for var in self.plan.inputs() if var in history or var in windows}
+        self.src = _RowSource(self)
+        self.out = np.full(len(self.names), NAN)
+        self.getters = [self._getter(f) for f in self.plan.features]
+
+    def _getter(self, f):
+        src = self.src
+        if f.kind == "roll":
+            win = self.tags[f.var].windows[f.arg[1]]
+            stat = f.arg[0]
+            return lambda: win.stat(stat)
+        if f.kind == "lag":
+            ring, k = self.tags[f.var].ring, f.arg
+            return lambda: ring.back(k)
+        if f.kind == "delta":
+            ring = self.tags[f.var].ring
+            if f.arg == "accel":
+                return lambda: (ring.back(0) - ring.back(1)) - (ring.back(1) - ring.back(2))
+            k = int(f.arg[1:])
+            return lambda: ring.back(0) - ring.back(k)
+        if f.kind == "base":
+            name = f.var
+            return lambda: src.col(name)
+        fn = f.arg.fn
+        return lambda: float(fn(src))
+
+    def update(self, row: Mapping) -> np.ndarray:
+        """
+        Add one row (mapping with TIME_COLUMN and the input tags; missing / None tags are
+        gaps) and return the feature vector for it, forward-filled (a view, reused).
+        """
+        ts = row[TIME_COLUMN]
+        self.src.row = row
+        self.src.time = ts if isinstance(ts, datetime) else pd.Timestamp(ts)
+        for var, tag in self.tags.items():
+            tag.push(_value(row.get(var)))
+        out = self.out
+        for j, get in enumerate(self.getters):
+            v = get()
+            if v == v:
+                out[j] = v
+        return out
+
+    def run(self, ts: pd.DataFrame) -> np.ndarray:
+        """Replay a timeseries frame row by row; (len(ts), len(names)) matrix of the outputs."""
+        cols = [TIME_COLUMN] + [c for c in dict.fromkeys(self.plan.inputs()) if c in ts.columns]
+        X = np.empty((len(ts), len(self.names)))
+        for i, rec in enumerate(ts[cols].to_dict("records")):
+            X[i] = self.update(rec)
+        return X
+
@@ -0,0 +1,164 @@
+"""
+quantiles.py - quantiles of long series computed chunk by chunk.
+
+The simulator normalizes stress components by their 1st/99th percentiles and
+calibrates the turbidity scale on the lowest ~5% of window crossing scales. Both only
+need the extreme order statistics of a series, so a chunked run can keep the k
+smallest / largest values instead of the whole series and still get the exact result.
+
+Live runs cannot wait for the whole series: LogQuantileSketch estimates any quantile
+of everything seen so far in fixed memory, with a bounded relative error.
+"""
+
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+
+def tail_size(q: float, n: int) -> int:
+    """Order statistics needed (per tail) for the q-th percentile of n values."""
+    return int(math.floor(min(q, 100.0 - q) / 100.0 * max(n - 1, 0))) + 2
+
+
+class TailCollector:
+    """Keeps the k_low smallest and k_high largest non-NaN values seen so far."""
+
+    def __init__(self, k_low: int = 0, k_high: int = 0):
+        self.k_low = int(k_low)
+        self.k_high = int(k_high)
+        self.count = 0
+        self._low = np.empty(0)
+        self._high = np.empty(0)
+
+    def update(self, x: np.ndarray) -> None:
+        x = np.asarray(x, dtype=float).ravel()
+        x = x[~np.isnan(x)]
+        self.count += len(x)
+        if self.k_low:
+            lo = np.concatenate([self._low, x])
+            if len(lo) > self.k_low:
+                lo = np.partition(lo, self.k_low - 1)[: self.k_low]
+            self._low = lo
+        if self.k_high:
+            hi = np.concatenate([self._high, x])
+            if len(hi) > self.k_high:
+                hi = np.partition(hi, len(hi) - self.k_high)[len(hi) - self.k_high:]
+            self._high = hi
+
+    @property
+    def low(self) -> np.ndarray:
+        """Smallest values, ascending."""
+        return np.sort(self._low)
+
+    @property
+    def high(self) -> np.ndarray:
+        """Largest values, ascending."""
+        return np.sort(self._high)
+
+    def order_stat(self, j: int) -> float:
+        """j-th smallest value (0-based) of everything seen, if it falls inside a tail."""
+        if j < len(self._low):
+            return float(self.low[j])
+        from_top = self.count - 1 - j
+        if 0 <= from_top < len(self._high):
+            return float(self.high[len(self._high) - 1 - from_top])
+        raise ValueError(f"order statistic {j} of {self.count} is not inside the kept tails")
+
+    def percentile(self, q: float) -> float:
+        """Same value as np.nanpercentile(x, q) (method='linear') over all updates."""
+        if self.count == 0:
+            return float("nan")
+        virtual = (self.count - 1) * (q / 100.0)
+        j = int(math.floor(virtual))
+        t = virtual - j
+        a = self.order_stat(j)
+        if j + 1 >= self.count:
+            return a
+        b = self.order_stat(j + 1)
+        # numpy's _lerp: interpolate from the nearer end
+        diff = b - a
+        return b - diff * (1 - t) if t >= 0.5 else a + diff * t
+
+
+class LogQuantileSketch:
+    """
+    Streaming quantiles in fixed memory with relative value error <= alpha (DDSketch,
+    Masson et al. 2019): values are counted in logarithmic buckets gamma^(i-1) < |x| <= gamma^i,
+    gamma = (1 + alpha) / (1 - alpha), plus one zero bucket.
+
+    Each sign keeps n_bins consecutive buckets (alpha=0.005, 2048 bins: ~9 decades).
+    When a store would span more, its lowest-magnitude buckets are merged into the first
+    one, so quantiles of the largest magnitudes stay accurate. Memory is independent of
+    the number of updates; the state is three small arrays (state() / from_state()).
+    """
+
+    def __init__(self, alpha: float = 0.005, n_bins: int = 2048):
+        self.alpha = float(alpha)
+        self.n_bins = int(n_bins)
+        self.log_gamma = math.log((1 + self.alpha) / (1 - self.alpha))
+        self.counts = np.zeros((2, self.n_bins), dtype=np.int64)    # [positive, negative] stores
+        self.offset = np.zeros(2, dtype=np.int64)                   # bucket index of counts[s, 0]
+        self.zeros = 0
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum()) + self.zeros
+
+    def _add(self, s: int, idx: np.ndarray) -> None:
+        counts, occupied = self.counts[s], np.flatnonzero(self.counts[s])
+        lo, hi = int(idx.min()), int(idx.max())
+        if len(occupied):
+            lo, hi = min(lo, int(self.offset[s] + occupied[0])), max(hi, int(self.offset[s] + occupied[-1]))
+        new_off = max(lo, hi - self.n_bins + 1)
+        merged = np.zeros(self.n_bins, dtype=np.int64)
+        if len(occupied):
+            np.add.at(merged, np.maximum(self.offset[s] + occupied, new_off) - new_off, counts[occupied])
+        merged += np.bincount(np.maximum(idx, new_off) - new_off, minlength=self.n_bins)
+        self.counts[s], self.offset[s] = merged, new_off
+
+    def update(self, x: np.ndarray) -> None:
+        x = np.asarray(x, dtype=float).ravel()
+        x = x[~np.isnan(x)]
+        self.zeros += int(np.count_nonzero(x == 0.0))
+        for s, part in ((0, x[x > 0]), (1, -x[x < 0])):
+            if len(part):
+                self._add(s, np.ceil(np.log(part) / self.log_gamma).astype(np.int64))
+
+    def _value(self, rank: int) -> float:
+        # representative value of the rank-th smallest item: negatives (largest magnitude
+        # first), zeros, positives
+        neg = int(self.counts[1].sum())
+        if rank < neg:
+            j = np.searchsorted(np.cumsum(self.counts[1][::-1]), rank, side="right")
+            return -self._bucket_value(self.n_bins - 1 - j + int(self.offset[1]))
+        rank -= neg
+        if rank < self.zeros:
+            return 0.0
+        j = np.searchsorted(np.cumsum(self.counts[0]), rank - self.zeros, side="right")
+        return self._bucket_value(j + int(self.offset[0]))
+
+    def _bucket_value(self, i: int) -> float:
+        return 2.0 * math.exp(i * self.log_gamma) / (1.0 + math.exp(self.log_gamma))
+
+    def percentile(self, q: float) -> float:
+        """Estimate of np.nanpercentile(x, q) (linear interpolation) over all updates."""
+        n = self.count
+        if n == 0:
+            return float("nan")
+        virtual = (n - 1) * (q / 100.0)
+        j = int(math.floor(virtual))
+        a = self._value(j)
+        if j + 1 >= n:
+            return a
+        return a + (self._value(j + 1) - a) * (virtual - j)
+
+    def state(self) -> dict:
+        return {"counts": self.counts.copy(), "offset": self.offset.copy(), "zeros": np.array(self.zeros)}
+
+    @classmethod
+    def from_state(cls, state: dict, alpha: float = 0.005) -> "LogQuantileSketch":
+        sk = cls(alpha, state["counts"].shape[1])
+        sk.counts, sk.offset, sk.zeros = state["counts"].copy(), state["offset"].copy(), int(state["zeros"])
+        return sk
@@ -0,0 +1,319 @@
+"""
+rolling.py - trailing-window statistics on numpy arrays.
+
+One kernel library for the simulator (rolling std / mean inside the engine) and the
+feature pipeline (rolling mean / std / min / max / median of every ROLL_VARS column),
+in place of per-window pandas `s.rolling(w)` calls and their temporary Series.
+
+Semantics follow pandas `Series.rolling(window, min_periods)` on a trailing window:
+NaNs are skipped, a row is NaN when its window holds fewer than `min_periods` valid
+values (default: the full window), std / var use ddof=1 and are NaN below 2 valid
+values. Inputs may be 1-D or (K, n); windows run along the last axis.
+
+rolling_stats() serves every window of a variable from one pass of shared state:
+- mean / std / var / sum / count: prefix sums of count, x and x**2, restarted every
+  block of ~2 windows and taken relative to the block mean, so the cancellation error
+  stays that of a one-window sum; every window then is a difference of prefixes, and
+  windows of the same block size share one set of prefixes;
+- min / max: a doubling table (max over 1, 2, 4, ... points), built once up to the
+  longest window; any window is the max of two overlapping table entries. Same values
+  as a monotonic deque, but whole-array. Windows whose max equals their min get a
+  variance of exactly 0 (prefix-sum differences leave ~1e-12 residues there);
+- median: sorted sliding windows (NaNs last, middle of the valid count), in row
+  blocks of bounded size.
+
+Prefix-sum values depend (in the last bits) on where the series starts. The
+simulator, which must give the same floats for any chunking, uses rolling_local():
+explicit sums over the window offsets, so a row depends only on its own window; for
+long windows (fine internal steps), rolling_aligned(): prefix sums restarted at
+absolute block boundaries, so a row depends only on its block and the previous one.
+"""
+
+from __future__ import annotations
+
+import warnings
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+import numpy as np
+
+MinPeriods = Union[None, int, Callable[[int], int]]
+
+MOMENT_STATS = ("count", "sum", "mean", "var", "std")
+EXTREMA_STATS = ("min", "max")
+STATS = MOMENT_STATS + EXTREMA_STATS + ("median",)
+
+MIN_SUM_BLOCK = 64                  # prefix sums restart every max(64, 2 * window) rows (power of 2)
+MEDIAN_BLOCK_ELEMENTS = 1 << 21     # rows x window values sorted per median block
+
+
+def sum_block(window: int) -> int:
+    """Restart period of the prefix sums for `window`: max(MIN_SUM_BLOCK, 2 * window) rounded up to a power of 2."""
+    return max(MIN_SUM_BLOCK, 1 << (2 * window - 1).bit_length())
+
+
+def min_periods_for(window: int, min_periods: MinPeriods = None) -> int:
+    """min_periods as pandas resolves it: None -> window; callables map window -> int."""
+    mp = window if min_periods is None else int(min_periods(window) if callable(min_periods) else min_periods)
+    if not 0 <= mp <= window:
+        raise ValueError(f"min_periods {mp} must be in [0, {window}]")
+    return mp
+
+
+class _BlockSums:
+    """
+    Prefix sums of count, d and d**2 restarted every `block` rows, d = x - (block mean).
+
+    Restarting keeps the prefixes (and their rounding error) at the scale of one block
+    instead of the whole series; block >= window, so a window spans at most the tail of
+    the previous block and the head of its own.
+    """
+
+    def __init__(self, x: np.ndarray, block: int, var: bool, shift: str = "mean"):
+        n = x.shape[-1]
+        nb = -(-n // block)
+        xb = np.pad(x, [(0, 0)] * (x.ndim - 1) + [(0, nb * block - n)], constant_values=np.nan)
+        xb = xb.reshape(x.shape[:-1] + (nb, block))
+        valid = ~np.isnan(xb)
+        if shift == "first":
+            # the block's first value (0 if NaN): known as soon as the block starts
+            self.shift = np.nan_to_num(xb[..., :1], nan=0.0)                   # (..., nb, 1)
+        else:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)     # all-NaN blocks
+                self.shift = np.nan_to_num(np.nanmean(xb, axis=-1))[..., None]     # (..., nb, 1)
+        d = np.where(valid, xb - self.shift, 0.0)
+        pad = [(0, 0)] * (x.ndim - 1) + [(0, 0), (1, 0)]
+        self.cnt = np.pad(np.cumsum(valid, axis=-1, dtype=float), pad)        # (..., nb, block + 1)
+        self.s1 = np.pad(np.cumsum(d, axis=-1), pad)
+        self.s2 = np.pad(np.cumsum(d * d, axis=-1), pad) if var else None
+        self.delta = np.diff(self.shift, axis=-2, prepend=self.shift[..., :1, :])
+        self.n, self.block = n, block
+
+    def _parts(self, c: np.ndarray, w: int) -> Tuple[np.ndarray, np.ndarray]:
+        # own-block part (..., nb, block) of the trailing-w sums, and the previous block's
+        # tail (..., nb, w - 1) that completes the first w - 1 rows of every block
+        B = self.block
+        own = c[..., 1:] - c[..., :1]
+        own[..., w - 1:] = c[..., w:] - c[..., :B + 1 - w]
+        tail = np.zeros(c.shape[:-1] + (w - 1,))
+        tail[..., 1:, :] = c[..., :-1, B:] - c[..., :-1, B + 1 - w:B]
+        return own, tail
+
+    def window(self, w: int) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray], np.ndarray]:
+        """(count, sum of d, sum of d**2, shift) over the trailing w rows, d relative to shift."""
+        h = w - 1
+        n, n1 = self._parts(self.cnt, w)
+        a, a1 = self._parts(self.s1, w)
+        # re-centre the previous block's tail on this block's shift
+        n[..., :h] += n1
+        a[..., :h] += a1 - n1 * self.delta
+        q = None
+        if self.s2 is not None:
+            q, q1 = self._parts(self.s2, w)
+            q[..., :h] += q1 - 2.0 * self.delta * a1 + n1 * self.delta * self.delta
+        shift = np.broadcast_to(self.shift, a.shape)
+        flat = a.shape[:-2] + (-1,)
+        return tuple(
+            None if v is None else v.reshape(flat)[..., :self.n] for v in (n, a, q, shift)
+        )
+
+
+def _moments(
+    x: np.ndarray, windows, stats, mp: Dict[int, int], ddof: int, flat: Dict[int, np.ndarray]
+) -> Dict[Tuple[str, int], np.ndarray]:
+    need_var = any(s in ("var", "std") for s in stats)
+    sums: Dict[int, _BlockSums] = {}
+    out = {}
+    for w in windows:
+        block = sum_block(w)
+        if block not in sums:
+            sums[block] = _BlockSums(x, block, need_var)
+        n, s1, s2, shift = sums[block].window(w)
+        low = n < max(mp[w], 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if "count" in stats:
+                out["count", w] = n
+            if "sum" in stats:
+                # pandas: sum of an all-NaN window that meets min_periods (0) is 0
+                out["sum", w] = np.where(n < mp[w], np.nan, s1 + n * shift)
+            if "mean" in stats:
+                out["mean", w] = np.where(low, np.nan, s1 / n + shift)
+            if need_var:
+                v = (s2 - s1 * s1 / n) / (n - ddof)
+                v[flat[w]] = 0.0                            # constant window: exactly 0, as pandas
+                v = np.where(low | (n <= ddof), np.nan, np.maximum(v, 0.0))
+                if "var" in stats:
+                    out["var", w] = v
+                if "std" in stats:
+                    out["std", w] = np.sqrt(v)
+    return out
+
+
+def _extrema(x: np.ndarray, windows, stat: str) -> Dict[Tuple[str, int], np.ndarray]:
+    # unmasked: windows without valid values hold -inf (max) / +inf (min)
+    fn, fill = (np.maximum, -np.inf) if stat == "max" else (np.minimum, np.inf)
+    top = max(windows)
+    pad = [(0, 0)] * (x.ndim - 1) + [(top - 1, 0)]
+    # level p: extremum over the trailing p points; the front padding makes every window full
+    level = {1: np.pad(np.where(np.isnan(x), fill, x), pad, constant_values=fill)}
+    p = 1
+    while 2 * p <= top:
+        a = level[p]
+        b = a.copy()
+        fn(a[..., p:], a[..., :-p], out=b[..., p:])
+        level[2 * p] = b
+        p *= 2
+    out = {}
+    for w in windows:
+        p = 1 << (w.bit_length() - 1)
+        a = level[p][..., top - 1:]
+        r = a.copy()
+        if w > p:
+            # [i - w + 1, i] = [i - w + 1, i - w + p] U [i - p + 1, i]
+            r = fn(a, level[p][..., top - 1 - (w - p):level[p].shape[-1] - (w - p)])
+        out[stat, w] = r
+    return out
+
+
+def _median(x: np.ndarray, window: int, cnt: np.ndarray, low: np.ndarray) -> np.ndarray:
+    pad = [(0, 0)] * (x.ndim - 1) + [(window - 1, 0)]
+    view = np.lib.stride_tricks.sliding_window_view(np.pad(x, pad, constant_values=np.nan), window, axis=-1)
+    n = x.shape[-1]
+    c = np.maximum(cnt.astype(np.int64), 1)[..., None]
+    out = np.empty(x.shape)
+    block = max(1, MEDIAN_BLOCK_ELEMENTS // (window * max(1, x.size // max(n, 1))))
+    for s in range(0, n, block):
+        srt = np.sort(view[..., s:s + block, :], axis=-1)          # NaNs sort last
+        cs = c[..., s:s + block, :]
+        lo = np.take_along_axis(srt, (cs - 1) // 2, axis=-1)[..., 0]
+        hi = np.take_along_axis(srt, cs // 2, axis=-1)[..., 0]
+        out[..., s:s + block] = 0.5 * (lo + hi)
+    out[low] = np.nan
+    return out
+
+
+def rolling_stats(
+    x: np.ndarray,
+    windows: Iterable[int],
+    stats: Iterable[str] = ("mean", "std"),
+    min_periods: MinPeriods = None,
+    ddof: int = 1,
+) -> Dict[Tuple[str, int], np.ndarray]:
+    """
+    {(stat, window): array} for every requested stat and window, same shape as x.
+
+    `stats` from STATS; `min_periods` is an int, None (= window) or a callable
+    window -> int, e.g. `lambda w: max(1, w // 2)` as in the feature notebook.
+    """
+    x = np.asarray(x, dtype=float)
+    windows = sorted({int(w) for w in windows})
+    stats = tuple(stats)
+    unknown = set(stats) - set(STATS)
+    if unknown:
+        raise ValueError(f"Unknown rolling stats: {sorted(unknown)} (choose from {STATS})")
+    if not windows or windows[0] < 1:
+        raise ValueError("windows must be positive")
+    mp = {w: min_periods_for(w, min_periods) for w in windows}
+
+    need_var = "var" in stats or "std" in stats
+    extrema: Dict[Tuple[str, int], np.ndarray] = {}
+    for stat in EXTREMA_STATS:
+        if stat in stats or need_var:
+            extrema.update(_extrema(x, windows, stat))
+    flat = {w: extrema["max", w] == extrema["min", w] for w in windows} if need_var else {}
+
+    moments = [s for s in stats if s in MOMENT_STATS]
+    out = _moments(x, windows, moments + ["count"], mp, ddof, flat)
+    low = {w: out["count", w] < max(mp[w], 1) for w in windows}
+    for stat in EXTREMA_STATS:
+        if stat in stats:
+            for w in windows:
+                r = extrema[stat, w]
+                r[low[w]] = np.nan
+                out[stat, w] = r
+    if "median" in stats:
+        for w in windows:
+            out["median", w] = _median(x, w, out["count", w], low[w])
+    if "count" in stats:
+        for w in windows:
+            # pandas applies min_periods of count() to the rows seen, not the valid values
+            out["count", w][..., :max(mp[w] - 1, 0)] = np.nan
+    return {(s, w): out[s, w] for s in stats for w in windows}
+
+
+def rolling_mean(x: np.ndarray, window: int, min_periods: MinPeriods = None) -> np.ndarray:
+    return rolling_stats(x, [window], ["mean"], min_periods)["mean", window]
+
+
+def rolling_std(x: np.ndarray, window: int, min_periods: MinPeriods = None, ddof: int = 1) -> np.ndarray:
+    return rolling_stats(x, [window], ["std"], min_periods, ddof)["std", window]
+
+
+def rolling_min(x: np.ndarray, window: int, min_periods: MinPeriods = None) -> np.ndarray:
+    return rolling_stats(x, [window], ["min"], min_periods)["min", window]
+
+
+def rolling_max(x: np.ndarray, window: int, min_periods: MinPeriods = None) -> np.ndarray:
+    return rolling_stats(x, [window], ["max"], min_periods)["max", window]
+
+
+def rolling_median(x: np.ndarray, window: int, min_periods: MinPeriods = None) -> np.ndarray:
+    return rolling_stats(x, [window], ["median"], min_periods)["median", window]
+
+
+def rolling_local(
+    xh: np.ndarray, window: int, std: bool = False, min_periods: MinPeriods = None, ddof: int = 1
+) -> np.ndarray:
+    """
+    Rolling mean (or std) whose every value depends only on its own window.
+
+    `xh` carries window - 1 rows of left context (NaN before the series start) and one
+    value is returned per row of xh[..., window - 1:]. Sums run over explicit offsets
+    (O(n * window)), so chunked runs reproduce single-shot ones bit for bit.
+    """
+    m = xh.shape[-1] - window + 1
+    valid = ~np.isnan(xh)
+    x0 = np.where(valid, xh, 0.0)
+    cnt = np.zeros(xh.shape[:-1] + (m,))
+    s = np.zeros_like(cnt)
+    for j in range(window):
+        cnt += valid[..., j:j + m]
+        s += x0[..., j:j + m]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = s / cnt
+        if std:
+            ss = np.zeros_like(cnt)
+            for j in range(window):
+                d = np.where(valid[..., j:j + m], xh[..., j:j + m] - out, 0.0)
+                ss += d * d
+            out = np.sqrt(ss / (cnt - ddof))
+    out[cnt < max(min_periods_for(window, min_periods), 1)] = np.nan
+    if std:
+        out[cnt <= ddof] = np.nan
+    return out
+
+
+def rolling_aligned(
+    xh: np.ndarray, window: int, std: bool = False, min_periods: MinPeriods = None, ddof: int = 1
+) -> np.ndarray:
+    """
+    rolling_local in O(n): prefix sums restarted every sum_block(window) rows.
+
+    xh[..., 0] must sit at an absolute row that is a multiple of the block, and its first
+    block is context only: one value per row of xh[..., block:]. Sums are taken relative
+    to each block's first value and restart at absolute block boundaries, so a row depends
+    only on its own block and the previous one, never on where the chunk was cut:
+    chunked runs reproduce single-shot ones bit for bit (but not rolling_local's floats).
+    """
+    block = sum_block(window)
+    n, s1, s2, shift = _BlockSums(np.asarray(xh, dtype=float), block, std, shift="first").window(window)
+    n, s1, shift = n[..., block:], s1[..., block:], shift[..., block:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if std:
+            s2 = s2[..., block:]
+            out = np.sqrt(np.maximum((s2 - s1 * s1 / n) / (n - ddof), 0.0))
+            out[n <= ddof] = np.nan
+        else:
+            out = s1 / n + shift
+    out[n < max(min_periods_for(window, min_periods), 1)] = np.nan
+    return out
@@ -0,0 +1,283 @@
+"""
+schema.py - compact storage schema for simulator timeseries (opt-in).
+
+The full frame keeps every column as the simulator produced it: float64 tags, int64
+flags, str labels, constants repeated on every row. compact_frame() maps it to:
+
+- str / object labels            -> category (int8 codes)
+- constant columns, regular time -> schema metadata (not stored per row)
+- 0/1 and small-range int flags  -> int8
+- low-cardinality float columns  -> category of float64 values (lossless: setpoint
+  steps, dilution factors, UF capacity levels, playbook scores)
+- remaining floats               -> float32 (~7 significant digits, finer than any
+  process tag's resolution), except columns listed in keep_float64
+
+restore_frame() inverts the mapping back to the original columns, order and dtypes,
+so code written against the full frame runs unchanged. write_timeseries() /
+read_timeseries() carry the schema in the parquet key-value metadata; the reader
+returns full frames for both layouts. Files are written once, with row groups aligned
+to days (TimeseriesWriter: chunk by chunk, for streamed runs), and link_latest() points
+the "latest" alias at the versioned artifact.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SCHEMA_KEY = "tws.schema"
+TIME_COLUMN = "timestamp"
+MAX_FLOAT_CATEGORIES = 127      # int8 codes
+MIN_GROUP_ROWS = 1440           # row-group floor: one day at 1 min, five days at 5 min
+COMPACT_MIN_GROUP_ROWS = 2880   # compact files: per-column-chunk overhead is a large share of their size
+COMPACT_ZSTD_LEVEL = 9          # written once, read many times
+
+
+def _is_label(s: pd.Series) -> bool:
+    return pd.api.types.is_string_dtype(s.dtype) or s.dtype == object
+
+
+def _scalar(v):
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def compact_frame(df: pd.DataFrame, keep_float64: Iterable[str] = (), keep_time: bool = False) -> pd.DataFrame:
+    """
+    Compact copy of df; the restore schema travels in .attrs[SCHEMA_KEY].
+
+    keep_time=True stores a regular timestamp column anyway (needed for time filters).
+    """
+    keep_float64 = set(keep_float64)
+    meta = {
+        "columns": list(df.columns),
+        "dtypes": {col: str(dt) for col, dt in df.dtypes.items()},
+        "n": len(df),
+        "constants": {},
+        "time": None,
+    }
+    out = {}
+    for col in df.columns:
+        s = df[col]
+
+        if col == TIME_COLUMN and not keep_time and pd.api.types.is_datetime64_dtype(s.dtype) and len(s) > 1:
+            step = np.diff(s.to_numpy().astype(np.int64))
+            if (step == step[0]).all():
+                meta["time"] = {"start": str(s.iloc[0]), "step": str(s.iloc[1] - s.iloc[0])}
+                continue
+
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            out[col] = s
+            continue
+        if _is_label(s):
+            out[col] = s.astype("category")
+            continue
+
+        if len(s) and pd.api.types.is_numeric_dtype(s.dtype) and s.notna().all() and (s == s.iloc[0]).all():
+            meta["constants"][col] = _scalar(s.iloc[0])
+            continue
+
+        if pd.api.types.is_integer_dtype(s.dtype) or pd.api.types.is_bool_dtype(s.dtype):
+            if s.min() >= np.iinfo(np.int8).min and s.max() <= np.iinfo(np.int8).max:
+                out[col] = s.astype(np.int8)
+            else:
+                out[col] = s
+        elif pd.api.types.is_float_dtype(s.dtype) and col not in keep_float64:
+            if s.nunique() <= MAX_FLOAT_CATEGORIES:
+                out[col] = s.astype("category")
+            else:
+                out[col] = s.astype(np.float32)
+        else:
+            out[col] = s
+
+    compact = pd.DataFrame(out, index=pd.RangeIndex(len(df)))
+    compact.attrs[SCHEMA_KEY] = meta
+    return compact
+
+
+def restore_frame(df: pd.DataFrame, meta: Optional[dict] = None) -> pd.DataFrame:
+    """Full frame (original columns, order and dtypes) from a compact_frame() result."""
+    meta = meta if meta is not None else df.attrs.get(SCHEMA_KEY)
+    if meta is None:
+        return df
+    n = len(df) if len(df.columns) else meta["n"]
+    dtypes = meta["dtypes"]
+    cols = {}
+    for col in meta["columns"]:
+        dtype = dtypes[col]
+        if col in meta["constants"]:
+            cols[col] = np.full(n, meta["constants"][col], dtype=dtype)
+        elif meta["time"] is not None and col == TIME_COLUMN:
+            t0 = pd.Timestamp(meta["time"]["start"])
+            cols[col] = (t0 + pd.Timedelta(meta["time"]["step"]) * np.arange(n)).astype(dtype)
+        elif str(df[col].dtype) == dtype:
+            cols[col] = df[col]
+        else:
+            cols[col] = df[col].astype(dtype)
+    return pd.DataFrame(cols, index=pd.RangeIndex(n))
+
+
+def _row_group_bounds(df: pd.DataFrame, min_rows: int) -> list[int]:
+    # row offsets of row groups made of whole calendar days, each >= min_rows (but the last)
+    n = len(df)
+    if TIME_COLUMN not in df.columns or not pd.api.types.is_datetime64_dtype(df[TIME_COLUMN].dtype) or n == 0:
+        return [0, n]
+    day = df[TIME_COLUMN].to_numpy().astype("datetime64[D]")
+    bounds = [0]
+    for start in (np.flatnonzero(day[1:] != day[:-1]) + 1).tolist():
+        if start - bounds[-1] >= min_rows:
+            bounds.append(start)
+    if bounds[-1] < n:
+        bounds.append(n)
+    return bounds
+
+
+def write_timeseries(
+    df: pd.DataFrame, path: Path, compact: bool = False, min_group_rows: Optional[int] = None
+) -> Path:
+    """
+    Write a simulator frame to parquet in one pass, with row groups aligned to days.
+
+    A row group holds whole calendar days and at least min_group_rows rows (default:
+    MIN_GROUP_ROWS, one day at 1-min resolution / 5 days at 5 min; COMPACT_MIN_GROUP_ROWS
+    for compact files, 10 days at 5 min). Row-group min/max statistics (timestamp,
+    Regime, ...) let readers skip groups with read_timeseries(path, filters=...).
+    compact=True stores the compact schema; the timestamp column is kept there too
+    (delta-encoded), so time filters still prune row groups.
+    """
+    path = Path(path)
+    if min_group_rows is None:
+        min_group_rows = COMPACT_MIN_GROUP_ROWS if compact else MIN_GROUP_ROWS
+    if compact:
+        frame = compact_frame(df, keep_time=True)
+        meta = frame.attrs[SCHEMA_KEY]
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        # labels as plain strings: parquet dictionary-encodes them anyway, and plain
+        # string statistics are what row-group pruning on e.g. Regime compares against
+        for i, field in enumerate(table.schema):
+            if (pa.types.is_dictionary(field.type) and meta["dtypes"][field.name] != "category"
+                    and (pa.types.is_string(field.type.value_type) or pa.types.is_large_string(field.type.value_type))):
+                table = table.set_column(i, field.name, table[field.name].cast(field.type.value_type))
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), SCHEMA_KEY.encode(): json.dumps(meta).encode()}
+        )
+        # dictionary pages would take precedence over byte-stream-split on float columns
+        floats = [f.name for f in table.schema if pa.types.is_floating(f.type)]
+        others = [f.name for f in table.schema if f.name not in floats and f.name != TIME_COLUMN]
+        opts = dict(
+            compression="zstd",
+            compression_level=COMPACT_ZSTD_LEVEL,
+            use_dictionary=others or False,
+            use_byte_stream_split=floats or False,
+            column_encoding={TIME_COLUMN: "DELTA_BINARY_PACKED"} if TIME_COLUMN in table.schema.names else None,
+        )
+    else:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        opts = {}
+
+    bounds = _row_group_bounds(df, min_group_rows)
+    with pq.ParquetWriter(path, table.schema, write_statistics=True, **opts) as writer:
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            writer.write_table(table.slice(a, b - a), row_group_size=max(b - a, 1))
+    return path
+
+
+class TimeseriesWriter:
+    """
+    Append consecutive chunks of one simulator frame to a parquet file (full layout).
+
+    For runs too long to hold in memory (simulate_stream): each write() adds a chunk;
+    row groups are cut as in write_timeseries() (whole days, >= min_group_rows), so at
+    most one open row group plus one chunk is buffered. The schema is the first chunk's.
+
+        with TimeseriesWriter(path) as out:
+            for chunk in simulate_stream(cfg):
+                out.write(chunk)
+    """
+
+    def __init__(self, path: Path, min_group_rows: int = MIN_GROUP_ROWS):
+        self.path, self.min_group_rows = Path(path), min_group_rows
+        self.writer: Optional[pq.ParquetWriter] = None
+        self.pending: Optional[pd.DataFrame] = None
+        self.rows = 0
+
+    def write(self, df: pd.DataFrame) -> None:
+        frame = df if self.pending is None else pd.concat([self.pending, df], ignore_index=True)
+        bounds = _row_group_bounds(frame, self.min_group_rows)
+        # the last group may continue in the next chunk
+        self._flush(frame, bounds[:-1])
+        self.pending = frame.iloc[bounds[-2]:].reset_index(drop=True)
+
+    def _flush(self, frame: pd.DataFrame, bounds: list[int]) -> None:
+        if len(bounds) < 2:
+            return
+        table = pa.Table.from_pandas(frame.iloc[:bounds[-1]], preserve_index=False,
+                                     schema=self.writer.schema if self.writer else None)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema, write_statistics=True)
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            self.writer.write_table(table.slice(a, b - a), row_group_size=max(b - a, 1))
+        self.rows += bounds[-1]
+
+    def close(self) -> Path:
+        if self.pending is not None and len(self.pending):
+            self._flush(self.pending, [0, len(self.pending)])
+            self.pending = None
+        if self.writer is not None:
+            self.writer.close()
+        return self.path
+
+    def __enter__(self) -> "TimeseriesWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def link_latest(target: Path, alias: Path) -> Path:
+    """
+    Point `alias` (e.g. thickener_timeseries.parquet) at an already written artifact:
+    relative symlink, else hard link, else a copy (filesystems without links).
+    """
+    target, alias = Path(target), Path(alias)
+    if alias.is_symlink() or alias.exists():
+        alias.unlink()
+    try:
+        alias.symlink_to(os.path.relpath(target, alias.parent))
+    except OSError:
+        try:
+            os.link(target, alias)
+        except OSError:
+            shutil.copyfile(target, alias)
+    return alias
+
+
+def read_timeseries(path: Path, columns: Optional[list] = None, filters=None) -> pd.DataFrame:
+    """
+    Read a simulator parquet file (full or compact layout) as a full frame.
+
+    `filters` are pyarrow row filters, e.g. [("timestamp", ">=", t0), ("Regime", "==", "UF")];
+    row groups whose statistics exclude them are not read.
+    """
+    schema_meta = pq.read_schema(path).metadata or {}
+    raw = schema_meta.get(SCHEMA_KEY.encode())
+    if raw is None:
+        return pd.read_parquet(path, columns=columns, filters=filters)
+
+    meta = json.loads(raw)
+    if filters is not None and meta["time"] is not None:
+        raise ValueError("row filters need a stored timestamp column (written by write_timeseries)")
+    if columns is not None:
+        stored = [c for c in columns if c not in meta["constants"] and not (meta["time"] and c == TIME_COLUMN)]
+        meta = {**meta, "columns": list(columns)}
+        df = pd.read_parquet(path, columns=stored, filters=filters)
+    else:
+        df = pd.read_parquet(path, filters=filters)
+    return restore_frame(df, meta)
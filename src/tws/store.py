@@ -0,0 +1,213 @@
+"""
+store.py - day-partitioned feature store: append new timeseries rows, compute only new days.
+
+thickener_features.parquet is rebuilt from the whole timeseries every time rows are
+added. FeatureStore keeps the features instead as one parquet file per calendar day
+
+    <root>/day=YYYY-MM-DD/part-0.parquet     timestamp, features (float32), TARGET_COLS
+    <root>/_manifest.json                    names, warmup, origin, step, medians, days
+
+and update(ts) computes only the rows after the last update, from a left halo of
+earlier timeseries rows (FeaturePlan.chunk_start: the longest window / lag, 24 h for
+the 24 h windows, rounded down to the rolling-sum block). The halo makes the new rows
+equal to a full rebuild value for value; the rolling-sum block that held the previous
+last row is recomputed with it (its prefix sums now include the new rows), so the days
+it overlaps are rewritten too (at most ~4 days at 5 min). Forward-filling continues
+from the last stored row; the first build back-fills its leading gaps, as the notebook.
+
+Row numbers count from the first timeseries row (`origin`): the store holds rows from
+`warmup` on, exactly as thickener_features.parquet, and export() writes that file.
+Frozen at creation, so later appends stay comparable: the feature names, warmup and
+the series medians used as gap fills (pH_off_spec). A feature whose column was all NaN
+at creation is not back-filled later (a full rebuild would).
+
+read() opens one file per day (a full year is 365 small files); read(since=...) only the
+days it needs. The manifest is written after the partitions, atomically: an interrupted update
+leaves the previous manifest and is redone by the next one.
+
+    store = FeatureStore(Path("data/processed/feature_store"), names=catalogs["FEATURES_ALL"])
+    written = store.update(read_timeseries(path))      # days written
+    feat = store.read()
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from tws.features import (
+    STEP_MIN, TARGET_COLS, TIME_COLUMN, WARMUP, FeaturePlan, _time_index, compile_plan, compute_features, fill_gaps,
+    plan_for, series_medians,
+)
+
+MANIFEST = "_manifest.json"         # leading "_": not a data file for pyarrow datasets
+PARTITION = "day"
+
+
+class FeatureStore:
+    """
+    Features `names` (default: every feature of the notebook's spec) of one timeseries,
+    stored by day under `root`. An existing store keeps its own names and warmup.
+    """
+
+    def __init__(self, root: Path, names: Optional[Sequence[str]] = None, warmup: int = WARMUP):
+        self.root = Path(root)
+        path = self.root / MANIFEST
+        if path.exists():
+            self.manifest = json.loads(path.read_text(encoding="utf-8"))
+            if names is not None and list(names) != self.manifest["names"]:
+                raise ValueError(f"{self.root} stores other features; use a new root for {len(names)} names")
+        else:
+            self.manifest = {
+                "names": list(names) if names is not None else compile_plan().names,
+                "warmup": int(warmup), "origin": None, "step_s": None, "medians": {}, "end": None, "days": {},
+            }
+        self.names: List[str] = self.manifest["names"]
+        self.warmup: int = self.manifest["warmup"]
+        self.plan: FeaturePlan = plan_for(self.names, STEP_MIN)
+
+    @property
+    def end(self) -> Optional[int]:
+        """Row after the last stored row (None while empty)."""
+        return self.manifest["end"]
+
+    def _row(self, t) -> np.ndarray:
+        # row numbers of timestamps t (from the first timeseries row)
+        off = (pd.DatetimeIndex(t) - pd.Timestamp(self.manifest["origin"])).to_numpy().astype("timedelta64[s]")
+        step = np.timedelta64(self.manifest["step_s"], "s")
+        if (off % step).any():
+            raise ValueError(f"timestamps off the {self.manifest['step_s']} s grid of {self.root}")
+        return (off // step).astype(np.int64)
+
+    def _time(self, row: int) -> pd.Timestamp:
+        return pd.Timestamp(self.manifest["origin"]) + pd.Timedelta(seconds=self.manifest["step_s"] * int(row))
+
+    def _first_row(self) -> int:
+        # first row update() writes: the start of the day holding the rolling-sum block of the last row
+        if self.end is None:
+            return self.warmup
+        redo = self.end // self.plan.block() * self.plan.block()
+        return max(self.warmup, int(self._row([self._time(redo).normalize()])[0]))
+
+    def halo_start(self) -> Optional[pd.Timestamp]:
+        """Earliest timestamp the next update() reads (None: the whole series, first build)."""
+        if self.end is None:
+            return None
+        return self._time(self.plan.chunk_start(self._first_row() - 1))
+
+    def update(self, ts: pd.DataFrame) -> List[str]:
+        """
+        Add the rows of ts after the stored ones; returns the days written. ts is the
+        timeseries from halo_start() on (or all of it), regular and in time order, with
+        the timestamp, the plan's input tags and (if stored) TARGET_COLS.
+        """
+        t = _time_index(ts)
+        if self.end is None:
+            if len(t) < 2:
+                raise ValueError("the first build needs at least two rows (the time step)")
+            self.manifest["origin"] = t[0].isoformat()
+            self.manifest["step_s"] = int((t[1] - t[0]).total_seconds())
+            self.manifest["medians"] = series_medians(ts, self.plan)
+        rows = self._row(t)
+        if len(rows) and (np.diff(rows) != 1).any():
+            raise ValueError("ts must be regular (one row per time step, no gaps) and in time order")
+        end = int(rows[-1]) + 1 if len(rows) else 0
+        if end <= (self.end or self.warmup):
+            return []
+
+        first = self._first_row()
+        carry = first > self.warmup                 # ffill from the stored row before `first`
+        lo = self.plan.chunk_start(first - carry)
+        if rows[0] > lo:
+            raise ValueError(f"ts starts at {t[0]}, the update needs rows from {self._time(lo)} on (halo_start())")
+        chunk = ts.iloc[lo - rows[0]:]
+        X = compute_features(chunk, self.plan, first - carry - lo, np.float32, self.manifest["medians"])
+        if carry:
+            X[0] = self._last_stored(first)
+        X = fill_gaps(X)[int(carry):]
+
+        frame = pd.DataFrame(X, columns=self.names, copy=False)
+        frame.insert(0, TIME_COLUMN, t[first - rows[0]:])
+        for col in TARGET_COLS:
+            if col in chunk.columns:
+                frame[col] = chunk[col].to_numpy()[first - lo:]
+        written = self._write_days(frame)
+        self.manifest["end"] = end
+        self._write_manifest()
+        return written
+
+    def _last_stored(self, row: int) -> np.ndarray:
+        # stored feature values of row - 1 (the last row of the previous stored day)
+        day = self._time(row - 1).strftime("%Y-%m-%d")
+        prev = pq.read_table(self._day_path(day), columns=self.names)
+        return prev.slice(prev.num_rows - 1).to_pandas().to_numpy(dtype=np.float32)[0]
+
+    def _day_path(self, day: str) -> Path:
+        return self.root / f"{PARTITION}={day}" / "part-0.parquet"
+
+    def _write_days(self, frame: pd.DataFrame) -> List[str]:
+        days = frame[TIME_COLUMN].dt.strftime("%Y-%m-%d").to_numpy()
+        cuts = np.flatnonzero(days[1:] != days[:-1]) + 1
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        written = []
+        for a, b in zip(np.r_[0, cuts], np.r_[cuts, len(frame)]):
+            day = days[a]
+            path = self._day_path(day)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            pq.write_table(table.slice(a, b - a), path)
+            self.manifest["days"][day] = int(b - a)
+            written.append(day)
+        return written
+
+    def _write_manifest(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, indent=1)
+            os.replace(tmp, self.root / MANIFEST)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def read(self, columns: Optional[Sequence[str]] = None, since=None) -> pd.DataFrame:
+        """
+        The stored rows (timestamp, features, targets; or `columns`), in time order;
+        `since` keeps rows from that timestamp on, reading only the days it needs.
+        """
+        if self.end is None:
+            raise FileNotFoundError(f"No feature store at {self.root}")
+        dataset = ds.dataset(self.root, format="parquet", partitioning="hive")
+        columns = list(columns) if columns is not None else [n for n in dataset.schema.names if n != PARTITION]
+        flt = None
+        if since is not None:
+            since = pd.Timestamp(since)
+            flt = (ds.field(PARTITION) >= since.strftime("%Y-%m-%d")) & (ds.field(TIME_COLUMN) >= since)
+        df = dataset.to_table(columns=columns, filter=flt).to_pandas()
+        if TIME_COLUMN in df.columns and not df[TIME_COLUMN].is_monotonic_increasing:
+            df = df.sort_values(TIME_COLUMN, ignore_index=True)
+        return df
+
+    def export(self, path: Path) -> pd.DataFrame:
+        """Write the stored rows as thickener_features.parquet; returns them."""
+        feat = self.read()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        feat.to_parquet(path, index=False)
+        return feat
+
+    def info(self) -> Dict[str, object]:
+        m = self.manifest
+        days = sorted(m["days"])
+        return {"features": len(self.names), "warmup": self.warmup, "rows": sum(m["days"].values()),
+                "days": len(days), "first_day": days[0] if days else None, "last_day": days[-1] if days else None,
+                "medians": m["medians"]}
@@ -0,0 +1,40 @@
+"""Feature names that cannot be materialized fail with a ValueError naming them."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from tws.features import TIME_COLUMN, materialize, parse_feature  # noqa: E402
+
+
+@pytest.fixture
+def ts():
+    n = 600
+    return pd.DataFrame({
+        TIME_COLUMN: pd.date_range("2024-01-01", periods=n, freq="5min"),
+        "pH_feed": np.linspace(7.0, 9.0, n),
+        "event_type": ["NONE"] * n,
+    })
+
+
+@pytest.mark.parametrize("name", ["pH_feed__lag_0", "pH_feed__d0", "pH_feed__rmean_0m", "pH_feed__bogus"])
+def test_parse_feature_rejects(name):
+    with pytest.raises(ValueError, match=name):
+        parse_feature(name)
+
+
+@pytest.mark.parametrize("name", ["nope", "nope__rmean_1h", "event_type"])
+def test_materialize_names_the_bad_feature(ts, name):
+    with pytest.raises(ValueError, match=name):
+        materialize(ts, ["pH_feed__lag_1", name], start=0)
+
+
+def test_materialize_known_names(ts):
+    out = materialize(ts, ["pH_feed", "pH_feed__lag_1", "pH_feed__rmean_1h"], start=0)
+    assert list(out.columns) == ["pH_feed", "pH_feed__lag_1", "pH_feed__rmean_1h"]
+    assert out["pH_feed__lag_1"].iloc[1] == np.float32(ts["pH_feed"].iloc[0])
@@ -0,0 +1,38 @@
+"""Time blocks of compute_features_parallel (halo + stitching) against one compute_features pass."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from simulate_fixed import SimConfig, simulate_clean  # noqa: E402
+from tws.features import compile_plan, compute_features, compute_features_parallel, plan_for, time_blocks  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def ts():
+    df, _ = simulate_clean(SimConfig(days=20))
+    rng = np.random.default_rng(3)
+    for tag in ("Overflow_Turb_NTU", "pH_feed", "Qu_m3h"):
+        df.loc[rng.choice(len(df), 200, replace=False), tag] = np.nan
+    return df
+
+
+@pytest.mark.parametrize("block_rows", [1000, 2500, 5000])
+@pytest.mark.parametrize("start", [0, 288])
+def test_blocks_equal_serial(ts, block_rows, start):
+    plan = compile_plan()
+    assert len(time_blocks(len(ts), plan, start, block_rows)) > 1
+    serial = compute_features(ts, plan, start)
+    blocks = compute_features_parallel(ts, plan, start, max_workers=2, block_rows=block_rows)
+    assert np.array_equal(blocks, serial, equal_nan=True)
+
+
+def test_blocks_catalog_plan(ts):
+    plan = plan_for(["Overflow_Turb_NTU__rstd_24h", "pH_off_spec", "BedLevel_m__lag_12", "Qu_m3h__accel"])
+    serial = compute_features(ts, plan, 288, np.float64)
+    blocks = compute_features_parallel(ts, plan, 288, np.float64, max_workers=1, block_rows=700)
+    assert np.array_equal(blocks, serial, equal_nan=True)
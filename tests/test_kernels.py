@@ -0,0 +1,42 @@
+"""tws.kernels against the scalar loops they replace."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from tws.kernels import clipped_cumsum, clipped_cumsum_units  # noqa: E402
+
+
+def _loop(y0, terms, lo, hi):
+    y, out = float(y0), []
+    for i in range(len(terms[0])):
+        for t in terms:
+            y = y + t[i]
+        y = min(max(y, lo), hi)
+        out.append(y)
+    return np.array(out)
+
+
+@pytest.mark.parametrize("drift", [0.0, 0.02, -0.02])
+def test_clipped_cumsum_bit_identical(drift):
+    rng = np.random.default_rng(11)
+    n = 20000
+    # long pinned stretches at both bounds (drift) and free ones in between
+    terms = [rng.normal(drift, 0.1, n), -np.abs(rng.normal(0.0, 0.05, n)), rng.normal(0.0, 1e-3, n)]
+    got = clipped_cumsum(1.0, terms, 0.5, 3.5)
+    assert np.array_equal(got, _loop(1.0, terms, 0.5, 3.5))
+    assert np.array_equal(clipped_cumsum(1.0, terms[0], 0.5, 3.5), _loop(1.0, terms[:1], 0.5, 3.5))
+
+
+@pytest.mark.parametrize("K", [2, 6])
+def test_clipped_cumsum_units_bit_identical(K):
+    rng = np.random.default_rng(K)
+    y0 = rng.uniform(0.5, 3.5, K)
+    terms = [rng.normal(0.01, 0.1, (K, 5000)), rng.normal(-0.01, 0.1, (K, 5000))]
+    got = clipped_cumsum_units(y0, terms, 0.5, 3.5)
+    for k in range(K):
+        assert np.array_equal(got[k], _loop(y0[k], [t[k] for t in terms], 0.5, 3.5))
@@ -0,0 +1,27 @@
+"""Stage-cache reruns of simulate_fixed at the default (threaded-noise) length."""
+
+import sys
+from dataclasses import replace
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from simulate_fixed import SimConfig, simulate_clean  # noqa: E402
+
+
+def test_cached_rerun_equals_uncached(tmp_path):
+    cfg = SimConfig()
+    first, _ = simulate_clean(cfg, cache_dir=tmp_path)
+    again, _ = simulate_clean(cfg, cache_dir=tmp_path)          # every stage cached: no noise to draw
+    pd.testing.assert_frame_equal(first, again)
+
+
+def test_labels_only_change_hits_cache(tmp_path):
+    cfg = SimConfig()
+    simulate_clean(cfg, cache_dir=tmp_path)
+    changed = replace(cfg, event_type_override_th_uf=0.6)
+    cached, _ = simulate_clean(changed, cache_dir=tmp_path)
+    fresh, _ = simulate_clean(changed)
+    pd.testing.assert_frame_equal(cached, fresh)
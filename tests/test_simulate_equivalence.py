@@ -0,0 +1,62 @@
+"""The simulate_fixed entry points that must reproduce simulate_clean exactly, on a short horizon."""
+
+import sys
+from dataclasses import replace
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from simulate_fixed import (  # noqa: E402
+    SimConfig, min_chunk_rows, resume, simulate_clean, simulate_fleet, simulate_stream,
+)
+
+DAYS = 20           # reaches the first clay campaign (day 15)
+
+
+@pytest.mark.parametrize("chunk_points", [None, 500, 1001])
+@pytest.mark.parametrize("norm_mode", ["exact", "running"])
+@pytest.mark.filterwarnings("ignore:norm_warmup_days")
+def test_stream_equals_clean(chunk_points, norm_mode):
+    cfg = SimConfig(days=DAYS, norm_mode=norm_mode, norm_warmup_days=5)
+    ref, _ = simulate_clean(cfg)
+    got = pd.concat(simulate_stream(cfg, chunk_points), ignore_index=True)
+    pd.testing.assert_frame_equal(got, ref)
+
+
+def test_stream_min_chunk():
+    cfg = SimConfig(days=2)
+    ref, _ = simulate_clean(cfg)
+    got = pd.concat(simulate_stream(cfg, min_chunk_rows(cfg)), ignore_index=True)
+    pd.testing.assert_frame_equal(got, ref)
+
+
+def test_fleet_unit_equals_solo():
+    cfgs = [SimConfig(days=DAYS, seed=s) for s in (7, 8, 9)]
+    cfgs[2] = replace(cfgs[2], deadband=0.35)
+    fleet, _ = simulate_fleet(cfgs)
+    for k, cfg in enumerate(cfgs):
+        solo, _ = simulate_clean(cfg)
+        unit = fleet[fleet["unit_id"] == k].drop(columns="unit_id").reset_index(drop=True)
+        pd.testing.assert_frame_equal(unit[solo.columns], solo)
+
+
+@pytest.mark.parametrize("start, stop", [(0, 400), (3000, 3500), (5000, None)])
+def test_resume_equals_slice(tmp_path, start, stop):
+    cfg = SimConfig(days=DAYS)
+    df, _ = simulate_clean(cfg, checkpoint_dir=tmp_path)
+    got = resume(cfg, tmp_path, start, stop)
+    assert got.index[0] <= start and got.index[-1] == (len(df) if stop is None else stop) - 1
+    pd.testing.assert_frame_equal(got, df.loc[got.index])
+
+
+def test_fixed_turb_scale_equals_calibrated():
+    cfg = SimConfig(days=DAYS)
+    ref, debug = simulate_clean(cfg)
+    fixed, fixed_debug = simulate_clean(replace(cfg, turb_scale=debug["scale"]))
+    pd.testing.assert_frame_equal(fixed, ref)
+    assert fixed_debug["scale_search_iters"] == 0
+    _, moved = simulate_clean(replace(cfg, turb_scale=debug["scale"], deadband=0.33))
+    assert moved["event_rate"] < debug["event_rate"] - cfg.target_tolerance
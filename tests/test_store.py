@@ -0,0 +1,47 @@
+"""FeatureStore appends against a full rebuild (feature_store.py --check)."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from feature_store import check_store  # noqa: E402
+from simulate_fixed import SimConfig, simulate_clean  # noqa: E402
+from tws.features import TIME_COLUMN  # noqa: E402
+from tws.store import FeatureStore  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def ts():
+    df, _ = simulate_clean(SimConfig(days=12))
+    return df
+
+
+def _append(store, ts, cut):
+    # only the rows the update needs, as feature_store.py reads them
+    part = ts.iloc[:cut]
+    since = store.halo_start()
+    return store.update(part if since is None else part[part[TIME_COLUMN] >= since])
+
+
+def test_appends_equal_rebuild(tmp_path, ts):
+    store = FeatureStore(tmp_path / "store")
+    # cut points off the day boundaries (288 rows), one inside the first day after the warmup
+    for cut in (500, 701, 1000, 1290, 2017, 2400, 3001, len(ts)):
+        assert _append(store, ts, cut)
+        assert store.end == cut
+        assert check_store(store, ts) == []
+    assert _append(store, ts, len(ts)) == []            # nothing new
+
+
+def test_reopened_store_appends(tmp_path, ts):
+    root = tmp_path / "store"
+    names = ["Overflow_Turb_NTU__rstd_24h", "pH_off_spec", "BedLevel_m__lag_12", "is_CLAY"]
+    _append(FeatureStore(root, names), ts, 1111)
+    store = FeatureStore(root)
+    assert store.names == names
+    _append(store, ts, 2900)
+    assert check_store(store, ts) == []
+    assert FeatureStore(root).info()["rows"] == 2900 - store.warmup